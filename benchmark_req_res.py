@@ -4,13 +4,17 @@ import time
 import uuid
 import random
 import string
-import statistics
+import itertools
 from pathlib import Path
 import sys
 import threading
 import os
 import ssl
 import logging
+import multiprocessing
+import queue
+import signal
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, Tuple
 
 # Ensure common module can be imported
@@ -22,10 +26,24 @@ try:
     from mqtt_utils import (
         create_mqtt_client as original_create_mqtt_client,
         publish_message,
+        PublishProfile,
+        PAYLOAD_CODECS,
+        CONTENT_TYPE_JSON,
         subscribe_to_topics,
+        attach_suback_tracker,
+        wait_for_suback,
+        get_tls_context,
+        remember_tls_session,
         disconnect_client as mqtt_utils_disconnect_client,  # Renamed to avoid collision
+        build_response_topic,
+        response_subscription_filter,
+        RESPONSE_MODE_PER_REQUEST,
+        RESPONSE_MODE_WILDCARD,
+        RESPONSE_SUBSCRIPTION_MODES,
         GLOBAL_SETTINGS as mqtt_global_settings
     )
+    from latency_histogram import LatencyHistogram
+    from log_utils import configure_logging, get_logger, set_log_level
     import paho.mqtt.client as mqtt
     from paho.mqtt.properties import Properties
     from paho.mqtt.packettypes import PacketTypes 
@@ -33,45 +51,95 @@ except ImportError as e:
     print(f"Failed to import from mqtt_utils or paho.mqtt: {e}")
     sys.exit(1)
 
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
+# Setup logging: shared log_utils facade with levels from settings.json, timestamped format
+configure_logging({**mqtt_global_settings.get("logging_settings", {}),
+                   "format": '%(asctime)s - %(levelname)s - %(message)s'}, force=True)
+logger = get_logger("benchmark")
 
 # --- Benchmark Configuration (Defaults) ---
 DEFAULT_NUM_REQUESTS = 100
 DEFAULT_REQ_PAYLOAD_SIZE = 128  # bytes
 DEFAULT_RES_PAYLOAD_SIZE = 128  # bytes
 DEFAULT_QOS = 1
+DEFAULT_PAYLOAD_POOL_SIZE = 64  # distinct pre-generated payload buffers per process
+PAYLOAD_KINDS = ("text", "incompressible", "compressible")
 DEFAULT_REQUEST_TOPIC = "benchmark/request"
 DEFAULT_RESPONSE_TOPIC_BASE = "benchmark/response/" 
 REQUEST_TIMEOUT_SECONDS = 50 
 INTER_REQUEST_DELAY_S = 0.0 
 SUBSCRIPTION_TIMEOUT = 10  # seconds to wait for SUBACK
+PIPELINE_SWEEP_INTERVAL_S = 0.1  # how often the pipelined sender looks for expired requests
+RTT_REPORT_PERCENTILES = (50.0, 90.0, 99.0, 99.9, 99.99)
+DEFAULT_SHARED_GROUP = "benchmark_responders"
+DEFAULT_PUBLISH_TOPIC = "benchmark/publish"
+PUBLISH_BENCH_USER_PROPERTIES = [("sensor_model", "VirtualThermo 2000"), ("location_grid", "A4")]
+PUBLISH_BENCH_CONTENT_TYPE = "application/json"
+REQUESTER_COUNTERS = ('successful_requests', 'timed_out_requests', 'publish_errors', 'subscribe_errors')
+DEFAULT_CONNECTIONS = 100
+DEFAULT_CONNECT_WORKERS = 32  # threads doing the blocking TCP connect + TLS handshake in the connect role
+DEFAULT_CONNECT_TOPIC_BASE = "benchmark/connect/"  # each connect-role client subscribes to <base><client_id>
+CONNACK_TIMEOUT_SECONDS = 15
+START_SIGNAL_SLACK_SECONDS = 30  # worker waits for the start signal this long beyond the slowest worker's setup
+CONNECT_PHASES = ("socket", "connack", "suback")  # socket = DNS + TCP connect + TLS handshake (up to on_socket_open)
 
 class RequesterState:
-    def __init__(self):
+    def __init__(self, client_id: Optional[str] = None):
         self.active_requests: Dict[str, Dict[str, Any]] = {}
-        self.rtt_values = []
+        self.latency = LatencyHistogram()  # Fixed-memory RTT distribution (replaces a per-request list)
         self.successful_requests = 0
         self.timed_out_requests = 0
         self.publish_errors = 0
         self.subscribe_errors = 0
-        self.client_id = f"benchmark_requester_{str(uuid.uuid4())[:8]}"
+        self.max_in_flight = 0
+        self.response_sub_mid: Optional[int] = None  # SUBSCRIBE mid of the wildcard response subscription
+        self.in_flight_slots: Optional[threading.BoundedSemaphore] = None  # Only used with --concurrency
+        self.payloads: Optional["PayloadPool"] = None  # Pre-generated request payloads, shared per process
+        self.client_id = client_id or f"benchmark_requester_{str(uuid.uuid4())[:8]}"
         self.connected_event = threading.Event()
         self.disconnected_event = threading.Event()
         self.lock = threading.RLock()  # Use RLock for nested locking
 
 class ResponderState:
-    def __init__(self):
-        self.client_id = f"benchmark_responder_{str(uuid.uuid4())[:8]}"
+    def __init__(self, client_id: Optional[str] = None):
+        self.client_id = client_id or f"benchmark_responder_{str(uuid.uuid4())[:8]}"
         self.processed_requests = 0
         self.publish_errors = 0
         self.connected_event = threading.Event()
         self.disconnected_event = threading.Event()
+        self.lock = threading.Lock()  # Counters are updated from worker threads with --responder_workers
+        self.workers: Optional[ThreadPoolExecutor] = None  # Handles requests off the network thread
+        self.payloads: Optional[PayloadPool] = None  # Pre-generated response payloads
+
+def generate_payload(size: int, kind: str = "text", rng: Optional[random.Random] = None) -> bytes:
+    """Generate one payload of `size` bytes.
+
+    text: random ASCII letters/digits (the historical payload); incompressible: random bytes;
+    compressible: a short random block repeated to the requested size.
+    """
+    rng = rng or random.Random()
+    if kind == "incompressible":
+        return rng.randbytes(size)
+    if kind == "compressible":
+        block = ''.join(rng.choices(string.ascii_letters + string.digits, k=min(size, 64))).encode('ascii')
+        return (block * (size // len(block) + 1))[:size]
+    return ''.join(rng.choices(string.ascii_letters + string.digits, k=size)).encode('ascii')
 
-def generate_payload(size: int) -> str:
-    """Generate random payload of specified size."""
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=size))
+class PayloadPool:
+    """Payload buffers generated once at startup and handed out round-robin.
+
+    The same bytes objects are reused (no copy per publish), so payload generation
+    cost stays out of the measured request path.
+    """
+    def __init__(self, size: int, kind: str = "text", count: int = DEFAULT_PAYLOAD_POOL_SIZE):
+        rng = random.Random()
+        self.size = size
+        self.kind = kind
+        self.content_type = "application/octet-stream" if kind == "incompressible" else "text/plain"
+        self.buffers: Tuple[bytes, ...] = tuple(generate_payload(size, kind, rng) for _ in range(count))
+        self._next = itertools.cycle(self.buffers).__next__  # C-level cycle: safe to call from several threads
+
+    def next(self) -> bytes:
+        return self._next()
 
 def safe_disconnect_client(client: Optional[mqtt.Client], reason_string: str = "Client shutting down normally") -> None:
     """Safely disconnect MQTT client with proper error handling."""
@@ -91,13 +159,13 @@ def safe_disconnect_client(client: Optional[mqtt.Client], reason_string: str = "
                 client.disconnect(properties=disconnect_props)
             except Exception as props_error:
                 # Fallback to simple disconnect for MQTTv3.1.1 compatibility
-                logger.warning(f"Properties disconnect failed, using simple disconnect: {props_error}")
+                logger.warning("Properties disconnect failed, using simple disconnect: %s", props_error)
                 client.disconnect()
         else:
             logger.debug("Client already disconnected")
             
     except Exception as e:
-        logger.warning(f"Error during disconnect: {e}")
+        logger.warning("Error during disconnect: %s", e)
 
 def create_benchmark_mqtt_client(
     client_id: str, 
@@ -105,11 +173,15 @@ def create_benchmark_mqtt_client(
     on_message_custom: Optional[callable], 
     on_disconnect_custom: Optional[callable], 
     userdata: Dict[str, Any], 
-    benchmark_args: argparse.Namespace
+    benchmark_args: argparse.Namespace,
+    instrument: Optional[callable] = None
 ) -> Optional[mqtt.Client]:
-    """Creates an MQTT client specifically for benchmark with proper error handling."""
+    """Creates an MQTT client specifically for benchmark with proper error handling.
+
+    instrument(client), if given, is called right before connect() (the connect role uses it for phase timing).
+    """
     
-    logger.info(f"Creating MQTT client: {client_id} with MQTTv5 protocol for benchmark")
+    logger.info("Creating MQTT client: %s with MQTTv5 protocol for benchmark", client_id)
     
     try:
         # Try new callback API first
@@ -125,21 +197,22 @@ def create_benchmark_mqtt_client(
             logger.warning("New callback API not available, using legacy API with MQTTv5")
             client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5, userdata=userdata)
     except Exception as e:
-        logger.error(f"Failed to create MQTT client: {e}")
+        logger.error("Failed to create MQTT client: %s", e)
         return None
 
     # Set up connection callback with error handling
     def _benchmark_on_connect(client_obj, user_data_obj, flags_dict, rc_int, props_obj=None):
         if rc_int == 0:
-            logger.info(f"Client {client_id}: Connected successfully (RC: {rc_int})")
+            logger.info("Client %s: Connected successfully (RC: %s)", client_id, rc_int)
+            remember_tls_session(client_obj)  # Cache the TLS session for the next connect (tickets arrive after the handshake)
         else:
-            logger.error(f"Client {client_id}: Connection failed (RC: {rc_int})")
+            logger.error("Client %s: Connection failed (RC: %s)", client_id, rc_int)
         
         if on_connect_custom:
             try:
                 on_connect_custom(client_obj, user_data_obj, flags_dict, rc_int, props_obj)
             except Exception as e:
-                logger.error(f"Error in custom on_connect callback: {e}")
+                logger.error("Error in custom on_connect callback: %s", e)
 
     # Set up callbacks
     client.on_connect = _benchmark_on_connect
@@ -147,6 +220,7 @@ def create_benchmark_mqtt_client(
         client.on_message = on_message_custom
     if on_disconnect_custom: 
         client.on_disconnect = on_disconnect_custom
+    attach_suback_tracker(client)  # Lets wait_for_subscription() block on the real SUBACK
 
     # Configure connection parameters
     broker_address = benchmark_args.bench_broker_host
@@ -170,31 +244,30 @@ def create_benchmark_mqtt_client(
 
             if ca_cert_abs_path_obj.exists():
                 ca_cert_abs_path = str(ca_cert_abs_path_obj)
-                logger.info(f"Using CA certificate: {ca_cert_abs_path}")
+                logger.info("Using CA certificate: %s", ca_cert_abs_path)
             else:
-                logger.warning(f"CA certificate not found: {ca_cert_abs_path_obj}")
+                logger.warning("CA certificate not found: %s", ca_cert_abs_path_obj)
         
         try:
-            # Try different SSL versions for compatibility
-            ssl_version = getattr(ssl, 'PROTOCOL_TLS_CLIENT', ssl.PROTOCOL_TLS)
-            client.tls_set(
-                ca_certs=ca_cert_abs_path, 
-                cert_reqs=ssl.CERT_REQUIRED, 
-                tls_version=ssl_version
-            )
+            # Process-wide context: the CA file is read once, and TLS sessions are resumed across connections
+            client.tls_set_context(get_tls_context(ca_certs=ca_cert_abs_path,
+                                                   session_resumption=benchmark_args.tls_resumption))
         except Exception as e_tls:
-            logger.error(f"TLS setup failed: {e_tls}")
+            logger.error("TLS setup failed: %s", e_tls)
             return None
     else:
         logger.info("TLS disabled for benchmark")
 
     # Set authentication
     if benchmark_args.bench_username and benchmark_args.bench_password:
-        logger.info(f"Setting authentication for client {client_id}")
+        logger.info("Setting authentication for client %s", client_id)
         client.username_pw_set(benchmark_args.bench_username, benchmark_args.bench_password)
 
+    if instrument:
+        instrument(client)
+
     # Connect to broker
-    logger.info(f"Client {client_id} connecting to {broker_address}:{current_broker_port}")
+    logger.info("Client %s connecting to %s:%s", client_id, broker_address, current_broker_port)
     try:
         # Create connection properties
         connect_props = Properties(PacketTypes.CONNECT)
@@ -206,16 +279,16 @@ def create_benchmark_mqtt_client(
         return client
         
     except Exception as e_conn:
-        logger.error(f"Connection failed for {client_id}: {e_conn}")
+        logger.error("Connection failed for %s: %s", client_id, e_conn)
         return None
 
 def on_disconnect_benchmark(client, userdata, flags, rc, properties=None):
     """Handle benchmark client disconnection."""
     state = userdata['state']
-    logger.info(f"Client {state.client_id}: Disconnected (RC: {rc})")
+    logger.info("Client %s: Disconnected (RC: %s)", state.client_id, rc)
     
     if properties and hasattr(properties, 'ReasonString') and properties.ReasonString:
-        logger.info(f"Disconnect reason: {properties.ReasonString}")
+        logger.info("Disconnect reason: %s", properties.ReasonString)
     
     state.disconnected_event.set()
 
@@ -225,85 +298,109 @@ def on_connect_responder(client, userdata, flags, rc, properties=None):
     args = userdata['args']
     
     if rc == 0:
-        logger.info(f"Responder {state.client_id}: Connected, subscribing to {args.request_topic}")
+        request_filter = responder_request_filter(args)
+        logger.info("Responder %s: Connected, subscribing to %s", state.client_id, request_filter)
         
         try:
-            res, mid = subscribe_to_topics(client, [(args.request_topic, args.qos)])
+            res, mid = subscribe_to_topics(client, [(request_filter, args.qos)])
             if res == mqtt.MQTT_ERR_SUCCESS:
-                logger.info(f"Responder {state.client_id}: Subscribed successfully")
+                logger.info("Responder %s: Subscribed successfully", state.client_id)
             else:
-                logger.error(f"Responder {state.client_id}: Subscription failed (code: {res})")
+                logger.error("Responder %s: Subscription failed (code: %s)", state.client_id, res)
         except Exception as e:
-            logger.error(f"Responder {state.client_id}: Subscription error: {e}")
+            logger.error("Responder %s: Subscription error: %s", state.client_id, e)
             
         state.connected_event.set()
     else:
-        logger.error(f"Responder {state.client_id}: Connection failed (RC: {rc})")
+        logger.error("Responder %s: Connection failed (RC: %s)", state.client_id, rc)
+
+def responder_request_filter(args: argparse.Namespace) -> str:
+    """Request subscription of a responder: plain topic, or an MQTT v5 shared subscription."""
+    if args.shared_group:
+        return f"$share/{args.shared_group}/{args.request_topic}"
+    return args.request_topic
 
 def on_message_responder(client, userdata, msg):
     """Handle incoming requests for responder."""
     state = userdata['state']
-    args = userdata['args']
-    state.processed_requests += 1
+    with state.lock:
+        state.processed_requests += 1
+        request_number = state.processed_requests
     
-    logger.info(f"Responder {state.client_id}: Processing request #{state.processed_requests}")
-    logger.debug(f"Topic: {msg.topic}, QoS: {msg.qos}, Payload: {len(msg.payload)} bytes")
+    logger.debug("Responder %s: Processing request #%s", state.client_id, request_number)
+    if state.workers is not None:
+        # Leave the paho network thread free; payload generation and publish run in the pool
+        state.workers.submit(handle_responder_request, client, userdata, msg)
+    else:
+        handle_responder_request(client, userdata, msg)
+
+def handle_responder_request(client, userdata, msg):
+    """Build and publish the response to one request."""
+    state = userdata['state']
+    args = userdata['args']
+    logger.debug("Topic: %s, QoS: %s, Payload: %s bytes", msg.topic, msg.qos, len(msg.payload))
     
     # Safely extract properties
     if not msg.properties:
-        logger.warning(f"Responder {state.client_id}: No properties in message")
+        logger.warning("Responder %s: No properties in message", state.client_id)
         return
         
     response_topic_prop = getattr(msg.properties, 'ResponseTopic', None)
     correlation_data_prop_bytes = getattr(msg.properties, 'CorrelationData', None)
     
     if not response_topic_prop:
-        logger.warning(f"Responder {state.client_id}: No ResponseTopic in properties")
+        logger.warning("Responder %s: No ResponseTopic in properties", state.client_id)
         return
         
     if not correlation_data_prop_bytes:
-        logger.warning(f"Responder {state.client_id}: No CorrelationData in properties")
+        logger.warning("Responder %s: No CorrelationData in properties", state.client_id)
         return
         
     try:
         correlation_id = correlation_data_prop_bytes.decode('utf-8', errors='strict')
     except UnicodeDecodeError as e:
-        logger.error(f"Responder {state.client_id}: Invalid correlation data encoding: {e}")
+        logger.error("Responder %s: Invalid correlation data encoding: %s", state.client_id, e)
         return
     
-    logger.debug(f"Responder {state.client_id}: Correlation ID: {correlation_id}")
+    logger.debug("Responder %s: Correlation ID: %s", state.client_id, correlation_id)
     
-    # Generate response
-    response_payload_str = generate_payload(args.res_payload_size)
     
     # Publish response
     try:
         pub_res = publish_message(
             client, 
             topic=response_topic_prop, 
-            payload=response_payload_str,
+            payload=state.payloads.next(),
             qos=args.qos, 
             correlation_data=correlation_data_prop_bytes,
-            content_type="text/plain"
+            content_type=state.payloads.content_type
         )
         
         if pub_res and pub_res.rc == mqtt.MQTT_ERR_SUCCESS:
-            logger.debug(f"Responder {state.client_id}: Response sent for {correlation_id}")
+            logger.debug("Responder %s: Response sent for %s", state.client_id, correlation_id)
         else:
-            logger.error(f"Responder {state.client_id}: Failed to send response")
-            state.publish_errors += 1
+            logger.error("Responder %s: Failed to send response", state.client_id)
+            with state.lock:
+                state.publish_errors += 1
             
     except Exception as e:
-        logger.error(f"Responder {state.client_id}: Error sending response: {e}")
-        state.publish_errors += 1
+        logger.error("Responder %s: Error sending response: %s", state.client_id, e)
+        with state.lock:
+            state.publish_errors += 1
 
-def wait_for_subscription(client: mqtt.Client, timeout: float = SUBSCRIPTION_TIMEOUT) -> bool:
-    """Wait for subscription to be confirmed."""
-    # This is a simplified version - in production you'd want to track SUBACK messages
-    time.sleep(0.1)  # Small delay to allow subscription to process
-    return True
+def wait_for_subscription(client: mqtt.Client, mid: Optional[int], timeout: float = SUBSCRIPTION_TIMEOUT) -> bool:
+    """Wait for the SUBACK of SUBSCRIBE `mid`; False on timeout or a failure reason code."""
+    if mid is None:
+        return False
+    ok, granted = wait_for_suback(client, mid, timeout)
+    if not ok:
+        if granted is None:
+            logger.error("No SUBACK for mid %s within %ss", mid, timeout)
+        else:
+            logger.error("Subscription rejected (mid %s): %s", mid, [str(g) for g in granted])
+    return ok
 
-def cleanup_request(state: RequesterState, correlation_id: str, client: mqtt.Client, response_topic: str) -> None:
+def cleanup_request(state: RequesterState, correlation_id: str, client: mqtt.Client, response_topic: Optional[str]) -> None:
     """Clean up request resources safely."""
     try:
         # Remove from active requests
@@ -311,24 +408,124 @@ def cleanup_request(state: RequesterState, correlation_id: str, client: mqtt.Cli
             if correlation_id in state.active_requests:
                 del state.active_requests[correlation_id]
         
-        # Unsubscribe from response topic
-        if client and hasattr(client, 'unsubscribe'):
+        # Unsubscribe from response topic (None in wildcard mode: the shared subscription stays)
+        if response_topic and client and hasattr(client, 'unsubscribe'):
             try:
                 client.unsubscribe(response_topic)
-                logger.debug(f"Unsubscribed from {response_topic}")
+                logger.debug("Unsubscribed from %s", response_topic)
             except Exception as e:
-                logger.warning(f"Failed to unsubscribe from {response_topic}: {e}")
+                logger.warning("Failed to unsubscribe from %s: %s", response_topic, e)
                 
     except Exception as e:
-        logger.error(f"Error during request cleanup: {e}")
+        logger.error("Error during request cleanup: %s", e)
+
+def finish_pipelined_request(client: mqtt.Client, state: RequesterState, correlation_id: str, outcome: str) -> None:
+    """Book-keep a pipelined request exactly once and free its in-flight slot.
+
+    outcome is "success" (RTT already stored in the entry), "timeout" or "error"
+    (the caller has already counted the publish/subscribe error).
+    """
+    with state.lock:
+        request_data = state.active_requests.pop(correlation_id, None)
+        if request_data is None:
+            return  # Already finished by the other side (response vs. sweeper race)
+        if outcome == "success":
+            state.latency.record(request_data['rtt'])
+            state.successful_requests += 1
+        elif outcome == "timeout":
+            state.timed_out_requests += 1
+
+    cleanup_request(state, correlation_id, client, request_data['response_topic'])
+    if state.in_flight_slots is not None:
+        state.in_flight_slots.release()
+
+def expire_pipelined_requests(client: mqtt.Client, state: RequesterState) -> int:
+    """Time out every pipelined request whose deadline has passed."""
+    now = time.perf_counter()
+    with state.lock:
+        expired = [cid for cid, data in state.active_requests.items() if data['deadline'] <= now]
+    for correlation_id in expired:
+        logger.warning("Request %s timed out after %ss", correlation_id, REQUEST_TIMEOUT_SECONDS)
+        finish_pipelined_request(client, state, correlation_id, "timeout")
+    return len(expired)
+
+def acquire_in_flight_slot(client: mqtt.Client, state: RequesterState) -> bool:
+    """Block until fewer than --concurrency requests are outstanding, expiring stale ones meanwhile."""
+    while not state.in_flight_slots.acquire(timeout=PIPELINE_SWEEP_INTERVAL_S):
+        if state.disconnected_event.is_set():
+            return False
+        expire_pipelined_requests(client, state)
+    return True
+
+def issue_pipelined_request(client: mqtt.Client, state: RequesterState, args: argparse.Namespace,
+                            index: int, intended_time: float) -> None:
+    """Send one request without waiting for its response.
+
+    RTT is measured from intended_time (the scheduled send time), not from the
+    moment the publish actually happens, so a sender that falls behind its
+    schedule shows up as latency instead of silently sending fewer requests.
+    """
+    correlation_id = str(uuid.uuid4())
+    dynamic_response_topic = build_response_topic(args.response_topic_base, state.client_id, correlation_id, args.response_mode)
+    per_request_subscription = args.response_mode == RESPONSE_MODE_PER_REQUEST
+
+    with state.lock:
+        state.active_requests[correlation_id] = {
+            'start_time': intended_time,
+            'event': None,
+            'rtt': None,
+            'rtt_recorded': False,
+            'deadline': intended_time + REQUEST_TIMEOUT_SECONDS,
+            'response_topic': dynamic_response_topic if per_request_subscription else None  # Topic to unsubscribe
+        }
+        state.max_in_flight = max(state.max_in_flight, len(state.active_requests))
+
+    try:
+        if per_request_subscription:
+            sub_res, mid_sub = subscribe_to_topics(client, [(dynamic_response_topic, args.qos)])
+            if sub_res != mqtt.MQTT_ERR_SUCCESS or not wait_for_subscription(client, mid_sub):
+                logger.error("Subscription failed for %s", dynamic_response_topic)
+                state.subscribe_errors += 1
+                finish_pipelined_request(client, state, correlation_id, "error")
+                return
+
+        pub_res = publish_message(
+            client,
+            topic=args.request_topic,
+            payload=state.payloads.next(),
+            qos=args.qos,
+            response_topic=dynamic_response_topic,
+            correlation_data=correlation_id.encode('utf-8'),
+            user_properties=[("benchmark_req_num", str(index+1))],
+            content_type=state.payloads.content_type
+        )
+        if not (pub_res and pub_res.rc == mqtt.MQTT_ERR_SUCCESS):
+            logger.error("Publish failed for request %s", index+1)
+            state.publish_errors += 1
+            finish_pipelined_request(client, state, correlation_id, "error")
+    except Exception as e:
+        logger.error("Error processing request %s: %s", index+1, e)
+        state.publish_errors += 1
+        finish_pipelined_request(client, state, correlation_id, "error")
 
 def on_connect_requester(client, userdata, flags, rc, properties=None):
     """Handle requester connection."""
     state = userdata['state']
+    args = userdata['args']
     if rc == 0:
+        if args.response_mode == RESPONSE_MODE_WILDCARD:
+            # One subscription for every response of this requester, (re)made on each connect
+            response_filter = response_subscription_filter(args.response_topic_base, state.client_id)
+            sub_result = subscribe_to_topics(client, [(response_filter, args.qos)])
+            if not sub_result or sub_result[0] != mqtt.MQTT_ERR_SUCCESS:
+                logger.error("Requester %s: Subscription failed for %s", state.client_id, response_filter)
+                state.subscribe_errors += 1
+            else:
+                state.response_sub_mid = sub_result[1]
+                logger.info("Requester %s: Subscribed to %s", state.client_id, response_filter)
         state.connected_event.set()
     else:
-        logger.error(f"Requester {state.client_id}: Connection failed (RC: {rc})")
+        logger.error("Requester %s: Connection failed (RC: %s)", state.client_id, rc)
 
 def on_message_requester(client, userdata, msg):
     """Handle response messages for requester."""
@@ -336,21 +533,21 @@ def on_message_requester(client, userdata, msg):
     
     # Safely extract correlation data
     if not msg.properties:
-        logger.warning(f"Requester {state.client_id}: Response without properties")
+        logger.warning("Requester %s: Response without properties", state.client_id)
         return
         
     correlation_id_resp_bytes = getattr(msg.properties, 'CorrelationData', None)
     if not correlation_id_resp_bytes:
-        logger.warning(f"Requester {state.client_id}: Response without CorrelationData")
+        logger.warning("Requester %s: Response without CorrelationData", state.client_id)
         return
         
     try:
         correlation_id_resp = correlation_id_resp_bytes.decode('utf-8', errors='strict')
     except UnicodeDecodeError as e:
-        logger.error(f"Requester {state.client_id}: Invalid correlation data: {e}")
+        logger.error("Requester %s: Invalid correlation data: %s", state.client_id, e)
         return
     
-    logger.debug(f"Requester {state.client_id}: Response received for {correlation_id_resp}")
+    logger.debug("Requester %s: Response received for %s", state.client_id, correlation_id_resp)
     
     # Record RTT safely
     with state.lock:
@@ -361,19 +558,25 @@ def on_message_requester(client, userdata, msg):
                 rtt = end_time - request_data['start_time']
                 request_data['rtt'] = rtt
                 request_data['rtt_recorded'] = True
-                request_data['event'].set()
-                logger.debug(f"RTT recorded: {rtt*1000:.3f}ms for {correlation_id_resp}")
+                logger.debug("RTT recorded: %.3fms for %s", rtt*1000, correlation_id_resp)
+                if request_data['event'] is not None:
+                    request_data['event'].set()
+                else:
+                    # Pipelined request: nobody is blocked on it, book-keep it right here
+                    finish_pipelined_request(client, state, correlation_id_resp, "success")
         else:
-            logger.warning(f"Requester {state.client_id}: Unknown correlation ID: {correlation_id_resp}")
+            logger.warning("Requester %s: Unknown correlation ID: %s", state.client_id, correlation_id_resp)
 
-def run_responder(args):
-    """Run the responder component of the benchmark."""
-    state = ResponderState()
-    logger.info(f"Starting Responder {state.client_id}")
-    logger.info(f"Request Topic: {args.request_topic}")
-    logger.info(f"Response Topic Base: {args.response_topic_base}")
-    logger.info(f"QoS: {args.qos}")
-    logger.info(f"Broker: {args.bench_broker_host}:{args.bench_broker_port}")
+def run_responder(args, state: Optional[ResponderState] = None, stats_queue=None):
+    """Run the responder component of the benchmark (one client)."""
+    if state is None:
+        state = ResponderState()
+    state.payloads = PayloadPool(args.res_payload_size, args.payload_kind, args.payload_pool_size)
+    logger.info("Starting Responder %s", state.client_id)
+    logger.info("Request Topic: %s", responder_request_filter(args))
+    logger.info("Response Topic Base: %s", args.response_topic_base)
+    logger.info("QoS: %s", args.qos)
+    logger.info("Broker: %s:%s", args.bench_broker_host, args.bench_broker_port)
 
     responder_client = create_benchmark_mqtt_client(
         client_id=state.client_id,
@@ -385,63 +588,98 @@ def run_responder(args):
     )
 
     if not responder_client:
-        logger.error(f"Responder {state.client_id}: Failed to create client")
+        logger.error("Responder %s: Failed to create client", state.client_id)
         return
 
     if not state.connected_event.wait(timeout=15):
-        logger.error(f"Responder {state.client_id}: Connection timeout")
+        logger.error("Responder %s: Connection timeout", state.client_id)
         safe_disconnect_client(responder_client)
         return
     
-    logger.info(f"Responder {state.client_id}: Ready for requests")
+    if args.responder_workers > 1:
+        state.workers = ThreadPoolExecutor(max_workers=args.responder_workers,
+                                           thread_name_prefix=f"{state.client_id}-worker")
+    logger.info("Responder %s: Ready for requests (workers: %s)", state.client_id, args.responder_workers)
     
     try:
         while not state.disconnected_event.is_set():
             time.sleep(1)
     except KeyboardInterrupt:
-        logger.info(f"Responder {state.client_id}: Shutting down...")
+        logger.info("Responder %s: Shutting down...", state.client_id)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, signal.SIG_IGN)  # Don't abort the final report on a repeated Ctrl+C
     finally:
+        if state.workers is not None:
+            state.workers.shutdown(wait=True)  # Finish queued requests before disconnecting
         safe_disconnect_client(responder_client, "Responder normal shutdown")
-        logger.info(f"Responder {state.client_id}: Final stats - Processed: {state.processed_requests}, Errors: {state.publish_errors}")
+        logger.info("Responder %s: Final stats - Processed: %s, Errors: %s", state.client_id, state.processed_requests, state.publish_errors)
+        if stats_queue is not None:
+            stats_queue.put((state.client_id, state.processed_requests, state.publish_errors))
 
-def run_requester(args):
-    """Run the requester component of the benchmark."""
-    state = RequesterState()
-    logger.info(f"Starting Requester {state.client_id}")
-    logger.info(f"Requests: {args.num_requests}, Payload: {args.req_payload_size} bytes")
+def responder_worker(worker_index: int, args: argparse.Namespace, stats_queue, log_level: int) -> None:
+    """Worker process of a responder pool: one responder client."""
+    set_log_level("benchmark", log_level)
+    state = ResponderState(client_id=f"benchmark_responder_{worker_index}_{str(uuid.uuid4())[:8]}")
+    try:
+        run_responder(args, state, stats_queue)
+    except KeyboardInterrupt:
+        pass  # run_responder already reported; Ctrl+C reaches every process in the group
 
-    requester_client = create_benchmark_mqtt_client(
-        client_id=state.client_id,
-        on_connect_custom=on_connect_requester,
-        on_message_custom=on_message_requester,
-        on_disconnect_custom=on_disconnect_benchmark,
-        userdata={'state': state, 'args': args},
-        benchmark_args=args
-    )
+def run_responder_pool(args: argparse.Namespace) -> None:
+    """Run --responders responder processes sharing the request load and report how it was split."""
+    ctx = multiprocessing.get_context()
+    stats_queue = ctx.Queue()
+    workers = [ctx.Process(target=responder_worker, name=f"responder-worker-{i}",
+                           args=(i, args, stats_queue, logger.getEffectiveLevel()))
+               for i in range(args.responders)]
+    for worker in workers:
+        worker.start()
+    logger.info("Responder pool: %s processes subscribed to %s", args.responders, responder_request_filter(args))
 
-    if not requester_client:
-        logger.error(f"Requester {state.client_id}: Failed to create client")
-        return
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        logger.info("Responder pool: Shutting down...")
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Let the workers report instead of aborting on a second Ctrl+C
+        for worker in workers:
+            worker.join(timeout=2)
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGINT)  # Ctrl+C reaches the whole group, a signal to the parent alone does not
+        for worker in workers:
+            worker.join(timeout=10)
 
-    if not state.connected_event.wait(timeout=15):
-        logger.error(f"Requester {state.client_id}: Connection timeout")
-        safe_disconnect_client(requester_client)
-        return
-        
-    logger.info(f"Requester {state.client_id}: Starting benchmark...")
-    
-    total_benchmark_start_time = time.perf_counter()
-    
+    stats = []
+    while True:
+        try:
+            stats.append(stats_queue.get(timeout=0.5))
+        except queue.Empty:
+            break
+    total_processed = sum(processed for _, processed, _ in stats)
+    print("\n" + "="*50)
+    print("RESPONDER POOL RESULTS")
+    print("="*50)
+    print(f"Shared subscription group: {args.shared_group or 'none (every responder receives every request)'}")
+    print(f"Workers per responder: {args.responder_workers}")
+    for client_id, processed, errors in sorted(stats):
+        share = (processed / total_processed * 100) if total_processed else 0
+        print(f"{client_id}: processed {processed} ({share:.1f}%), publish errors {errors}")
+    print(f"Total processed: {total_processed}")
+    print("="*50)
+
+def run_closed_loop_requests(requester_client: mqtt.Client, state: RequesterState, args: argparse.Namespace) -> None:
+    """Send requests one at a time, waiting for each response before the next (concurrency 1)."""
     for i in range(args.num_requests):
         if state.disconnected_event.is_set():
-            logger.warning(f"Requester {state.client_id}: Disconnected during benchmark")
+            logger.warning("Requester %s: Disconnected during benchmark", state.client_id)
             break
             
         correlation_id = str(uuid.uuid4())
-        dynamic_response_topic = f"{args.response_topic_base.rstrip('/')}/{correlation_id}"
+        dynamic_response_topic = build_response_topic(args.response_topic_base, state.client_id, correlation_id, args.response_mode)
+        per_request_subscription = args.response_mode == RESPONSE_MODE_PER_REQUEST
         request_event = threading.Event()
         
-        logger.debug(f"Request {i+1}/{args.num_requests}: {correlation_id}")
+        logger.debug("Request %s/%s: %s", i+1, args.num_requests, correlation_id)
         
         # Initialize request tracking
         with state.lock:
@@ -453,21 +691,19 @@ def run_requester(args):
             }
         
         try:
-            # Subscribe to response topic
-            sub_res, mid_sub = subscribe_to_topics(requester_client, [(dynamic_response_topic, args.qos)])
-            if sub_res != mqtt.MQTT_ERR_SUCCESS:
-                logger.error(f"Subscription failed for {dynamic_response_topic}")
-                state.subscribe_errors += 1
-                continue
-                
-            # Wait for subscription to be active
-            if not wait_for_subscription(requester_client):
-                logger.error(f"Subscription timeout for {dynamic_response_topic}")
-                state.subscribe_errors += 1
-                continue
-            
-            # Generate request payload
-            request_payload_str = generate_payload(args.req_payload_size)
+            if per_request_subscription:
+                # Subscribe to response topic
+                sub_res, mid_sub = subscribe_to_topics(requester_client, [(dynamic_response_topic, args.qos)])
+                if sub_res != mqtt.MQTT_ERR_SUCCESS:
+                    logger.error("Subscription failed for %s", dynamic_response_topic)
+                    state.subscribe_errors += 1
+                    continue
+                    
+                # Wait for subscription to be active
+                if not wait_for_subscription(requester_client, mid_sub):
+                    logger.error("Subscription not confirmed for %s", dynamic_response_topic)
+                    state.subscribe_errors += 1
+                    continue
             
             # Record start time
             with state.lock:
@@ -477,16 +713,16 @@ def run_requester(args):
             pub_res = publish_message(
                 requester_client, 
                 topic=args.request_topic, 
-                payload=request_payload_str,
+                payload=state.payloads.next(),
                 qos=args.qos, 
                 response_topic=dynamic_response_topic,
                 correlation_data=correlation_id.encode('utf-8'),
                 user_properties=[("benchmark_req_num", str(i+1))], 
-                content_type="text/plain"
+                content_type=state.payloads.content_type
             )
             
             if not (pub_res and pub_res.rc == mqtt.MQTT_ERR_SUCCESS):
-                logger.error(f"Publish failed for request {i+1}")
+                logger.error("Publish failed for request %s", i+1)
                 state.publish_errors += 1
                 continue
             
@@ -495,61 +731,111 @@ def run_requester(args):
                 with state.lock:
                     rtt_val = state.active_requests[correlation_id].get('rtt')
                 if rtt_val is not None:
-                    state.rtt_values.append(rtt_val)
+                    state.latency.record(rtt_val)
                     state.successful_requests += 1
-                    logger.debug(f"Request {i+1} successful: {rtt_val*1000:.3f}ms")
+                    logger.debug("Request %s successful: %.3fms", i+1, rtt_val*1000)
                 else:
                     state.timed_out_requests += 1
-                    logger.warning(f"Request {i+1} response received but RTT not recorded")
+                    logger.warning("Request %s response received but RTT not recorded", i+1)
             else:
                 state.timed_out_requests += 1
-                logger.warning(f"Request {i+1} timed out after {REQUEST_TIMEOUT_SECONDS}s")
+                logger.warning("Request %s timed out after %ss", i+1, REQUEST_TIMEOUT_SECONDS)
                 
         except Exception as e:
-            logger.error(f"Error processing request {i+1}: {e}")
+            logger.error("Error processing request %s: %s", i+1, e)
             state.publish_errors += 1
             
         finally:
             # Always clean up request resources
-            cleanup_request(state, correlation_id, requester_client, dynamic_response_topic)
+            cleanup_request(state, correlation_id, requester_client,
+                            dynamic_response_topic if per_request_subscription else None)
             
             # Inter-request delay
             if args.inter_request_delay_s > 0 and i < args.num_requests - 1:
                 time.sleep(args.inter_request_delay_s)
-    
-    total_benchmark_end_time = time.perf_counter()
-    total_duration = total_benchmark_end_time - total_benchmark_start_time
 
-    # Print Results
+def run_pipelined_requests(requester_client: mqtt.Client, state: RequesterState, args: argparse.Namespace) -> None:
+    """Keep up to --concurrency requests in flight and/or send on a fixed --target_rate schedule."""
+    if args.concurrency:
+        state.in_flight_slots = threading.BoundedSemaphore(args.concurrency)
+    send_interval = 1.0 / args.target_rate if args.target_rate else None
+
+    schedule_start = time.perf_counter()
+    next_sweep = schedule_start + PIPELINE_SWEEP_INTERVAL_S
+    for i in range(args.num_requests):
+        if state.disconnected_event.is_set():
+            logger.warning("Requester %s: Disconnected during benchmark", state.client_id)
+            break
+
+        if send_interval is not None:
+            # Open loop: request i is due at a fixed point in time, whatever the responses do
+            intended_time = schedule_start + i * send_interval
+            delay = intended_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        elif args.inter_request_delay_s > 0 and i > 0:
+            time.sleep(args.inter_request_delay_s)
+
+        if state.in_flight_slots is not None and not acquire_in_flight_slot(requester_client, state):
+            logger.warning("Requester %s: Disconnected during benchmark", state.client_id)
+            break
+        if send_interval is None:
+            intended_time = time.perf_counter()
+
+        issue_pipelined_request(requester_client, state, args, i, intended_time)
+
+        now = time.perf_counter()
+        if now >= next_sweep:
+            expire_pipelined_requests(requester_client, state)
+            next_sweep = now + PIPELINE_SWEEP_INTERVAL_S
+
+    # Drain: wait for outstanding responses or their deadlines
+    while not state.disconnected_event.is_set():
+        with state.lock:
+            if not state.active_requests:
+                break
+        time.sleep(PIPELINE_SWEEP_INTERVAL_S)
+        expire_pipelined_requests(requester_client, state)
+
+def print_requester_results(state: RequesterState, args: argparse.Namespace, total_duration: float,
+                            total_requests: Optional[int] = None, fleet_summary: Optional[str] = None) -> None:
+    """Print the final report of a requester run (a single client or a merged fleet)."""
+    if total_requests is None:
+        total_requests = args.num_requests
     print("\n" + "="*50)
     print("BENCHMARK RESULTS")
     print("="*50)
-    print(f"Total requests attempted: {args.num_requests}")
+    if fleet_summary:
+        print(fleet_summary)
+    if args.concurrency or args.target_rate:
+        print(f"Mode: pipelined (concurrency: {args.concurrency or 'unbounded'}, "
+              f"target rate: {f'{args.target_rate:g} req/s' if args.target_rate else 'as fast as slots allow'})")
+        print(f"Max requests in flight: {state.max_in_flight}")
+    else:
+        print("Mode: closed loop (one request in flight)")
+    print(f"Response subscription: {args.response_mode}")
+    print(f"Total requests attempted: {total_requests}")
     print(f"Successful requests: {state.successful_requests}")
     print(f"Timed-out requests: {state.timed_out_requests}")
     print(f"Publish errors: {state.publish_errors}")
     print(f"Subscribe errors: {state.subscribe_errors}")
     
-    if state.rtt_values:
-        min_rtt_ms = min(state.rtt_values) * 1000
-        max_rtt_ms = max(state.rtt_values) * 1000
-        avg_rtt_ms = statistics.mean(state.rtt_values) * 1000
-        print(f"Minimum RTT: {min_rtt_ms:.3f} ms")
-        print(f"Maximum RTT: {max_rtt_ms:.3f} ms")
-        print(f"Average RTT: {avg_rtt_ms:.3f} ms")
+    if state.latency.total_count:
+        print(f"Minimum RTT: {state.latency.min * 1000:.3f} ms")
+        print(f"Maximum RTT: {state.latency.max * 1000:.3f} ms")
+        print(f"Average RTT: {state.latency.mean * 1000:.3f} ms")
         
-        if len(state.rtt_values) > 1:
-            stdev_rtt_ms = statistics.stdev(state.rtt_values) * 1000
-            print(f"StdDev RTT: {stdev_rtt_ms:.3f} ms")
+        if state.latency.total_count > 1:
+            print(f"StdDev RTT: {state.latency.stdev * 1000:.3f} ms")
             
-        # Calculate percentiles
-        sorted_rtts = sorted([rtt * 1000 for rtt in state.rtt_values])
-        p50 = sorted_rtts[len(sorted_rtts) // 2]
-        p95 = sorted_rtts[int(len(sorted_rtts) * 0.95)]
-        p99 = sorted_rtts[int(len(sorted_rtts) * 0.99)]
-        print(f"50th percentile: {p50:.3f} ms")
-        print(f"95th percentile: {p95:.3f} ms")
-        print(f"99th percentile: {p99:.3f} ms")
+        # Percentiles from the histogram (bucket upper bound, 3 significant figures)
+        for percentile, value in state.latency.percentiles(RTT_REPORT_PERCENTILES).items():
+            print(f"{percentile:g}th percentile: {value * 1000:.3f} ms")
+        if state.latency.clamped_count:
+            print(f"RTTs above histogram range (clamped): {state.latency.clamped_count}")
+        if args.histogram_output:
+            state.latency.write_distribution(args.histogram_output)
+            print(f"RTT distribution written to: {args.histogram_output}")
     else:
         print("No successful RTT measurements to report.")
     
@@ -558,16 +844,574 @@ def run_requester(args):
         rps = state.successful_requests / total_duration
         print(f"Throughput: {rps:.2f} requests/second")
     
-    success_rate = (state.successful_requests / args.num_requests) * 100 if args.num_requests > 0 else 0
+    success_rate = (state.successful_requests / total_requests) * 100 if total_requests > 0 else 0
     print(f"Success rate: {success_rate:.1f}%")
     print("="*50)
 
+def start_requester_client(args: argparse.Namespace, state: RequesterState) -> Optional[mqtt.Client]:
+    """Create and connect a requester client; returns None if it could not be made ready."""
+    requester_client = create_benchmark_mqtt_client(
+        client_id=state.client_id,
+        on_connect_custom=on_connect_requester,
+        on_message_custom=on_message_requester,
+        on_disconnect_custom=on_disconnect_benchmark,
+        userdata={'state': state, 'args': args},
+        benchmark_args=args
+    )
+
+    if not requester_client:
+        logger.error("Requester %s: Failed to create client", state.client_id)
+        return None
+
+    if not state.connected_event.wait(timeout=CONNACK_TIMEOUT_SECONDS):
+        logger.error("Requester %s: Connection timeout", state.client_id)
+        safe_disconnect_client(requester_client)
+        return None
+
+    if args.response_mode == RESPONSE_MODE_WILDCARD and not wait_for_subscription(requester_client, state.response_sub_mid):
+        logger.error("Requester %s: Response subscription not confirmed", state.client_id)
+        safe_disconnect_client(requester_client)
+        return None
+    return requester_client
+
+def run_requester_load(requester_client: mqtt.Client, state: RequesterState, args: argparse.Namespace) -> None:
+    """Send this client's share of the load in the configured mode."""
+    if args.concurrency or args.target_rate:
+        run_pipelined_requests(requester_client, state, args)
+    else:
+        run_closed_loop_requests(requester_client, state, args)
+
+def wait_for_start_signal(start_event, worker_name: str, setup_timeout: float) -> bool:
+    """Wait for the parent's start signal; False (logged) if it does not come in time.
+
+    The parent only signals once every worker is ready, so the wait allows `setup_timeout` (the longest a
+    worker may take to get ready) plus START_SIGNAL_SLACK_SECONDS before giving up.
+    """
+    timeout = setup_timeout + START_SIGNAL_SLACK_SECONDS
+    if start_event.wait(timeout=timeout):
+        return True
+    logger.error("%s: no start signal within %.0fs, giving up", worker_name, timeout)
+    return False
+
+def requester_worker(worker_index: int, args: argparse.Namespace, result_queue, start_event, log_level: int) -> None:
+    """Worker process of a requester fleet: runs --clients_per_process clients, one thread each.
+
+    Reports ('ready', index, connected_clients) once all clients are connected, waits for the
+    parent's start signal and finally reports ('result', index, summary) with its counters and
+    merged latency histogram.
+    """
+    set_log_level("benchmark", log_level)
+    payloads = PayloadPool(args.req_payload_size, args.payload_kind, args.payload_pool_size)
+    clients = []
+    for client_index in range(args.clients_per_process):
+        state = RequesterState(client_id=f"benchmark_requester_p{worker_index}c{client_index}_{str(uuid.uuid4())[:8]}")
+        state.payloads = payloads
+        requester_client = start_requester_client(args, state)
+        if requester_client:
+            clients.append((requester_client, state))
+    result_queue.put(('ready', worker_index, len(clients)))
+    setup_timeout = args.clients_per_process * (CONNACK_TIMEOUT_SECONDS + SUBSCRIPTION_TIMEOUT)
+    if not wait_for_start_signal(start_event, f"Requester worker {worker_index}", setup_timeout):
+        for client, _ in clients:
+            safe_disconnect_client(client, "Requester benchmark aborted")
+        return
+
+    threads = [threading.Thread(target=run_requester_load, args=(client, state, args), daemon=True)
+               for client, state in clients]
+    start_wall = time.time()  # Wall clock: comparable across worker processes
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    end_wall = time.time()
+
+    summary = {
+        'clients': len(clients),
+        'start': start_wall,
+        'end': end_wall,
+        'max_in_flight': 0,
+        'latency': LatencyHistogram(),
+    }
+    for counter in REQUESTER_COUNTERS:
+        summary[counter] = 0
+    for client, state in clients:
+        safe_disconnect_client(client, "Requester benchmark finished")
+        for counter in REQUESTER_COUNTERS:
+            summary[counter] += getattr(state, counter)
+        summary['max_in_flight'] = max(summary['max_in_flight'], state.max_in_flight)
+        summary['latency'].merge(state.latency)
+    result_queue.put(('result', worker_index, summary))
+
+def collect_worker_reports(result_queue, workers, kind: str) -> Dict[int, Any]:
+    """Gather one ('kind', index, payload) message per worker, giving up on workers that died without reporting."""
+    received: Dict[int, Any] = {}
+    while len(received) < len(workers):
+        try:
+            msg_kind, worker_index, payload = result_queue.get(timeout=1.0)
+        except queue.Empty:
+            if all(not w.is_alive() for i, w in enumerate(workers) if i not in received):
+                logger.error("%s worker process(es) exited without a '%s' report", len(workers) - len(received), kind)
+                break
+            continue
+        if msg_kind == kind:
+            received[worker_index] = payload
+    return received
+
+def run_requester_fleet(args: argparse.Namespace) -> None:
+    """Run --processes worker processes of --clients_per_process requesters and merge their reports."""
+    ctx = multiprocessing.get_context()
+    result_queue = ctx.Queue()
+    start_event = ctx.Event()
+    workers = [ctx.Process(target=requester_worker, name=f"requester-worker-{i}",
+                           args=(i, args, result_queue, start_event, logger.getEffectiveLevel()))
+               for i in range(args.processes)]
+    for worker in workers:
+        worker.start()
+
+    ready = collect_worker_reports(result_queue, workers, 'ready')
+    connected_clients = sum(ready.values())
+    logger.info("Fleet: %s/%s clients connected, starting", connected_clients, args.processes * args.clients_per_process)
+    start_event.set()
+    results = collect_worker_reports(result_queue, workers, 'result')
+    for worker in workers:
+        worker.join(timeout=5)
+
+    merged = RequesterState(client_id="benchmark_requester_fleet")
+    start_wall, end_wall = None, None
+    for summary in results.values():
+        for counter in REQUESTER_COUNTERS:
+            setattr(merged, counter, getattr(merged, counter) + summary[counter])
+        merged.max_in_flight = max(merged.max_in_flight, summary['max_in_flight'])
+        merged.latency.merge(summary['latency'])
+        if summary['clients']:
+            start_wall = summary['start'] if start_wall is None else min(start_wall, summary['start'])
+            end_wall = summary['end'] if end_wall is None else max(end_wall, summary['end'])
+    total_duration = (end_wall - start_wall) if start_wall is not None else 0.0
+    reported_clients = sum(summary['clients'] for summary in results.values())
+
+    fleet_summary = (f"Fleet: {args.processes} process(es) x {args.clients_per_process} client(s), "
+                     f"{reported_clients} reporting ({args.num_requests} requests per client)")
+    if args.concurrency or args.target_rate:
+        fleet_summary += "\nConcurrency / target rate below apply per client; max in flight is the largest per client"
+    print_requester_results(merged, args, total_duration,
+                            total_requests=args.num_requests * args.processes * args.clients_per_process,
+                            fleet_summary=fleet_summary)
+
+def time_publish_calls(client: mqtt.Client, publish_once, count: int) -> float:
+    """Call publish_once(i) `count` times; returns calls/second of the publish calls themselves."""
+    last_info = None
+    start = time.perf_counter()
+    for i in range(count):
+        last_info = publish_once(i)
+    elapsed = time.perf_counter() - start
+    if last_info is not None:
+        last_info.wait_for_publish(timeout=REQUEST_TIMEOUT_SECONDS)  # Drain before the next variant
+    return count / elapsed if elapsed > 0 else 0.0
+
+def run_publish_benchmark(args: argparse.Namespace) -> None:
+    """Micro-benchmark of the publish path: publish_message() vs a pre-built PublishProfile.
+
+    publish_message() builds and validates a new Properties object per call; the profile
+    builds the fixed UserProperty/ContentType/MessageExpiryInterval once and only adds
+    ResponseTopic/CorrelationData per message.
+    """
+    state = RequesterState(client_id=f"benchmark_publisher_{str(uuid.uuid4())[:8]}")
+    publisher_client = create_benchmark_mqtt_client(
+        client_id=state.client_id,
+        on_connect_custom=lambda c, u, f, rc, p=None: state.connected_event.set() if rc == 0 else None,
+        on_message_custom=None,
+        on_disconnect_custom=on_disconnect_benchmark,
+        userdata={'state': state, 'args': args},
+        benchmark_args=args
+    )
+    if not publisher_client or not state.connected_event.wait(timeout=15):
+        logger.error("Publisher %s: Connection failed", state.client_id)
+        safe_disconnect_client(publisher_client)
+        return
+
+    payloads = PayloadPool(args.req_payload_size, args.payload_kind, args.payload_pool_size)
+    topic = args.publish_topic
+    response_topic = build_response_topic(args.response_topic_base, state.client_id, "publish_bench", RESPONSE_MODE_WILDCARD)
+    correlation_ids = [str(i).encode('utf-8') for i in range(args.num_requests)]  # Pre-encoded, like RpcClient does
+    profile = PublishProfile(topic, qos=args.qos, user_properties=PUBLISH_BENCH_USER_PROPERTIES,
+                             content_type=PUBLISH_BENCH_CONTENT_TYPE)
+
+    variants = [
+        ("publish_message, fixed properties",
+         lambda i: publish_message(publisher_client, topic, payloads.next(), qos=args.qos,
+                                   user_properties=PUBLISH_BENCH_USER_PROPERTIES, content_type=PUBLISH_BENCH_CONTENT_TYPE)),
+        ("PublishProfile, fixed properties",
+         lambda i: profile.publish(publisher_client, payloads.next())),
+        ("publish_message, + ResponseTopic/CorrelationData",
+         lambda i: publish_message(publisher_client, topic, payloads.next(), qos=args.qos,
+                                   response_topic=response_topic, correlation_data=correlation_ids[i],
+                                   user_properties=PUBLISH_BENCH_USER_PROPERTIES, content_type=PUBLISH_BENCH_CONTENT_TYPE)),
+        ("PublishProfile, + ResponseTopic/CorrelationData",
+         lambda i: profile.publish(publisher_client, payloads.next(), response_topic=response_topic,
+                                   correlation_data=correlation_ids[i])),
+    ]
+    results = []
+    for label, publish_once in variants:
+        if state.disconnected_event.is_set():
+            logger.error("Publisher %s: Disconnected during benchmark", state.client_id)
+            break
+        results.append((label, time_publish_calls(publisher_client, publish_once, args.num_requests)))
+
+    print("\n" + "="*50)
+    print("PUBLISH CALL BENCHMARK RESULTS")
+    print("="*50)
+    print(f"Messages per variant: {args.num_requests}, QoS: {args.qos}, payload: {args.req_payload_size} bytes ({args.payload_kind})")
+    for label, calls_per_second in results:
+        print(f"{label}: {calls_per_second:,.0f} publish calls/second ({1e6 / calls_per_second:.1f} us/call)"
+              if calls_per_second else f"{label}: n/a")
+    print("="*50)
+    safe_disconnect_client(publisher_client, "Publish benchmark finished")
+
+def measure_tls_connects(args: argparse.Namespace, resumption: bool) -> Tuple[LatencyHistogram, int, int]:
+    """Open and close --num_requests connections one after another; returns (connect latency, resumed, failed).
+
+    Latency runs from client creation to CONNACK, so it covers TCP, the TLS handshake, authentication and CONNECT.
+    One untimed warm-up connect per mode builds the SSLContext and, with resumption, caches the first session.
+    """
+    mode_args = argparse.Namespace(**{**vars(args), 'tls_resumption': resumption})
+    latency = LatencyHistogram()
+    resumed = failed = 0
+    for i in range(args.num_requests + 1):
+        state = RequesterState(client_id=f"benchmark_tls_{str(uuid.uuid4())[:8]}")
+        reused = []
+
+        def on_connect_tls(client_obj, user_data_obj, flags_dict, rc_int, props_obj=None):
+            if rc_int == 0:
+                sock = client_obj.socket()
+                reused.append(isinstance(sock, ssl.SSLSocket) and sock.session_reused)
+                state.connected_event.set()
+
+        start = time.perf_counter()
+        client = create_benchmark_mqtt_client(
+            client_id=state.client_id,
+            on_connect_custom=on_connect_tls,
+            on_message_custom=None,
+            on_disconnect_custom=on_disconnect_benchmark,
+            userdata={'state': state, 'args': mode_args},
+            benchmark_args=mode_args
+        )
+        connected = bool(client) and state.connected_event.wait(timeout=15)
+        if i > 0:  # Connect 0 is the untimed warm-up
+            if connected:
+                latency.record(time.perf_counter() - start)
+                resumed += bool(reused and reused[0])
+            else:
+                failed += 1
+        if client:
+            client.disconnect()  # Before loop_stop(), so the network thread exits without waiting for its select timeout
+            client.loop_stop()
+    return latency, resumed, failed
+
+def run_tls_benchmark(args: argparse.Namespace) -> None:
+    """Compare connect latency with a full TLS handshake on every connection vs. TLS session resumption."""
+    results = []
+    for label, resumption in (("full handshake", False), ("session resumption", True)):
+        logger.info("TLS benchmark: %s connects with %s", args.num_requests, label)
+        results.append((label, *measure_tls_connects(args, resumption)))
+
+    print("\n" + "="*50)
+    print("TLS CONNECT BENCHMARK RESULTS")
+    print("="*50)
+    print(f"Broker: {args.bench_broker_host}:{args.bench_broker_port}, connections per mode: {args.num_requests} (sequential)")
+    for label, latency, resumed, failed in results:
+        if not latency.total_count:
+            print(f"{label}: no successful connections ({failed} failed)")
+            continue
+        p50, p99 = latency.percentiles((50.0, 99.0)).values()
+        print(f"{label}: avg {latency.mean * 1000:.3f} ms, p50 {p50 * 1000:.3f} ms, p99 {p99 * 1000:.3f} ms, "
+              f"resumed {resumed}/{latency.total_count}, failed {failed}")
+    if all(latency.total_count for _, latency, _, _ in results):
+        full_mean, resumed_mean = results[0][1].mean, results[1][1].mean
+        print(f"Average connect latency change with resumption: {(resumed_mean - full_mean) * 1000:+.3f} ms "
+              f"({(resumed_mean / full_mean - 1) * 100:+.1f}%)")
+    print("="*50)
+
+class ConnectStats:
+    """Per-phase latency histograms and per-phase failure counters of the connect role (shared by its workers)."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases: Dict[str, LatencyHistogram] = {phase: LatencyHistogram() for phase in CONNECT_PHASES + ("total",)}
+        self.failures: Dict[str, int] = {phase: 0 for phase in CONNECT_PHASES}
+        self.successful = 0
+        self.resumed = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Picklable copy for sending from a worker process to the parent."""
+        with self.lock:
+            return {'phases': {phase: latency.snapshot() for phase, latency in self.phases.items()},
+                    'failures': dict(self.failures), 'successful': self.successful, 'resumed': self.resumed}
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        with self.lock:
+            for phase, latency in snapshot['phases'].items():
+                self.phases[phase].merge(latency)
+            for phase, count in snapshot['failures'].items():
+                self.failures[phase] += count
+            self.successful += snapshot['successful']
+            self.resumed += snapshot['resumed']
+
+    def record_failure(self, phase: str) -> None:
+        with self.lock:
+            self.failures[phase] += 1
+
+    def record_success(self, marks: Dict[str, float], resumed: bool) -> None:
+        with self.lock:
+            self.phases["socket"].record(marks["socket_open"] - marks["start"])
+            self.phases["connack"].record(marks["connack"] - marks["socket_open"])
+            self.phases["suback"].record(marks["suback"] - marks["connack"])
+            self.phases["total"].record(marks["suback"] - marks["start"])
+            self.successful += 1
+            self.resumed += resumed
+
+def open_timed_connection(index: int, args: argparse.Namespace, stats: ConnectStats) -> Optional[mqtt.Client]:
+    """Socket setup, CONNECT/CONNACK and SUBSCRIBE/SUBACK for one client, timing each phase.
+
+    Timing uses only paho's public callbacks: on_socket_open fires once the TCP connect and the TLS handshake
+    are both done, so those two are reported together as the "socket" phase.
+    Returns the connected client (kept open until the run ends), or None after recording the failed phase.
+    """
+    state = RequesterState(client_id=f"benchmark_connect_{index}_{str(uuid.uuid4())[:8]}")
+    marks: Dict[str, float] = {}
+    connack: Dict[str, Any] = {}
+
+    def instrument(client_obj: mqtt.Client) -> None:
+        client_obj.on_socket_open = lambda c, u, sock: marks.setdefault("socket_open", time.perf_counter())
+
+    def on_connect_timed(client_obj, user_data_obj, flags_dict, rc_int, props_obj=None):
+        marks.setdefault("connack", time.perf_counter())
+        sock = client_obj.socket()
+        connack.update(rc=rc_int, resumed=isinstance(sock, ssl.SSLSocket) and sock.session_reused)
+        state.connected_event.set()
+
+    marks["start"] = time.perf_counter()
+    client = create_benchmark_mqtt_client(
+        client_id=state.client_id,
+        on_connect_custom=on_connect_timed,
+        on_message_custom=None,
+        on_disconnect_custom=on_disconnect_benchmark,
+        userdata={'state': state, 'args': args},
+        benchmark_args=args,
+        instrument=instrument
+    )
+    if client is None:  # connect() raised: before or after the socket was up
+        stats.record_failure("socket" if "socket_open" not in marks else "connack")
+        return None
+    keep_open = False
+    try:
+        if not state.connected_event.wait(timeout=CONNACK_TIMEOUT_SECONDS) or connack["rc"] != 0:
+            stats.record_failure("connack")
+            return None
+
+        # subscribe_to_topics() returns None when the SUBSCRIBE could not be sent
+        sub_result = subscribe_to_topics(client, [(f"{DEFAULT_CONNECT_TOPIC_BASE}{state.client_id}", args.qos)])
+        if not sub_result or sub_result[0] != mqtt.MQTT_ERR_SUCCESS or not wait_for_subscription(client, sub_result[1]):
+            stats.record_failure("suback")
+            return None
+        marks["suback"] = time.perf_counter()
+        stats.record_success(marks, connack["resumed"])
+        keep_open = True
+        return client
+    finally:
+        if not keep_open:  # Failed or raised: release the socket and network thread now, not at the end of the run
+            close_connect_clients([client])
+
+def run_connect_attempts(args: argparse.Namespace, indices: range, stats: ConnectStats) -> Dict[str, Any]:
+    """Start the connection attempts for `indices` on the global schedule (attempt i at start + i / --connect_rate).
+
+    Returns the open clients and the wall-clock start / last-issue / end times of this share of the run.
+    """
+    interval = 1.0 / args.connect_rate if args.connect_rate else 0.0
+    clients = []
+    start_wall = time.time()  # Wall clock: comparable across worker processes
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.connect_workers) as pool:
+        futures = []
+        for i in indices:
+            if interval:
+                delay = start + i * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(open_timed_connection, i, args, stats))
+        issued_wall = time.time()
+        for future in futures:
+            try:
+                client = future.result()
+            except Exception as e:
+                logger.error("Connect benchmark: connection attempt raised: %s", e)
+                stats.record_failure("socket")
+                continue
+            if client:
+                clients.append(client)
+    return {'clients': clients, 'start': start_wall, 'issued': issued_wall, 'end': time.time()}
+
+def close_connect_clients(clients) -> None:
+    for client in clients:
+        client.disconnect()  # Before loop_stop(), so the network thread exits without waiting for its select timeout
+        client.loop_stop()
+
+def connect_worker(worker_index: int, args: argparse.Namespace, result_queue, start_event, release_event,
+                   log_level: int) -> None:
+    """Worker process of the connect role: attempts worker_index, worker_index + P, ... of the global schedule.
+
+    Reports 'ready', waits for the start signal, reports ('result', index, summary) and keeps its connections
+    open until the parent's release signal, so all processes hold their connections at the same time.
+    """
+    set_log_level("benchmark", log_level)
+    stats = ConnectStats()
+    result_queue.put(('ready', worker_index, 0))
+    if not wait_for_start_signal(start_event, f"Connect worker {worker_index}", 0):  # Ready before any setup
+        return
+    run = run_connect_attempts(args, range(worker_index, args.connections, args.processes), stats)
+    clients = run.pop('clients')
+    result_queue.put(('result', worker_index, {**run, 'stats': stats.snapshot()}))
+    release_event.wait()
+    close_connect_clients(clients)
+
+def print_connect_results(stats: ConnectStats, args: argparse.Namespace, issue_duration: float,
+                          total_duration: float) -> None:
+    failed = sum(stats.failures.values())
+    print("\n" + "="*50)
+    print("CONNECT BENCHMARK RESULTS")
+    print("="*50)
+    print(f"Broker: {args.bench_broker_host}:{args.bench_broker_port}, TLS: {args.bench_use_tls}"
+          f"{f' (session resumption: {args.tls_resumption})' if args.bench_use_tls else ''}, "
+          f"auth: {'yes' if args.bench_username else 'no'}")
+    print(f"Connections attempted: {args.connections} (target rate: "
+          f"{f'{args.connect_rate:g}/s' if args.connect_rate else 'unlimited'}, achieved issue rate: "
+          f"{args.connections / issue_duration if issue_duration > 0 else 0:.1f}/s, "
+          f"{args.processes} process(es) x {args.connect_workers} workers)")
+    print(f"Successful connections (CONNACK + SUBACK): {stats.successful}")
+    print(f"Failed connections: {failed} ({failed / args.connections * 100:.1f}%) - "
+          + ", ".join(f"{phase}: {count}" for phase, count in stats.failures.items()))
+    if args.bench_use_tls:
+        print(f"TLS sessions resumed: {stats.resumed}/{stats.successful}")
+    print(f"Total duration: {total_duration:.3f} seconds")
+    if total_duration > 0:
+        print(f"Connections/second: {stats.successful / total_duration:.1f}")
+    for phase, latency in stats.phases.items():
+        if not latency.total_count:
+            continue
+        p50, p90, p99 = latency.percentiles((50.0, 90.0, 99.0)).values()
+        print(f"{phase:>8}: avg {latency.mean * 1000:8.3f} ms, p50 {p50 * 1000:8.3f} ms, p90 {p90 * 1000:8.3f} ms, "
+              f"p99 {p99 * 1000:8.3f} ms, max {latency.max * 1000:8.3f} ms")
+    print("="*50)
+
+def run_connect_benchmark(args: argparse.Namespace) -> None:
+    """Reconnect-storm benchmark: open --connections connections at --connect_rate and break down connect latency.
+
+    Connections are started by --connect_workers threads per process on a fixed schedule and stay open until
+    all attempts have finished (so the broker holds all of them at once, as after a restart), then are closed.
+    Paho's network loop uses select(), which limits one process to roughly 300 connections; use --processes
+    for larger storms.
+    """
+    logger.info("Connect benchmark: %s connections, rate %s/s, %s process(es) x %s workers",
+                args.connections, args.connect_rate or "unlimited", args.processes, args.connect_workers)
+    stats = ConnectStats()
+    if args.processes == 1:
+        run = run_connect_attempts(args, range(args.connections), stats)
+        print_connect_results(stats, args, run['issued'] - run['start'], run['end'] - run['start'])
+        close_connect_clients(run['clients'])
+        return
+
+    ctx = multiprocessing.get_context()
+    result_queue = ctx.Queue()
+    start_event = ctx.Event()
+    release_event = ctx.Event()
+    workers = [ctx.Process(target=connect_worker, name=f"connect-worker-{i}",
+                           args=(i, args, result_queue, start_event, release_event, logger.getEffectiveLevel()))
+               for i in range(args.processes)]
+    for worker in workers:
+        worker.start()
+
+    collect_worker_reports(result_queue, workers, 'ready')
+    start_event.set()
+    results = collect_worker_reports(result_queue, workers, 'result')
+    release_event.set()
+    for worker in workers:
+        worker.join(timeout=10)
+
+    for summary in results.values():
+        stats.merge(summary['stats'])
+    if results:
+        start_wall = min(summary['start'] for summary in results.values())
+        issue_duration = max(summary['issued'] for summary in results.values()) - start_wall
+        total_duration = max(summary['end'] for summary in results.values()) - start_wall
+    else:
+        issue_duration = total_duration = 0.0
+    print_connect_results(stats, args, issue_duration, total_duration)
+
+def run_codec_benchmark(args: argparse.Namespace) -> None:
+    """Compare payload codecs (bytes and us per message) on sensor-style telemetry; no broker needed."""
+    rng = random.Random(0)
+    client_id = f"sensor_{str(uuid.uuid4())[:8]}"
+    messages = []
+    for i in range(args.num_requests):
+        metric, unit, low, high = (("temperature", "C", 15.0, 38.0) if i % 2 == 0 else ("humidity", "%RH", 30.0, 75.0))
+        messages.append({"count": i + 1, metric: round(rng.uniform(low, high), 1), "unit": unit,
+                         "client_id": client_id, "timestamp": time.time()})
+
+    results = []
+    for content_type, codec in PAYLOAD_CODECS.items():
+        start = time.perf_counter()
+        encoded = [codec.encode(message) for message in messages]
+        encode_s = time.perf_counter() - start
+        start = time.perf_counter()
+        for payload in encoded:
+            codec.decode(payload)
+        decode_s = time.perf_counter() - start
+        total_bytes = sum(len(payload) for payload in encoded)
+        results.append((content_type, total_bytes / len(messages), encode_s * 1e6 / len(messages),
+                        decode_s * 1e6 / len(messages)))
+
+    json_bytes = next((avg_bytes for content_type, avg_bytes, _, _ in results if content_type == CONTENT_TYPE_JSON), None)
+    print("\n" + "="*50)
+    print("PAYLOAD CODEC BENCHMARK RESULTS")
+    print("="*50)
+    print(f"Messages: {args.num_requests} (alternating temperature/humidity readings)")
+    for content_type, avg_bytes, encode_us, decode_us in results:
+        ratio = f" ({avg_bytes / json_bytes * 100:.0f}% of JSON)" if json_bytes else ""
+        print(f"{content_type}: {avg_bytes:.1f} bytes/msg{ratio}, encode {encode_us:.2f} us/msg, decode {decode_us:.2f} us/msg")
+    print("="*50)
+
+def run_requester(args):
+    """Run the requester component of the benchmark."""
+    if args.processes > 1 or args.clients_per_process > 1:
+        run_requester_fleet(args)
+        return
+
+    state = RequesterState()
+    state.payloads = PayloadPool(args.req_payload_size, args.payload_kind, args.payload_pool_size)
+    logger.info("Starting Requester %s", state.client_id)
+    logger.info("Requests: %s, Payload: %s bytes (%s)", args.num_requests, args.req_payload_size, args.payload_kind)
+
+    requester_client = start_requester_client(args, state)
+    if not requester_client:
+        return
+        
+    logger.info("Requester %s: Starting benchmark...", state.client_id)
+    
+    total_benchmark_start_time = time.perf_counter()
+    run_requester_load(requester_client, state, args)
+    total_benchmark_end_time = time.perf_counter()
+    total_duration = total_benchmark_end_time - total_benchmark_start_time
+
+    print_requester_results(state, args, total_duration)
+
     safe_disconnect_client(requester_client, "Requester benchmark finished")
-    logger.info(f"Requester {state.client_id}: Benchmark completed")
+    logger.info("Requester %s: Benchmark completed", state.client_id)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="MQTT Request-Response Benchmark Tool")
-    parser.add_argument("role", choices=["requester", "responder"], help="Role to play")
+    parser.add_argument("role", choices=["requester", "responder", "publish", "codec", "tls", "connect"],
+                       help="Role to play (publish: micro-benchmark of publish calls/second, no responder needed; "
+                            "codec: payload codec size/speed comparison, no broker needed; "
+                            "tls: connect latency with and without TLS session resumption, --num_requests connects each, "
+                            "requires --bench_use_tls; connect: reconnect-storm benchmark with per-phase connect latency)")
     
     # Benchmark parameters
     parser.add_argument("--num_requests", type=int, default=DEFAULT_NUM_REQUESTS, 
@@ -576,14 +1420,52 @@ if __name__ == "__main__":
                        help=f"Request payload size in bytes (default: {DEFAULT_REQ_PAYLOAD_SIZE})")
     parser.add_argument("--res_payload_size", type=int, default=DEFAULT_RES_PAYLOAD_SIZE,
                        help=f"Response payload size in bytes (default: {DEFAULT_RES_PAYLOAD_SIZE})")
+    parser.add_argument("--payload_kind", "--payload-kind", type=str, choices=PAYLOAD_KINDS, default="text", dest="payload_kind",
+                       help="Payload content: text (random ASCII), incompressible (random bytes) or "
+                            "compressible (repeated block) (default: text)")
+    parser.add_argument("--payload_pool_size", "--payload-pool-size", type=int, default=DEFAULT_PAYLOAD_POOL_SIZE,
+                       dest="payload_pool_size",
+                       help=f"Number of distinct payloads generated at startup and reused round-robin (default: {DEFAULT_PAYLOAD_POOL_SIZE})")
     parser.add_argument("--qos", type=int, choices=[0, 1, 2], default=DEFAULT_QOS,
                        help=f"MQTT QoS level (default: {DEFAULT_QOS})")
     parser.add_argument("--request_topic", type=str, default=DEFAULT_REQUEST_TOPIC,
                        help=f"Request topic (default: {DEFAULT_REQUEST_TOPIC})")
     parser.add_argument("--response_topic_base", type=str, default=DEFAULT_RESPONSE_TOPIC_BASE,
                        help=f"Response topic base (default: {DEFAULT_RESPONSE_TOPIC_BASE})")
+    parser.add_argument("--response_mode", type=str, choices=RESPONSE_SUBSCRIPTION_MODES, default=RESPONSE_MODE_PER_REQUEST,
+                       help="per_request: SUBSCRIBE/UNSUBSCRIBE a response topic per request; "
+                            "wildcard: subscribe once to <response_topic_base>/<client_id>/# at connect "
+                            f"(default: {RESPONSE_MODE_PER_REQUEST})")
     parser.add_argument("--delay", type=float, default=INTER_REQUEST_DELAY_S, dest="inter_request_delay_s",
                        help=f"Delay between requests in seconds (default: {INTER_REQUEST_DELAY_S})")
+    parser.add_argument("--concurrency", type=int, default=None,
+                       help="Pipelined mode: keep up to N requests in flight (default: closed loop, 1 in flight)")
+    parser.add_argument("--target_rate", "--target-rate", type=float, default=None, dest="target_rate",
+                       help="Open-loop mode: issue requests at R requests/second regardless of responses")
+    parser.add_argument("--publish_topic", "--publish-topic", type=str, default=DEFAULT_PUBLISH_TOPIC, dest="publish_topic",
+                       help=f"(publish role) Topic the publish micro-benchmark writes to (default: {DEFAULT_PUBLISH_TOPIC})")
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS,
+                       help=f"(connect role) Number of connections to open (default: {DEFAULT_CONNECTIONS})")
+    parser.add_argument("--connect_rate", "--connect-rate", type=float, default=None, dest="connect_rate",
+                       help="(connect role) Start connections at R per second (default: as fast as the workers allow)")
+    parser.add_argument("--connect_workers", "--connect-workers", type=int, default=DEFAULT_CONNECT_WORKERS,
+                       dest="connect_workers",
+                       help=f"(connect role) Threads running connection attempts in parallel (default: {DEFAULT_CONNECT_WORKERS})")
+    parser.add_argument("--histogram_output", "--histogram-output", type=str, default=None, dest="histogram_output",
+                       help="Write the full RTT distribution (.hgrm percentile format, ms) to this file")
+
+    parser.add_argument("--processes", type=int, default=1,
+                       help="Requester fleet / connect role: number of worker processes (default: 1)")
+    parser.add_argument("--clients_per_process", "--clients-per-process", type=int, default=1, dest="clients_per_process",
+                       help="Requester fleet: requester clients per worker process, each sending --num_requests (default: 1)")
+
+    parser.add_argument("--responders", type=int, default=1,
+                       help="Responder pool: number of responder processes, one client each (default: 1)")
+    parser.add_argument("--shared_group", "--shared-group", type=str, default=None, dest="shared_group",
+                       help="Subscribe responders via the MQTT v5 shared subscription $share/<group>/<request_topic> "
+                            f"(default with --responders > 1: {DEFAULT_SHARED_GROUP})")
+    parser.add_argument("--responder_workers", "--responder-workers", type=int, default=1, dest="responder_workers",
+                       help="Threads per responder that build and publish responses off the network thread (default: 1 = inline)")
 
     # Benchmark broker connection parameters
     parser.add_argument("--bench_broker_host", type=str, default="localhost", 
@@ -594,6 +1476,8 @@ if __name__ == "__main__":
                        help="Use TLS for benchmark broker connection")
     parser.add_argument("--bench_ca_cert", type=str, default=None, 
                        help="Path to CA certificate for TLS")
+    parser.add_argument("--no_tls_resumption", "--no-tls-resumption", action="store_false", dest="tls_resumption",
+                       help="Do a full TLS handshake on every connection instead of resuming the cached TLS session")
     parser.add_argument("--bench_username", type=str, default=None, 
                        help="Username for broker authentication")
     parser.add_argument("--bench_password", type=str, default=None, 
@@ -609,11 +1493,11 @@ if __name__ == "__main__":
 
     # Configure logging based on arguments
     if args.debug:
-        logging.getLogger().setLevel(logging.DEBUG)
+        set_log_level("benchmark", logging.DEBUG)
     elif args.verbose:
-        logging.getLogger().setLevel(logging.INFO)
+        set_log_level("benchmark", logging.INFO)
     else:
-        logging.getLogger().setLevel(logging.WARNING)
+        set_log_level("benchmark", logging.WARNING)
 
     # Validate arguments
     if args.num_requests <= 0:
@@ -624,23 +1508,70 @@ if __name__ == "__main__":
         print("Error: payload sizes must be positive")
         sys.exit(1)
         
+    if args.payload_pool_size <= 0:
+        print("Error: payload_pool_size must be positive")
+        sys.exit(1)
+
     if args.inter_request_delay_s < 0:
         print("Error: delay cannot be negative")
         sys.exit(1)
 
+    if args.concurrency is not None and args.concurrency <= 0:
+        print("Error: concurrency must be positive")
+        sys.exit(1)
+
+    if args.target_rate is not None and args.target_rate <= 0:
+        print("Error: target rate must be positive")
+        sys.exit(1)
+
+    if args.processes <= 0 or args.clients_per_process <= 0:
+        print("Error: processes and clients_per_process must be positive")
+        sys.exit(1)
+
+    if args.responders <= 0 or args.responder_workers <= 0:
+        print("Error: responders and responder_workers must be positive")
+        sys.exit(1)
+
+    if args.connections <= 0 or args.connect_workers <= 0:
+        print("Error: connections and connect_workers must be positive")
+        sys.exit(1)
+
+    if args.connect_rate is not None and args.connect_rate <= 0:
+        print("Error: connect rate must be positive")
+        sys.exit(1)
+
+    if args.role == "tls" and not args.bench_use_tls:
+        print("Error: the tls role requires --bench_use_tls")
+        sys.exit(1)
+
+    if args.responders > 1 and not args.shared_group:
+        # Without a shared subscription every responder would answer every request
+        args.shared_group = DEFAULT_SHARED_GROUP
+
     # Print configuration
-    logger.info(f"Benchmark Target: {args.bench_broker_host}:{args.bench_broker_port}")
-    logger.info(f"TLS Enabled: {args.bench_use_tls}")
-    logger.info(f"Authentication: {'Yes' if args.bench_username else 'No'}")
+    logger.info("Benchmark Target: %s:%s", args.bench_broker_host, args.bench_broker_port)
+    logger.info("TLS Enabled: %s", args.bench_use_tls)
+    logger.info("Authentication: %s", 'Yes' if args.bench_username else 'No')
 
     try:
         if args.role == "responder":
-            run_responder(args)
+            if args.responders > 1:
+                run_responder_pool(args)
+            else:
+                run_responder(args)
         elif args.role == "requester":
             run_requester(args)
+        elif args.role == "publish":
+            run_publish_benchmark(args)
+        elif args.role == "codec":
+            run_codec_benchmark(args)
+        elif args.role == "tls":
+            run_tls_benchmark(args)
+        elif args.role == "connect":
+            run_connect_benchmark(args)
     except KeyboardInterrupt:
         logger.info("Benchmark interrupted by user")
         sys.exit(0)
     except Exception as e:
-        logger.error(f"Benchmark failed: {e}")
+        logger.error("Benchmark failed: %s", e)
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,218 @@
+# common/device_table.py
+# Tabel status per device (per client_id) untuk panel yang memantau banyak sensor dan lampu.
+# Setiap device mendapat satu slot integer; field disimpan di array/list paralel berindeks slot
+# (bukan satu dict per device), dan agregat bergulir (min/max/mean) dihitung dari ring bucket waktu,
+# sehingga update O(1) dan memori per device tetap walaupun jumlah device puluhan ribu.
+from array import array
+import heapq
+import math
+import threading
+import time
+
+DEVICE_KIND_SENSOR = "sensor"
+DEVICE_KIND_LAMP = "lamp"
+DEVICE_METRICS = ("temperature", "humidity")
+DEVICE_WINDOW_S_DEFAULT = 60.0
+DEVICE_WINDOW_BUCKETS_DEFAULT = 6
+STATUS_ONLINE = "ONLINE"
+
+class RollingWindow:
+    """min/max/mean bergulir untuk banyak deret (satu per slot) dalam jendela waktu tetap.
+
+    Jendela dibagi menjadi `buckets` bucket berdurasi window_s / buckets; setiap bucket menyimpan
+    count/sum/min/max. Agregat mencakup bucket yang masih berada di jendela, jadi rentang efektifnya
+    antara (buckets - 1) dan buckets bucket terakhir. Tidak thread-safe (DeviceTable memegang lock).
+    """
+    def __init__(self, window_s=DEVICE_WINDOW_S_DEFAULT, buckets=DEVICE_WINDOW_BUCKETS_DEFAULT):
+        if window_s <= 0 or buckets < 1:
+            raise ValueError("window_s must be positive and buckets at least 1")
+        self.window_s = float(window_s)
+        self.buckets = int(buckets)
+        self.bucket_s = self.window_s / self.buckets
+        self._epochs = array('q') # Nomor bucket waktu yang sedang disimpan (-1 = kosong)
+        self._counts = array('Q')
+        self._sums = array('d')
+        self._mins = array('d')
+        self._maxs = array('d')
+        self.series_count = 0
+
+    def add_series(self):
+        """Tambah satu deret kosong; return indeksnya."""
+        self._epochs.extend([-1] * self.buckets)
+        zeros = [0] * self.buckets
+        self._counts.extend(zeros)
+        self._sums.extend(zeros)
+        self._mins.extend(zeros)
+        self._maxs.extend(zeros)
+        self.series_count += 1
+        return self.series_count - 1
+
+    def record(self, series, value, now):
+        epoch = int(now // self.bucket_s)
+        index = series * self.buckets + epoch % self.buckets
+        if self._epochs[index] != epoch: # Bucket berisi data lama (sudah keluar jendela): mulai ulang
+            self._epochs[index] = epoch
+            self._counts[index] = 1
+            self._sums[index] = self._mins[index] = self._maxs[index] = value
+            return
+        self._counts[index] += 1
+        self._sums[index] += value
+        if value < self._mins[index]:
+            self._mins[index] = value
+        elif value > self._maxs[index]:
+            self._maxs[index] = value
+
+    def aggregate(self, series, now):
+        """(count, min, max, mean) dalam jendela, atau None bila tidak ada data."""
+        oldest_epoch = int(now // self.bucket_s) - self.buckets + 1
+        count, total, low, high = 0, 0.0, math.inf, -math.inf
+        start = series * self.buckets
+        for index in range(start, start + self.buckets):
+            if not self._counts[index] or self._epochs[index] < oldest_epoch: # Kosong atau sudah keluar jendela
+                continue
+            count += self._counts[index]
+            total += self._sums[index]
+            low = min(low, self._mins[index])
+            high = max(high, self._maxs[index])
+        if not count:
+            return None
+        return count, low, high, total / count
+
+
+class DeviceTable:
+    """Status terakhir dan agregat bergulir untuk setiap device, dicari lewat client_id.
+
+    Per slot: jenis device, status koneksi (LWT), grup (mis. grup lampu dari payload LWT), state lampu,
+    waktu terakhir terlihat, nilai terakhir dan RollingWindow per metrik. Selain itu ada satu RollingWindow seluruh armada per metrik.
+    Semua method thread-safe (network thread menulis, thread renderer membaca).
+    """
+    def __init__(self, window_s=DEVICE_WINDOW_S_DEFAULT, buckets=DEVICE_WINDOW_BUCKETS_DEFAULT, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._slots = {} # client_id -> slot
+        self.client_ids = [] # slot -> client_id
+        self.kinds = []
+        self.statuses = [] # Status koneksi dari LWT (None = belum pernah ada LWT)
+        self.states = [] # State lampu ("ON"/"OFF"), None untuk sensor
+        self.groups = [] # frozenset nama grup yang diumumkan device (kosong bila tidak ada)
+        self.last_seen = array('d')
+        self.last_values = {metric: array('d') for metric in DEVICE_METRICS} # NaN = belum ada nilai
+        self._windows = {metric: RollingWindow(window_s, buckets) for metric in DEVICE_METRICS}
+        self._fleet_windows = {metric: RollingWindow(window_s, buckets) for metric in DEVICE_METRICS}
+        for window in self._fleet_windows.values():
+            window.add_series()
+        self._summary = {} # kind -> {'total', 'online', 'on'}, diperbarui setiap perubahan (summary() O(1))
+        self.window_s = float(window_s)
+
+    def __len__(self):
+        return len(self.client_ids)
+
+    def _slot(self, client_id, kind):
+        # Dipanggil dengan lock dipegang
+        slot = self._slots.get(client_id)
+        if slot is None:
+            slot = len(self.client_ids)
+            self._slots[client_id] = slot
+            self.client_ids.append(client_id)
+            self.kinds.append(kind)
+            self.statuses.append(None)
+            self.states.append(None)
+            self.groups.append(frozenset())
+            self.last_seen.append(0.0)
+            for metric in DEVICE_METRICS:
+                self.last_values[metric].append(math.nan)
+                self._windows[metric].add_series()
+            self._kind_counts(kind)['total'] += 1
+        return slot
+
+    def _kind_counts(self, kind):
+        counts = self._summary.get(kind)
+        if counts is None:
+            counts = self._summary[kind] = {'total': 0, 'online': 0, 'on': 0}
+        return counts
+
+    def record_reading(self, client_id, metric, value, kind=DEVICE_KIND_SENSOR):
+        """Simpan satu pembacaan `metric` (mis. "temperature") dari client_id."""
+        now = self._clock()
+        value = float(value)
+        with self._lock:
+            slot = self._slot(client_id, kind)
+            self.last_seen[slot] = now
+            self.last_values[metric][slot] = value
+            self._windows[metric].record(slot, value, now)
+            self._fleet_windows[metric].record(0, value, now)
+
+    def set_status(self, client_id, status, kind, groups=None):
+        """Status koneksi (mis. dari LWT: ONLINE, OFFLINE_GRACEFUL, OFFLINE_UNEXPECTED).
+
+        `groups` (opsional) mengganti keanggotaan grup device; None = keanggotaan tidak berubah.
+        """
+        now = self._clock()
+        with self._lock:
+            slot = self._slot(client_id, kind)
+            counts = self._kind_counts(self.kinds[slot])
+            counts['online'] += (status == STATUS_ONLINE) - (self.statuses[slot] == STATUS_ONLINE)
+            self.statuses[slot] = status
+            self.last_seen[slot] = now
+            if groups is not None:
+                self.groups[slot] = frozenset(groups)
+
+    def set_state(self, client_id, state, kind=DEVICE_KIND_LAMP):
+        now = self._clock()
+        with self._lock:
+            slot = self._slot(client_id, kind)
+            counts = self._kind_counts(self.kinds[slot])
+            counts['on'] += (state == "ON") - (self.states[slot] == "ON")
+            self.states[slot] = state
+            self.last_seen[slot] = now
+
+    def client_ids_where(self, kind=None, status=None, group=None):
+        """client_id device yang cocok dengan semua kriteria yang diberikan (None = tidak difilter). O(N)."""
+        with self._lock:
+            return [
+                client_id for slot, client_id in enumerate(self.client_ids)
+                if (kind is None or self.kinds[slot] == kind)
+                and (status is None or self.statuses[slot] == status)
+                and (group is None or group in self.groups[slot])
+            ]
+
+    def device_aggregate(self, client_id, metric):
+        """(count, min, max, mean) metric untuk satu device dalam jendela, atau None."""
+        with self._lock:
+            slot = self._slots.get(client_id)
+            if slot is None:
+                return None
+            return self._windows[metric].aggregate(slot, self._clock())
+
+    def fleet_aggregate(self, metric):
+        """(count, min, max, mean) metric untuk semua pembacaan armada dalam jendela, atau None."""
+        with self._lock:
+            return self._fleet_windows[metric].aggregate(0, self._clock())
+
+    def summary(self):
+        """{kind: {'total', 'online', 'on'}}; 'on' = jumlah lampu dengan state ON."""
+        with self._lock:
+            return {kind: dict(counts) for kind, counts in self._summary.items()}
+
+    def recent_devices(self, limit):
+        """Baris untuk `limit` device yang paling baru terlihat (terbaru dulu)."""
+        with self._lock:
+            last_seen = array('d', self.last_seen) # Salinan cepat; pencarian O(N) dilakukan tanpa lock
+        slots = heapq.nlargest(limit, range(len(last_seen)), key=last_seen.__getitem__)
+        with self._lock:
+            now = self._clock()
+            rows = []
+            for slot in slots:
+                row = {
+                    'client_id': self.client_ids[slot],
+                    'kind': self.kinds[slot],
+                    'status': self.statuses[slot],
+                    'state': self.states[slot],
+                    'age_s': now - self.last_seen[slot],
+                }
+                for metric in DEVICE_METRICS:
+                    last_value = self.last_values[metric][slot]
+                    row[metric] = None if math.isnan(last_value) else last_value
+                    row[f"{metric}_window"] = self._windows[metric].aggregate(slot, now)
+                rows.append(row)
+        return rows
@@ -0,0 +1,181 @@
+# common/latency_histogram.py
+# Histogram latency berukuran tetap (gaya HDR: bucket log-linear) untuk benchmark jangka panjang.
+# Nilai disimpan sebagai integer mikrodetik; presisi relatif dijaga pada 3 angka penting.
+from array import array
+import math
+
+HISTOGRAM_LOWEST_US = 1 # Resolusi terkecil: 1 mikrodetik
+HISTOGRAM_HIGHEST_US = 3600 * 1000 * 1000 # Nilai terbesar yang bisa dilacak: 1 jam
+HISTOGRAM_SIGNIFICANT_FIGURES = 3
+
+DEFAULT_PERCENTILES = (50.0, 90.0, 99.0, 99.9, 99.99)
+
+class LatencyHistogram:
+    """Histogram latency log-linear dengan memori tetap yang bisa digabung (merge) antar proses/klien.
+
+    Tidak thread-safe: pemanggil yang berbagi histogram antar thread harus memegang lock sendiri.
+    """
+    def __init__(self, highest_us=HISTOGRAM_HIGHEST_US, significant_figures=HISTOGRAM_SIGNIFICANT_FIGURES):
+        if not 1 <= significant_figures <= 5:
+            raise ValueError("significant_figures must be between 1 and 5")
+        self.highest_us = int(highest_us)
+        self.significant_figures = significant_figures
+
+        # Setiap bucket dibagi menjadi sub-bucket linear; jumlahnya pangkat dua >= 2 * 10^sig_figs
+        largest_single_unit = 2 * 10 ** significant_figures
+        self._sub_bucket_count_magnitude = max(1, math.ceil(math.log2(largest_single_unit)))
+        self._sub_bucket_half_count_magnitude = self._sub_bucket_count_magnitude - 1
+        self._sub_bucket_count = 1 << self._sub_bucket_count_magnitude
+        self._sub_bucket_half_count = self._sub_bucket_count >> 1
+        self._sub_bucket_mask = self._sub_bucket_count - 1
+
+        # Jumlah bucket (masing-masing dua kali rentang sebelumnya) untuk mencakup highest_us
+        smallest_untrackable = self._sub_bucket_count
+        bucket_count = 1
+        while smallest_untrackable <= self.highest_us:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+        self.bucket_count = bucket_count
+        self._counts = array('Q', bytes(8 * ((bucket_count + 1) << self._sub_bucket_half_count_magnitude)))
+
+        self.total_count = 0
+        self.clamped_count = 0 # Sampel di atas highest_us yang dicatat sebagai highest_us
+        self.min_us = None
+        self.max_us = None
+        self._sum_us = 0
+        self._sum_sq_us = 0
+
+    # --- Indeks bucket ---
+    def _counts_index(self, value_us):
+        bucket_idx = (value_us | self._sub_bucket_mask).bit_length() - self._sub_bucket_count_magnitude
+        sub_bucket_idx = value_us >> bucket_idx
+        return ((bucket_idx + 1) << self._sub_bucket_half_count_magnitude) + (sub_bucket_idx - self._sub_bucket_half_count)
+
+    def _bucket_bounds(self, index):
+        # Return (nilai terendah, nilai tertinggi) yang setara untuk indeks counts
+        bucket_idx = (index >> self._sub_bucket_half_count_magnitude) - 1
+        sub_bucket_idx = (index & (self._sub_bucket_half_count - 1)) + self._sub_bucket_half_count
+        if bucket_idx < 0:
+            sub_bucket_idx -= self._sub_bucket_half_count
+            bucket_idx = 0
+        lowest = sub_bucket_idx << bucket_idx
+        return lowest, lowest + (1 << bucket_idx) - 1
+
+    # --- Pencatatan ---
+    def record(self, seconds, count=1):
+        """Catat satu sampel latency dalam detik."""
+        self.record_us(int(round(seconds * 1_000_000)), count)
+
+    def record_us(self, value_us, count=1):
+        if value_us < 0:
+            value_us = 0
+        if value_us > self.highest_us:
+            value_us = self.highest_us
+            self.clamped_count += count
+        self._counts[self._counts_index(value_us)] += count
+        self.total_count += count
+        self._sum_us += value_us * count
+        self._sum_sq_us += value_us * value_us * count
+        if self.min_us is None or value_us < self.min_us:
+            self.min_us = value_us
+        if self.max_us is None or value_us > self.max_us:
+            self.max_us = value_us
+
+    def merge(self, other):
+        """Tambahkan isi histogram lain (konfigurasi harus sama) ke histogram ini."""
+        if (other.highest_us, other.significant_figures) != (self.highest_us, self.significant_figures):
+            raise ValueError("Cannot merge histograms with different ranges or precision")
+        if not other.total_count:
+            return self
+        counts = self._counts
+        for index, count in enumerate(other._counts):
+            if count:
+                counts[index] += count
+        self.total_count += other.total_count
+        self.clamped_count += other.clamped_count
+        self._sum_us += other._sum_us
+        self._sum_sq_us += other._sum_sq_us
+        self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+        self.max_us = other.max_us if self.max_us is None else max(self.max_us, other.max_us)
+        return self
+
+    def snapshot(self):
+        """Salinan independen (mis. untuk dikirim ke proses lain atau dilaporkan sementara run berjalan)."""
+        copy = LatencyHistogram(self.highest_us, self.significant_figures)
+        copy._counts = array('Q', self._counts)
+        copy.total_count, copy.clamped_count = self.total_count, self.clamped_count
+        copy.min_us, copy.max_us = self.min_us, self.max_us
+        copy._sum_us, copy._sum_sq_us = self._sum_us, self._sum_sq_us
+        return copy
+
+    # --- Statistik (semua dalam detik) ---
+    def __len__(self):
+        return self.total_count
+
+    @property
+    def min(self):
+        return self.min_us / 1_000_000 if self.min_us is not None else None
+
+    @property
+    def max(self):
+        return self.max_us / 1_000_000 if self.max_us is not None else None
+
+    @property
+    def mean(self):
+        return self._sum_us / self.total_count / 1_000_000 if self.total_count else None
+
+    @property
+    def stdev(self):
+        # Standar deviasi sampel (sama seperti statistics.stdev), dari jumlah dan jumlah kuadrat yang eksak
+        n = self.total_count
+        if n < 2:
+            return None
+        variance = (self._sum_sq_us - self._sum_us * self._sum_us / n) / (n - 1)
+        return math.sqrt(max(variance, 0.0)) / 1_000_000
+
+    def percentiles(self, percentiles=DEFAULT_PERCENTILES):
+        """Return {persentil: detik} dalam satu lintasan atas bucket.
+
+        Nilai yang dilaporkan adalah batas atas bucket tempat persentil jatuh (dibatasi min/max eksak),
+        jadi tidak pernah meremehkan ekor distribusi.
+        """
+        if not self.total_count:
+            return {p: None for p in percentiles}
+        targets = sorted((max(1, math.ceil(p / 100.0 * self.total_count)), p) for p in percentiles)
+        results = {}
+        cumulative = 0
+        target_pos = 0
+        for index, count in enumerate(self._counts):
+            if not count:
+                continue
+            cumulative += count
+            while target_pos < len(targets) and cumulative >= targets[target_pos][0]:
+                value_us = min(max(self._bucket_bounds(index)[1], self.min_us), self.max_us)
+                results[targets[target_pos][1]] = value_us / 1_000_000
+                target_pos += 1
+            if target_pos == len(targets):
+                break
+        return results
+
+    def percentile(self, percentile):
+        return self.percentiles((percentile,))[percentile]
+
+    def write_distribution(self, path):
+        """Tulis distribusi lengkap dalam format .hgrm (bisa diplot dengan HdrHistogram plotter). Nilai dalam ms."""
+        with open(path, 'w', encoding='utf-8') as out_file:
+            out_file.write(f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}\n\n")
+            cumulative = 0
+            for index, count in enumerate(self._counts):
+                if not count:
+                    continue
+                cumulative += count
+                value_us = min(max(self._bucket_bounds(index)[1], self.min_us), self.max_us)
+                fraction = cumulative / self.total_count
+                inverse = f"{1.0 / (1.0 - fraction):14.2f}" if fraction < 1.0 else f"{'inf':>14}"
+                out_file.write(f"{value_us / 1000:12.3f} {fraction:14.12f} {cumulative:10d} {inverse}\n")
+            mean_ms = (self.mean or 0) * 1000
+            stdev_ms = (self.stdev or 0) * 1000
+            max_ms = (self.max or 0) * 1000
+            out_file.write(f"#[Mean    = {mean_ms:12.3f}, StdDeviation   = {stdev_ms:12.3f}]\n")
+            out_file.write(f"#[Max     = {max_ms:12.3f}, Total count    = {self.total_count:12d}]\n")
+            out_file.write(f"#[Buckets = {self.bucket_count:12d}, SubBuckets     = {self._sub_bucket_count:12d}]\n")
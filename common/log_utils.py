@@ -0,0 +1,135 @@
+# common/log_utils.py
+# Facade logging bersama: satu logger per subsistem ("mqtt_utils", "sensor", "lamp", "panel", ...),
+# level per subsistem dari settings.json ("logging_settings"), dan handler berbasis antrean
+# (QueueHandler -> QueueListener) sehingga I/O stdout tidak dilakukan di thread network Paho.
+# Pakai format lazy: log.info("Published mid %s to '%s'", mid, topic) - argumen hanya diformat bila
+# level aktif, jadi log yang dimatikan di hot path hampir tanpa biaya.
+import atexit
+import logging
+import logging.handlers
+import multiprocessing
+import multiprocessing.util
+import os
+import queue
+import sys
+
+LOGGER_NAMESPACE = "grupm"
+LOG_FORMAT_DEFAULT = "%(levelname)s (%(subsystem)s): %(message)s"
+LOG_LEVEL_DEFAULT = "INFO"
+LOG_QUEUE_SIZE_DEFAULT = 10000
+
+_listener = None
+_queue_handler = None
+_configured = False
+
+class _SubsystemFilter(logging.Filter):
+    # Atribut `subsystem` (nama logger tanpa namespace) untuk format baris log
+    def filter(self, record):
+        prefix = LOGGER_NAMESPACE + "."
+        record.subsystem = record.name[len(prefix):] if record.name.startswith(prefix) else record.name
+        return True
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler yang membuang record saat antrean penuh, jadi thread pemanggil tidak pernah menunggu I/O."""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def _parse_level(level, default):
+    if isinstance(level, int):
+        return level
+    parsed = logging.getLevelName(str(level).upper())
+    if isinstance(parsed, int):
+        return parsed
+    print(f"WARNING (log_utils): Unknown log level '{level}', using {logging.getLevelName(default)}.")
+    return default
+
+def get_logger(subsystem):
+    """Logger untuk satu subsistem; level-nya diatur lewat logging_settings.levels.<subsystem>."""
+    return logging.getLogger(f"{LOGGER_NAMESPACE}.{subsystem}")
+
+def set_log_level(subsystem, level):
+    """Ubah level satu subsistem saat runtime (mis. dari argumen --debug); subsystem None = level default semua."""
+    logger = get_logger(subsystem) if subsystem else logging.getLogger(LOGGER_NAMESPACE)
+    logger.setLevel(_parse_level(level, logging.INFO))
+
+def configure_logging(logging_settings=None, force=False):
+    """Pasang handler pada namespace logger proyek dan set level per subsistem.
+
+    logging_settings (bagian "logging_settings" settings.json):
+      level: level default semua subsistem; levels: {subsistem: level}; format: format baris log;
+      use_queue: False = tulis langsung ke stdout; queue_size: batas antrean (record dibuang bila penuh).
+    Dipanggil oleh mqtt_utils saat settings dimuat; panggilan berikutnya diabaikan kecuali force=True.
+    """
+    global _listener, _queue_handler, _configured
+    if _configured and not force:
+        return
+    logging_settings = logging_settings or {}
+    shutdown_logging() # force=True: ganti handler lama (setelah antreannya dikosongkan)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(logging_settings.get("format", LOG_FORMAT_DEFAULT)))
+    stream_handler.addFilter(_SubsystemFilter())
+
+    root = logging.getLogger(LOGGER_NAMESPACE)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.propagate = False
+    root.setLevel(_parse_level(logging_settings.get("level", LOG_LEVEL_DEFAULT), logging.INFO))
+    for subsystem, level in logging_settings.get("levels", {}).items():
+        set_log_level(subsystem, level)
+
+    if logging_settings.get("use_queue", True):
+        _queue_handler = _DroppingQueueHandler(queue.Queue(logging_settings.get("queue_size", LOG_QUEUE_SIZE_DEFAULT)))
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler)
+        _listener.start()
+        root.addHandler(_queue_handler)
+        if multiprocessing.parent_process() is not None:
+            _register_child_shutdown()
+    else:
+        root.addHandler(stream_handler)
+    _configured = True
+
+def _register_child_shutdown():
+    # Proses anak multiprocessing keluar lewat os._exit (atexit tidak jalan); finalizer mengosongkan antrean
+    multiprocessing.util.Finalize(None, shutdown_logging, exitpriority=0)
+
+def _restart_listener_after_fork():
+    # Thread listener tidak ikut ter-fork: proses anak mendapat antrean dan listener baru
+    global _listener
+    if _listener is None or _queue_handler is None:
+        return
+    _queue_handler.queue = queue.Queue(_queue_handler.queue.maxsize)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *_listener.handlers)
+    _listener.start()
+
+def _after_multiprocessing_fork(_):
+    # Process._bootstrap mengosongkan registri finalizer setelah fork, jadi finalizer didaftarkan di sini
+    if _listener is not None:
+        _register_child_shutdown()
+
+def shutdown_logging():
+    """Kosongkan antrean log dan hentikan thread listener (dipanggil otomatis saat proses keluar)."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        root = logging.getLogger(LOGGER_NAMESPACE)
+        # Log setelah shutdown (mis. dari handler atexit lain) ditulis langsung, bukan masuk antrean tanpa listener
+        for handler in _listener.handlers:
+            root.addHandler(handler)
+        root.removeHandler(_queue_handler)
+        _listener.stop() # Tulis sisa record di antrean
+        _listener = None
+    if _queue_handler is not None and _queue_handler.dropped:
+        print(f"WARNING (log_utils): {_queue_handler.dropped} log records dropped (queue full).")
+    _queue_handler = None
+
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
+multiprocessing.util.register_after_fork(shutdown_logging, _after_multiprocessing_fork)
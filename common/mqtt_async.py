@@ -0,0 +1,333 @@
+# common/mqtt_async.py
+# Lapisan asyncio di atas create_mqtt_client(): connect, publish dan subscribe bisa di-await,
+# dan pesan masuk dibaca dengan `async for`. Socket Paho didaftarkan langsung ke event loop
+# (add_reader/add_writer + loop_misc berkala), jadi tidak ada thread loop_start() per client
+# dan tidak ada polling time.sleep(). Ribuan client logis bisa berjalan dalam satu proses.
+import asyncio
+import threading
+
+import paho.mqtt.client as mqtt
+
+from mqtt_utils import (
+    GLOBAL_SETTINGS,
+    create_mqtt_client,
+    connect_client,
+    publish_message,
+    subscribe_to_topics,
+    SUBACK_TIMEOUT_DEFAULT,
+    _is_suback_failure,
+)
+from paho.mqtt.properties import Properties
+from paho.mqtt.packettypes import PacketTypes
+from log_utils import get_logger
+
+CONNECT_TIMEOUT_DEFAULT = 15 # detik menunggu CONNACK
+ACK_TIMEOUT_DEFAULT = 30 # detik menunggu PUBACK/PUBCOMP/UNSUBACK
+MISC_LOOP_INTERVAL_S = 1.0 # keepalive/retry Paho (loop_misc)
+
+log = get_logger("mqtt_async")
+_STREAM_END = object() # Penanda akhir aliran pesan (setelah disconnect)
+
+class MqttAsyncError(Exception):
+    """Operasi MQTT async gagal (connect ditolak, subscribe ditolak, koneksi putus, dsb)."""
+
+class AsyncMqttClient:
+    """Client MQTT berbasis asyncio yang memakai konfigurasi yang sama dengan create_mqtt_client().
+
+    Contoh:
+        async with AsyncMqttClient("sensor_001") as client:
+            await client.subscribe([("iot/#", 1)])
+            await client.publish("iot/x", "hello", qos=1)
+            async for msg in client.messages():
+                ...
+    """
+    def __init__(self, client_id, userdata=None, lwt_topic=None, lwt_payload_online=None,
+                 lwt_payload_offline=None, lwt_qos=None, lwt_retain=None, max_queued_messages=0):
+        self.client_id = client_id
+        self._loop = None
+        self._connect_future = None
+        self._disconnect_future = None
+        self._pending_acks = {} # {mid: Future} untuk publish (PUBACK/PUBCOMP, atau terkirim untuk QoS 0)
+        self._ack_lock = threading.RLock() # publish()+pendaftaran future vs _on_publish (RLock: QoS 0 bisa ack di dalam publish)
+        self._acks_during_publish = None # set mid yang ack-nya datang selama publish() berjalan, selain itu None
+        self._pending_subs = {} # {mid: Future} menunggu SUBACK
+        self._pending_unsubs = {} # {mid: Future} menunggu UNSUBACK
+        self._messages = asyncio.Queue(maxsize=max_queued_messages)
+        self._misc_task = None
+        self.dropped_messages = 0 # Pesan yang dibuang karena antrean penuh
+
+        self._client = create_mqtt_client(
+            client_id,
+            on_connect_custom=self._on_connect,
+            on_message_custom=self._on_message,
+            on_disconnect_custom=self._on_disconnect,
+            on_subscribe_custom=self._on_subscribe,
+            on_publish_custom=self._on_publish,
+            userdata=userdata,
+            lwt_topic=lwt_topic,
+            lwt_payload_online=lwt_payload_online,
+            lwt_payload_offline=lwt_payload_offline,
+            lwt_qos=lwt_qos,
+            lwt_retain=lwt_retain,
+            auto_connect=False,
+            managed_reconnect=False, # Loop dijalankan oleh event loop asyncio, bukan thread reconnect Paho
+        )
+        if self._client is None:
+            raise MqttAsyncError(f"Could not create MQTT client '{client_id}'")
+        self._client.on_unsubscribe = self._on_unsubscribe
+        self._client.on_socket_open = self._on_socket_open
+        self._client.on_socket_close = self._on_socket_close
+        self._client.on_socket_register_write = self._on_socket_register_write
+        self._client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    @property
+    def client(self):
+        # Client Paho di bawahnya (untuk fungsi mqtt_utils lain yang butuh objek client)
+        return self._client
+
+    def is_connected(self):
+        return self._client.is_connected()
+
+    # --- Integrasi socket dengan event loop ---
+    def _in_loop(self, func, *args):
+        # connect() blocking dijalankan di executor; callback socket dari thread itu dipindah ke loop
+        if self._loop is None:
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            func(*args)
+        else:
+            self._loop.call_soon_threadsafe(func, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._in_loop(self._loop_add_reader, sock)
+
+    def _loop_add_reader(self, sock):
+        self._loop.add_reader(sock, self._on_readable, sock)
+
+    def _on_readable(self, sock):
+        self._client.loop_read()
+        # Data TLS yang sudah didekripsi tidak terlihat oleh select(); baca habis selagi ada
+        pending = getattr(sock, 'pending', None)
+        while pending is not None and self._client.socket() is sock and pending() > 0:
+            self._client.loop_read()
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._in_loop(self._loop_remove_socket, sock)
+
+    def _loop_remove_socket(self, sock):
+        try:
+            self._loop.remove_reader(sock)
+            self._loop.remove_writer(sock)
+        except (ValueError, OSError):
+            pass # Socket sudah ditutup
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._in_loop(self._loop_add_writer, sock)
+
+    def _loop_add_writer(self, sock):
+        try:
+            self._loop.add_writer(sock, self._client.loop_write)
+        except (ValueError, OSError):
+            pass
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._in_loop(self._loop_remove_writer, sock)
+
+    def _loop_remove_writer(self, sock):
+        try:
+            self._loop.remove_writer(sock)
+        except (ValueError, OSError):
+            pass
+
+    async def _misc_loop(self):
+        while True:
+            await asyncio.sleep(MISC_LOOP_INTERVAL_S)
+            if self._client.loop_misc() == mqtt.MQTT_ERR_NO_CONN and not self._client.is_connected():
+                if self._connect_future is None or self._connect_future.done():
+                    return
+
+    # --- Callback Paho (semuanya berjalan di thread event loop) ---
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        future = self._connect_future
+        if future is None or future.done():
+            return
+        if rc == 0:
+            future.set_result(flags)
+        else:
+            future.set_exception(MqttAsyncError(f"Connection refused (RC: {rc})"))
+
+    def _on_disconnect(self, client, userdata, rc, properties=None):
+        error = MqttAsyncError(f"Disconnected (RC: {rc})")
+        if self._connect_future is not None and not self._connect_future.done():
+            self._connect_future.set_exception(error)
+        for pending in (self._pending_acks, self._pending_subs, self._pending_unsubs):
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            pending.clear()
+        if self._disconnect_future is not None and not self._disconnect_future.done():
+            self._disconnect_future.set_result(rc)
+        self._put_message(_STREAM_END, force=True)
+
+    def _on_publish(self, client, userdata, mid, *args):
+        with self._ack_lock:
+            future = self._pending_acks.pop(mid, None)
+            if future is None:
+                # Ack di dalam publish() milik kita (mis. QoS 0 langsung terkirim) dicatat untuk pemanggil itu saja;
+                # mid lain tanpa future (mis. publish LWT "online") dibuang agar tidak cocok dengan mid yang dipakai ulang
+                if self._acks_during_publish is not None:
+                    self._acks_during_publish.add(mid)
+                return
+        if not future.done():
+            future.set_result(mid)
+
+    def _on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
+        future = self._pending_subs.pop(mid, None)
+        if future is None or future.done():
+            return
+        granted = list(granted_qos) if granted_qos is not None else []
+        if any(_is_suback_failure(g) for g in granted):
+            future.set_exception(MqttAsyncError(f"Subscription rejected (mid: {mid}, granted: {[str(g) for g in granted]})"))
+        else:
+            future.set_result(granted)
+
+    def _on_unsubscribe(self, client, userdata, mid, *args):
+        future = self._pending_unsubs.pop(mid, None)
+        if future is not None and not future.done():
+            future.set_result(mid)
+
+    def _on_message(self, client, userdata, msg):
+        self._put_message(msg)
+
+    def _put_message(self, item, force=False):
+        try:
+            self._messages.put_nowait(item)
+        except asyncio.QueueFull:
+            if not force:
+                self.dropped_messages += 1
+                return
+            self._messages.get_nowait() # Buang pesan tertua agar penanda akhir tetap masuk
+            self.dropped_messages += 1
+            self._messages.put_nowait(item)
+
+    # --- API publik ---
+    async def connect(self, timeout=CONNECT_TIMEOUT_DEFAULT):
+        """Connect dan tunggu CONNACK. Return flags CONNACK."""
+        self._loop = asyncio.get_running_loop()
+        self._connect_future = self._loop.create_future()
+        # TCP connect + TLS handshake bersifat blocking di Paho: jalankan di executor
+        if not await self._loop.run_in_executor(None, connect_client, self._client):
+            raise MqttAsyncError(f"Could not connect '{self.client_id}' to the broker")
+        if self._misc_task is None or self._misc_task.done():
+            self._misc_task = self._loop.create_task(self._misc_loop())
+        try:
+            return await asyncio.wait_for(self._connect_future, timeout)
+        except asyncio.TimeoutError:
+            raise MqttAsyncError(f"No CONNACK for '{self.client_id}' within {timeout}s") from None
+
+    async def publish(self, topic, payload, qos=None, retain=False, timeout=ACK_TIMEOUT_DEFAULT, profile=None, **publish_kwargs):
+        """Publish dan tunggu sampai selesai: PUBACK (QoS 1), PUBCOMP (QoS 2) atau terkirim ke socket (QoS 0).
+
+        publish_kwargs diteruskan ke publish_message() (message_expiry_interval, response_topic, dst).
+        Dengan `profile` (PublishProfile), properties dan retain diambil dari profil; topic None = topik profil.
+        """
+        if profile is not None:
+            topic = topic or profile.topic
+        with self._ack_lock: # Future terdaftar sebelum _on_publish lain bisa mencari mid ini
+            self._acks_during_publish = set()
+            try:
+                if profile is not None:
+                    result = profile.publish(self._client, payload, topic=topic, qos=qos, **publish_kwargs)
+                else:
+                    result = publish_message(self._client, topic, payload, qos=qos, retain=retain, **publish_kwargs)
+                acked = result is not None and result.mid in self._acks_during_publish
+            finally:
+                self._acks_during_publish = None
+            if result is None or result.rc != mqtt.MQTT_ERR_SUCCESS:
+                raise MqttAsyncError(f"Publish to '{topic}' failed (RC: {result.rc if result else 'N/A'})")
+            if acked:
+                return result.mid
+            future = self._loop.create_future()
+            self._pending_acks[result.mid] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._pending_acks.pop(result.mid, None)
+            raise MqttAsyncError(f"No acknowledgement for publish to '{topic}' (mid: {result.mid}) within {timeout}s") from None
+
+    async def subscribe(self, topics_with_qos_list, sub_properties=None, timeout=SUBACK_TIMEOUT_DEFAULT):
+        """Subscribe dan tunggu SUBACK. Return daftar granted QoS / reason code."""
+        result = subscribe_to_topics(self._client, topics_with_qos_list, sub_properties)
+        if result is None or result[0] != mqtt.MQTT_ERR_SUCCESS:
+            raise MqttAsyncError(f"Subscribe to {topics_with_qos_list} failed")
+        future = self._loop.create_future()
+        self._pending_subs[result[1]] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._pending_subs.pop(result[1], None)
+            raise MqttAsyncError(f"No SUBACK for {topics_with_qos_list} within {timeout}s") from None
+
+    async def unsubscribe(self, topics, timeout=ACK_TIMEOUT_DEFAULT):
+        """Unsubscribe (satu topic atau list) dan tunggu UNSUBACK."""
+        rc, mid = self._client.unsubscribe(topics)
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            raise MqttAsyncError(f"Unsubscribe from {topics} failed (RC: {rc})")
+        future = self._loop.create_future()
+        self._pending_unsubs[mid] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._pending_unsubs.pop(mid, None)
+            raise MqttAsyncError(f"No UNSUBACK for {topics} within {timeout}s") from None
+
+    async def messages(self):
+        """Async iterator pesan masuk; berhenti setelah client disconnect."""
+        while True:
+            msg = await self._messages.get()
+            if msg is _STREAM_END:
+                return
+            yield msg
+
+    async def disconnect(self, lwt_topic=None, lwt_payload_offline_graceful=None, lwt_qos=None, lwt_retain=None,
+                         reason_string="Client shutting down normally", session_expiry_interval=None, timeout=5):
+        """Disconnect normal (opsional publish status 'offline_graceful' dulu) dan tunggu socket tertutup.
+
+        session_expiry_interval seperti disconnect_client: None = SessionExpiryInterval dari CONNECT tetap berlaku,
+        0 = akhiri sesi sekarang.
+        """
+        if self._client.is_connected():
+            if lwt_topic and lwt_payload_offline_graceful:
+                actual_lwt_qos = lwt_qos if lwt_qos is not None else GLOBAL_SETTINGS.get("lwt_qos", 1)
+                actual_lwt_retain = lwt_retain if lwt_retain is not None else GLOBAL_SETTINGS.get("lwt_retain", True)
+                try:
+                    await self.publish(lwt_topic, lwt_payload_offline_graceful, qos=actual_lwt_qos, retain=actual_lwt_retain, timeout=timeout)
+                except MqttAsyncError as e_lwt:
+                    log.warning("Could not publish 'offline_graceful' for '%s': %s", self.client_id, e_lwt)
+            self._disconnect_future = self._loop.create_future()
+            disconnect_props = None
+            if self._client._protocol == mqtt.MQTTv5:
+                disconnect_props = Properties(PacketTypes.DISCONNECT)
+                if session_expiry_interval is not None:
+                    disconnect_props.SessionExpiryInterval = session_expiry_interval
+                if reason_string:
+                    disconnect_props.ReasonString = reason_string
+            self._client.disconnect(properties=disconnect_props)
+            try:
+                await asyncio.wait_for(self._disconnect_future, timeout)
+            except asyncio.TimeoutError:
+                log.warning("Disconnect of '%s' not confirmed within %ss.", self.client_id, timeout)
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
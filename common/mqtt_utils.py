@@ -3,11 +3,30 @@ import paho.mqtt.client as mqtt
 import ssl
 import json
 import time # Untuk LWT payload timestamp
+import threading
+import uuid
+import heapq
+import itertools
+import struct
+import math
+import random
+import base64
+from collections import OrderedDict, deque
+from concurrent.futures import Future, InvalidStateError
 from pathlib import Path
 import os # Untuk path absolut sertifikat
+import logging
 
-from paho.mqtt.properties import Properties
+from paho.mqtt.properties import Properties, VariableByteIntegers
 from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.reasoncodes import ReasonCode
+
+from log_utils import configure_logging, get_logger
+
+try:
+    import msgpack # Opsional: codec application/msgpack hanya tersedia bila paket ini terpasang
+except ImportError:
+    msgpack = None
 
 PROJECT_ROOT_DIR = Path(__file__).resolve().parent.parent
 CONFIG_FILE_PATH_GLOBAL = PROJECT_ROOT_DIR / 'config' / 'settings.json'
@@ -27,6 +46,526 @@ def load_settings():
         exit(1)
 
 GLOBAL_SETTINGS = load_settings()
+configure_logging(GLOBAL_SETTINGS.get("logging_settings")) # Level per subsistem + handler antrean untuk semua client
+log = get_logger("mqtt_utils")
+
+# Mode langganan topik response untuk pola Request/Response:
+# - "per_request": SUBSCRIBE ke <base><correlation_id> untuk setiap request lalu UNSUBSCRIBE setelahnya
+# - "wildcard": satu kali SUBSCRIBE ke <base><client_id>/# saat connect, response dicocokkan hanya lewat CorrelationData
+RESPONSE_MODE_PER_REQUEST = "per_request"
+RESPONSE_MODE_WILDCARD = "wildcard"
+RESPONSE_SUBSCRIPTION_MODES = (RESPONSE_MODE_PER_REQUEST, RESPONSE_MODE_WILDCARD)
+
+def get_response_subscription_mode():
+    req_res_cfg = GLOBAL_SETTINGS.get("request_response_settings", {})
+    mode = req_res_cfg.get("response_subscription_mode", RESPONSE_MODE_PER_REQUEST)
+    if mode not in RESPONSE_SUBSCRIPTION_MODES:
+        log.warning("Unknown response_subscription_mode '%s', falling back to '%s'.", mode, RESPONSE_MODE_PER_REQUEST)
+        return RESPONSE_MODE_PER_REQUEST
+    return mode
+
+def build_response_topic(response_base, client_id, correlation_id, mode=RESPONSE_MODE_PER_REQUEST):
+    base = response_base.rstrip('/')
+    if mode == RESPONSE_MODE_WILDCARD:
+        return f"{base}/{client_id}/{correlation_id}"
+    return f"{base}/{correlation_id}"
+
+def build_group_topic(group_base, group):
+    # Topik perintah untuk satu grup device (mis. grup lampu): <base>/<nama grup>
+    return f"{group_base.rstrip('/')}/{group}"
+
+def response_subscription_filter(response_base, client_id):
+    # Filter tunggal yang menangkap semua response untuk client ini pada mode "wildcard"
+    return f"{response_base.rstrip('/')}/{client_id}/#"
+
+SUBACK_TIMEOUT_DEFAULT = 10 # detik menunggu SUBACK sebelum dianggap gagal
+SUBACK_RESULTS_MAX = 256 # batas hasil SUBACK yang disimpan tapi belum pernah ditunggu
+
+def _is_suback_failure(granted):
+    # MQTTv5: ReasonCode >= 0x80 berarti gagal; MQTTv3.1.1: 0x80 berarti gagal
+    value = getattr(granted, 'value', granted)
+    return value >= 0x80
+
+class SubackTracker:
+    """Mencatat SUBACK per mid agar pemanggil bisa menunggu sampai subscription benar-benar aktif."""
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._cond = threading.Condition(self.lock)
+        self._pending = set()
+        self._results = OrderedDict() # {mid: [granted_qos / reason codes]}
+
+    def expect(self, mid):
+        # Dipanggil sambil memegang self.lock setelah client.subscribe(), sebelum SUBACK bisa diproses
+        with self._cond:
+            self._results.pop(mid, None) # Buang hasil lama dari mid yang dipakai ulang
+            self._pending.add(mid)
+
+    def resolve(self, mid, granted_qos):
+        with self._cond:
+            if mid not in self._pending:
+                return
+            self._pending.discard(mid)
+            self._results[mid] = list(granted_qos) if granted_qos is not None else []
+            while len(self._results) > SUBACK_RESULTS_MAX:
+                self._results.popitem(last=False)
+            self._cond.notify_all()
+
+    def wait(self, mid, timeout=SUBACK_TIMEOUT_DEFAULT):
+        """Return (True, granted) bila SUBACK sukses, (False, granted/None) bila gagal atau timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: mid in self._results, timeout):
+                self._pending.discard(mid)
+                return False, None
+            granted = self._results.pop(mid)
+        return not any(_is_suback_failure(g) for g in granted), granted
+
+def attach_suback_tracker(client, on_subscribe_custom=None):
+    """Pasang SubackTracker pada client; on_subscribe_custom tetap dipanggil setelahnya."""
+    tracker = SubackTracker()
+
+    def _tracking_on_subscribe(client_obj, user_data_obj, mid, granted_qos, props_obj=None):
+        tracker.resolve(mid, granted_qos)
+        if on_subscribe_custom:
+            on_subscribe_custom(client_obj, user_data_obj, mid, granted_qos, props_obj)
+
+    client.on_subscribe = _tracking_on_subscribe
+    client._suback_tracker = tracker
+    return tracker
+
+# --- Sesi persisten (MQTTv5): clean_start, SessionExpiryInterval dan client_id stabil per role ---
+_session_cfg = GLOBAL_SETTINGS.get("session_settings", {})
+
+CLIENT_ID_ENV_TEMPLATE = "GRUPM_{role}_CLIENT_ID" # mis. GRUPM_LAMP_CLIENT_ID=lamp_dapur python lamp/lamp_client.py
+
+def _session_role_cfg(role):
+    return _session_cfg.get("roles", {}).get(role, {}) if role else {}
+
+def get_stable_client_id_suffix(role):
+    """Suffix client_id stabil untuk role: env GRUPM_<ROLE>_CLIENT_ID, lalu session_settings.roles.<role>.client_id.
+
+    None bila tidak diisi (default): setiap proses mendapat client_id acak, sehingga beberapa lampu/sensor bisa
+    berjalan bersamaan tanpa saling merebut sesi yang sama di broker.
+    """
+    if not role:
+        return None
+    return os.environ.get(CLIENT_ID_ENV_TEMPLATE.format(role=role.upper())) or _session_role_cfg(role).get("client_id")
+
+def get_session_settings(role=None):
+    """(clean_start, session_expiry_interval) untuk role ("sensor", "lamp", "panel"), fallback ke default session_settings.
+
+    clean_start None = perilaku Paho (clean start hanya pada connect pertama). session_expiry_interval 0 = sesi
+    berakhir saat koneksi putus; > 0 = broker menyimpan subscription dan pesan QoS 1/2 selama sekian detik,
+    sehingga putus sebentar dilanjutkan tanpa SUBSCRIBE ulang dan tanpa kehilangan pesan.
+    Pengaturan per role hanya dipakai bila role punya client_id stabil; sesi client_id acak tidak pernah bisa
+    dilanjutkan setelah restart, jadi hanya akan menumpuk di broker.
+    """
+    role_cfg = _session_role_cfg(role) if get_stable_client_id_suffix(role) else {}
+    clean_start = role_cfg.get("clean_start", _session_cfg.get("clean_start"))
+    session_expiry_interval = role_cfg.get("session_expiry_interval", _session_cfg.get("session_expiry_interval", 0))
+    return clean_start, int(session_expiry_interval or 0)
+
+def build_client_id(role, default_prefix):
+    """client_id_prefix + suffix stabil dari get_stable_client_id_suffix() (sesi bisa dilanjutkan setelah restart),
+    atau prefix + 8 karakter uuid acak bila tidak ada suffix stabil (default)."""
+    prefix = GLOBAL_SETTINGS.get('client_id_prefix', default_prefix)
+    stable_suffix = get_stable_client_id_suffix(role)
+    return f"{prefix}{stable_suffix}" if stable_suffix else f"{prefix}{str(uuid.uuid4())[:8]}"
+
+# --- TLS: satu SSLContext per proses (per kombinasi sertifikat) + resumption sesi TLS antar koneksi ---
+TLS_SESSION_RESUMPTION_DEFAULT = GLOBAL_SETTINGS.get("mqtt_advanced_settings", {}).get("tls_session_resumption", True)
+
+class ResumingSSLContext(ssl.SSLContext):
+    """SSLContext client yang menawarkan sesi TLS terakhir (session ticket) untuk (host, port) yang sama.
+
+    Paho memanggil wrap_socket() di setiap connect/reconnect; bila ada sesi tersimpan, handshake menjadi
+    abbreviated (tanpa verifikasi rantai sertifikat dan pertukaran kunci penuh). Sesi disimpan lewat
+    remember_session() setelah CONNACK: pada TLS 1.3 ticket baru dikirim server setelah handshake selesai.
+    """
+    def _init_resumption(self, enabled):
+        self.session_resumption = enabled
+        self._sessions = {} # (server_hostname, port) -> ssl.SSLSession
+        self._sessions_lock = threading.Lock()
+        self.full_handshakes = 0
+        self.resumed_handshakes = 0
+
+    @staticmethod
+    def _session_key(sock, server_hostname):
+        try:
+            return server_hostname, sock.getpeername()[1]
+        except (OSError, IndexError):
+            return None
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        if session is None and self.session_resumption and not server_side:
+            key = self._session_key(sock, server_hostname)
+            with self._sessions_lock:
+                session = self._sessions.get(key)
+        return super().wrap_socket(sock, server_side=server_side, do_handshake_on_connect=do_handshake_on_connect,
+                                   suppress_ragged_eofs=suppress_ragged_eofs, server_hostname=server_hostname,
+                                   session=session)
+
+    def remember_session(self, ssl_sock):
+        """Catat hasil handshake ssl_sock dan simpan sesinya untuk koneksi berikutnya. Return True bila sesi di-resume."""
+        reused = bool(ssl_sock.session_reused)
+        with self._sessions_lock:
+            if reused:
+                self.resumed_handshakes += 1
+            else:
+                self.full_handshakes += 1
+            key = self._session_key(ssl_sock, ssl_sock.server_hostname)
+            if self.session_resumption and key is not None and ssl_sock.session is not None:
+                self._sessions[key] = ssl_sock.session
+        return reused
+
+    def get_stats(self):
+        with self._sessions_lock:
+            return {'full_handshakes': self.full_handshakes, 'resumed_handshakes': self.resumed_handshakes,
+                    'cached_sessions': len(self._sessions)}
+
+_tls_contexts = {} # (ca_certs, certfile, keyfile, resumption) -> ResumingSSLContext
+_tls_contexts_lock = threading.Lock()
+
+def get_tls_context(ca_certs=None, certfile=None, keyfile=None, session_resumption=None):
+    """SSLContext client bersama untuk kombinasi CA/sertifikat client ini, dibuat sekali per proses.
+
+    File CA dan sertifikat hanya dibaca saat context pertama dibuat; semua client (dan reconnect-nya)
+    memakai context yang sama lewat client.tls_set_context(). session_resumption None = mqtt_advanced_settings.
+    """
+    if session_resumption is None:
+        session_resumption = TLS_SESSION_RESUMPTION_DEFAULT
+    key = (ca_certs, certfile, keyfile, bool(session_resumption))
+    with _tls_contexts_lock:
+        context = _tls_contexts.get(key)
+        if context is None:
+            context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT) # verify_mode CERT_REQUIRED + check_hostname
+            if ca_certs:
+                context.load_verify_locations(ca_certs)
+            else:
+                context.load_default_certs()
+            if certfile:
+                context.load_cert_chain(certfile, keyfile)
+            context._init_resumption(bool(session_resumption))
+            _tls_contexts[key] = context
+        return context
+
+def remember_tls_session(client):
+    """Dipanggil saat CONNACK diterima: simpan sesi TLS koneksi ini di context bersama. None bila bukan TLS."""
+    context = getattr(client, '_ssl_context', None)
+    sock = client.socket()
+    if not isinstance(context, ResumingSSLContext) or not isinstance(sock, ssl.SSLSocket):
+        return None
+    return context.remember_session(sock)
+
+# --- Reconnect terkelola: backoff eksponensial + jitter, resubscribe otomatis, antrean publish offline ---
+_reconnect_cfg = GLOBAL_SETTINGS.get("reconnect_settings", {})
+RECONNECT_ENABLED_DEFAULT = _reconnect_cfg.get("enabled", True)
+RECONNECT_MIN_DELAY_S = _reconnect_cfg.get("min_delay_s", 1) # jeda reconnect pertama (detik)
+RECONNECT_MAX_DELAY_S = _reconnect_cfg.get("max_delay_s", 60) # batas atas jeda setelah backoff
+OFFLINE_QUEUE_MAX = _reconnect_cfg.get("offline_queue_max", 1000) # 0 = publish saat offline ditolak seperti biasa
+OFFLINE_QUEUE_DIR = _reconnect_cfg.get("offline_queue_dir") # None = antrean hanya di memori
+OFFLINE_FLUSH_BATCH = _reconnect_cfg.get("flush_batch_size", 100) # pesan per putaran flush setelah reconnect
+
+def _client_id_str(client):
+    client_id_str = getattr(client, '_client_id', 'UnknownClient')
+    return client_id_str.decode() if isinstance(client_id_str, bytes) else str(client_id_str)
+
+class QueuedPublishInfo:
+    """Pengganti MQTTMessageInfo untuk publish yang masuk antrean offline: rc sukses, mid belum ada."""
+    rc = mqtt.MQTT_ERR_SUCCESS
+    mid = None
+    queued = True
+
+class OfflinePublishQueue:
+    """Antrean PUBLISH terbatas untuk pesan yang dikirim saat client offline. Tidak thread-safe (ReconnectManager memegang lock).
+
+    Setiap item: (topic, payload bytes, qos, retain, properties ter-pack, waktu masuk). Bila penuh, item
+    TERLAMA dibuang (pembacaan terbaru lebih berharga) dan dihitung di `dropped`. Dengan `path`, item juga
+    ditulis (append, JSON lines) ke file sehingga antrean bertahan bila proses mati; isi file dimuat lagi
+    saat antrean dibuat dan file dikosongkan setelah antrean habis di-flush (at-least-once).
+    """
+    def __init__(self, max_messages=OFFLINE_QUEUE_MAX, path=None):
+        self.max_messages = max_messages
+        self.path = Path(path) if path else None
+        self._items = deque()
+        self._file = None
+        self._file_records = 0 # Baris di file (termasuk item yang sudah dibuang karena antrean penuh)
+        self.dropped = 0
+        if self.path:
+            self._load()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _load(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self._append(record['topic'], base64.b64decode(record['payload']), record['qos'], record['retain'],
+                                     base64.b64decode(record['props']) if record.get('props') else None, record['ts'])
+                    except (ValueError, KeyError, TypeError):
+                        log.warning("Skipping unreadable offline queue record in '%s'.", self.path)
+            if self._items:
+                log.info("Loaded %s queued publish(es) from '%s'.", len(self._items), self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._rewrite_file() # Buang baris item lama yang melebihi max_messages
+
+    def _append(self, topic, payload, qos, retain, packed_props, enqueued_at):
+        if len(self._items) >= self.max_messages:
+            self._items.popleft()
+            self.dropped += 1
+        self._items.append((topic, payload, qos, retain, packed_props, enqueued_at))
+
+    def put(self, topic, payload, qos, retain, properties):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        elif payload is None:
+            payload = b""
+        packed_props = properties.pack() if properties is not None else None
+        enqueued_at = time.time() # Wall clock: tetap bermakna setelah proses dimulai ulang
+        item = (topic, bytes(payload), qos, retain, packed_props, enqueued_at)
+        self._append(*item)
+        if self._file is not None:
+            if self._file_records >= 2 * self.max_messages:
+                self._rewrite_file() # Kompaksi: file tidak tumbuh tanpa batas selama offline lama
+            else:
+                self._write_record(item)
+                self._file.flush()
+
+    def _write_record(self, item):
+        topic, payload, qos, retain, packed_props, enqueued_at = item
+        self._file.write(json.dumps({'topic': topic, 'payload': base64.b64encode(payload).decode('ascii'),
+                                     'qos': qos, 'retain': retain, 'ts': enqueued_at,
+                                     'props': base64.b64encode(packed_props).decode('ascii') if packed_props else None}) + "\n")
+        self._file_records += 1
+
+    def _rewrite_file(self):
+        self._file.seek(0)
+        self._file.truncate()
+        self._file_records = 0
+        for item in self._items:
+            self._write_record(item)
+        self._file.flush()
+
+    def pop_batch(self, max_items):
+        batch = []
+        while self._items and len(batch) < max_items:
+            batch.append(self._items.popleft())
+        if not self._items and self._file is not None:
+            self._rewrite_file() # Semua item sudah diambil untuk dikirim: kosongkan file
+        return batch
+
+    def requeue_front(self, items):
+        # Item yang gagal dikirim kembali ke depan antrean (urutan tetap); file ditulis ulang agar tetap sinkron
+        self._items.extendleft(reversed(items))
+        while len(self._items) > self.max_messages:
+            self._items.popleft()
+            self.dropped += 1
+        if self._file is not None:
+            self._rewrite_file()
+
+    def close(self):
+        # Item yang belum terkirim tetap di file untuk proses berikutnya
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def _unpack_publish_properties(packed_props, enqueued_at, now):
+    """Properties dari bytes ter-pack; MessageExpiryInterval dikurangi lama antre. None bila pesan sudah kadaluarsa."""
+    props = Properties(PacketTypes.PUBLISH)
+    props.unpack(packed_props)
+    expiry = getattr(props, 'MessageExpiryInterval', None)
+    if expiry:
+        remaining = int(math.ceil(expiry - (now - enqueued_at)))
+        if remaining <= 0:
+            return None
+        props.MessageExpiryInterval = remaining
+    return props
+
+class ReconnectManager:
+    """Reconnect terkelola untuk client yang memakai loop_start() (dipasang oleh create_mqtt_client).
+
+    - Backoff eksponensial dengan jitter: jeda ke-n diambil acak dari [min_delay_s, min(max_delay_s,
+      min_delay_s * 2^(n+1))] dan diberikan ke loop Paho lewat reconnect_delay_set(), sehingga banyak
+      client yang putus bersamaan (mis. broker restart) tidak reconnect serentak.
+    - Topik yang di-subscribe lewat subscribe_to_topics() dicatat dan di-subscribe ulang dalam satu paket
+      SUBSCRIBE setelah reconnect bila broker tidak menyimpan sesi (session present = 0).
+    - Publish saat offline (dan selama antrean belum habis, agar urutan tetap) masuk OfflinePublishQueue,
+      lalu di-flush per `flush_batch_size` pesan oleh thread terpisah setelah reconnect.
+    """
+    def __init__(self, client, min_delay_s=RECONNECT_MIN_DELAY_S, max_delay_s=RECONNECT_MAX_DELAY_S,
+                 offline_queue=None, flush_batch_size=OFFLINE_FLUSH_BATCH):
+        self.client = client
+        self.min_delay_s = min_delay_s
+        self.max_delay_s = max(max_delay_s, min_delay_s)
+        self.offline_queue = offline_queue
+        self.flush_batch_size = max(1, flush_batch_size)
+        self.restored_on_connect = False # True: subscription connect ini sudah dipulihkan (lihat subscriptions_restored)
+        self._lock = threading.Lock()
+        self._subscriptions = OrderedDict() # {topic_filter: qos/SubscribeOptions}
+        self._attempt = 0
+        self._connected_once = False
+        self._flushing = False
+        self.closed = False # True setelah close(): tidak mengantre dan tidak menjadwalkan reconnect lagi
+        self.stats = {'disconnects': 0, 'reconnects': 0, 'connect_failures': 0, 'resubscribed_topics': 0,
+                      'queued': 0, 'flushed': 0, 'expired': 0}
+
+    def next_delay(self):
+        cap = min(self.max_delay_s, self.min_delay_s * 2 ** (min(self._attempt, 30) + 1))
+        return random.uniform(self.min_delay_s, cap)
+
+    def _schedule_reconnect(self, counter):
+        # Dipanggil di thread network Paho sebelum loop menunggu _reconnect_wait()
+        with self._lock:
+            if self.closed:
+                return
+            self.stats[counter] += 1
+            delay = self.next_delay()
+            self._attempt += 1
+            attempt = self._attempt
+        self.client.reconnect_delay_set(delay, delay)
+        log.info("%s: reconnect attempt %s in %.1fs.", _client_id_str(self.client), attempt, delay)
+
+    def on_disconnect(self):
+        self._schedule_reconnect('disconnects')
+
+    def on_connect_fail(self, client, userdata):
+        self._schedule_reconnect('connect_failures')
+
+    def on_connect(self, flags):
+        """Dipanggil saat CONNACK sukses: reset backoff, subscribe ulang bila perlu, mulai flush antrean."""
+        session_present = flags.get('session present') if isinstance(flags, dict) else getattr(flags, 'session_present', False)
+        with self._lock:
+            reconnect = self._connected_once
+            self._connected_once = True
+            self._attempt = 0
+            subscriptions = list(self._subscriptions.items()) if reconnect and not session_present else []
+        restored = reconnect # Sesi broker masih ada (session present): subscription tidak perlu dikirim ulang
+        if subscriptions:
+            result = subscribe_to_topics(self.client, subscriptions, restore_on_reconnect=False)
+            restored = bool(result and result[0] == mqtt.MQTT_ERR_SUCCESS)
+            if restored:
+                with self._lock:
+                    self.stats['resubscribed_topics'] += len(subscriptions)
+        self.restored_on_connect = restored
+        if reconnect:
+            with self._lock:
+                self.stats['reconnects'] += 1
+            log.info("%s: reconnected (session present: %s, resubscribed %s topic(s), %s queued publish(es)).",
+                     _client_id_str(self.client), bool(session_present), len(subscriptions), self.queued_count())
+        self._start_flush()
+
+    def remember_subscriptions(self, topics_with_qos_list):
+        with self._lock:
+            for topic_filter, options in topics_with_qos_list:
+                self._subscriptions[topic_filter] = options
+
+    def forget_subscriptions(self, topic_filters):
+        with self._lock:
+            for topic_filter in topic_filters:
+                self._subscriptions.pop(topic_filter, None)
+
+    def queued_count(self):
+        with self._lock:
+            return len(self.offline_queue) if self.offline_queue is not None else 0
+
+    def try_enqueue(self, topic, payload, qos, retain, properties):
+        """Masukkan publish ke antrean bila client offline atau antrean masih di-flush. Return QueuedPublishInfo atau None."""
+        if self.offline_queue is None:
+            return None
+        with self._lock:
+            if self.closed:
+                return None
+            if self.client.is_connected() and not self._flushing and not len(self.offline_queue):
+                return None # Jalur normal: publish langsung
+            self.offline_queue.put(topic, payload, qos, retain, properties)
+            self.stats['queued'] += 1
+        return QueuedPublishInfo()
+
+    def _start_flush(self):
+        with self._lock:
+            if self._flushing or self.offline_queue is None or not len(self.offline_queue):
+                return
+            self._flushing = True
+        threading.Thread(target=self._flush_loop, name=f"offline-flush-{_client_id_str(self.client)}", daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                batch = self.offline_queue.pop_batch(self.flush_batch_size) if not self.closed else []
+                if not batch:
+                    self._flushing = False
+                    return
+            now = time.time()
+            for index, (topic, payload, qos, retain, packed_props, enqueued_at) in enumerate(batch):
+                props = _unpack_publish_properties(packed_props, enqueued_at, now) if packed_props else None
+                if packed_props and props is None:
+                    with self._lock:
+                        self.stats['expired'] += 1
+                    continue
+                result = self.client.publish(topic, payload, qos=qos, retain=retain, properties=props)
+                if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                    # Putus lagi: QoS > 0 sudah disimpan Paho untuk dikirim ulang, sisanya kembali ke antrean
+                    remaining = batch[index + 1:] if qos > 0 and result.rc == mqtt.MQTT_ERR_NO_CONN else batch[index:]
+                    with self._lock:
+                        self.offline_queue.requeue_front(remaining)
+                        self._flushing = False
+                    log.warning("%s: offline queue flush interrupted (RC: %s); %s publish(es) kept for next reconnect.",
+                                _client_id_str(self.client), result.rc, len(remaining))
+                    return
+                with self._lock:
+                    self.stats['flushed'] += 1
+
+    def close(self):
+        """Berhenti mengantre (dipanggil saat disconnect yang disengaja); isi antrean disk tetap tersimpan."""
+        with self._lock:
+            self.closed = True
+            if self.offline_queue is not None:
+                self.offline_queue.close()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            if self.offline_queue is not None:
+                stats['queue_length'] = len(self.offline_queue)
+                stats['queue_dropped'] = self.offline_queue.dropped
+        return stats
+
+def attach_reconnect_manager(client, client_id, on_disconnect_custom=None):
+    """Pasang ReconnectManager (pengaturan dari reconnect_settings) pada client; on_disconnect_custom tetap dipanggil."""
+    offline_queue = None
+    if OFFLINE_QUEUE_MAX > 0:
+        queue_path = PROJECT_ROOT_DIR / OFFLINE_QUEUE_DIR / f"{client_id}.jsonl" if OFFLINE_QUEUE_DIR else None
+        offline_queue = OfflinePublishQueue(OFFLINE_QUEUE_MAX, queue_path)
+    manager = ReconnectManager(client, offline_queue=offline_queue)
+
+    def _managed_on_disconnect(client_obj, user_data_obj, *args):
+        manager.on_disconnect()
+        if on_disconnect_custom:
+            on_disconnect_custom(client_obj, user_data_obj, *args)
+
+    client.on_disconnect = _managed_on_disconnect
+    client.on_connect_fail = manager.on_connect_fail
+    client.reconnect_delay_set(RECONNECT_MIN_DELAY_S, RECONNECT_MAX_DELAY_S)
+    client._reconnect_manager = manager
+    return manager
+
+def get_reconnect_manager(client):
+    return getattr(client, '_reconnect_manager', None)
+
+def subscriptions_restored(client):
+    """True bila ReconnectManager sudah memulihkan subscription pada connect ini (resubscribe otomatis atau
+    sesi broker masih ada), jadi on_connect tidak perlu subscribe ulang."""
+    manager = get_reconnect_manager(client)
+    return manager is not None and manager.restored_on_connect
+
+def offline_buffering_enabled(client):
+    """True bila publish saat offline diantre (dan dikirim setelah reconnect) alih-alih ditolak."""
+    manager = get_reconnect_manager(client)
+    return manager is not None and manager.offline_queue is not None and not manager.closed
 
 def create_mqtt_client(client_id,
                        on_connect_custom=None,
@@ -39,16 +578,23 @@ def create_mqtt_client(client_id,
                        lwt_payload_online=None,
                        lwt_payload_offline=None,
                        lwt_qos=None,
-                       lwt_retain=None):
+                       lwt_retain=None,
+                       auto_connect=True,
+                       managed_reconnect=None,
+                       session_role=None):
+    # auto_connect=False: client dikonfigurasi lengkap tapi belum connect; parameter connect disimpan
+    # di client._connect_args untuk connect_client() atau event loop lain (mis. mqtt_async)
+    # managed_reconnect: pasang ReconnectManager (None = reconnect_settings.enabled); hanya untuk loop_start()
+    # session_role: "sensor"/"lamp"/"panel" untuk clean_start dan SessionExpiryInterval dari session_settings
     if not GLOBAL_SETTINGS:
-        print("ERROR (mqtt_utils): Global settings not loaded.")
+        log.error("Global settings not loaded.")
         return None
 
-    print(f"INFO (mqtt_utils): Creating MQTT client: {client_id} with MQTTv5 protocol.")
+    log.info("Creating MQTT client: %s with MQTTv5 protocol.", client_id)
     try:
         client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5, userdata=userdata)
     except TypeError: # Fallback untuk Paho-MQTT versi lama yang mungkin tidak punya 'protocol'
-        print("INFO (mqtt_utils): Falling back to default MQTT protocol (likely v3.1.1) for client creation.")
+        log.info("Falling back to default MQTT protocol (likely v3.1.1) for client creation.")
         client = mqtt.Client(client_id=client_id, userdata=userdata)
 
 
@@ -70,7 +616,7 @@ def create_mqtt_client(client_id,
     actual_lwt_retain = lwt_retain if lwt_retain is not None else GLOBAL_SETTINGS.get("lwt_retain", True)
 
     if lwt_topic and lwt_payload_offline:
-        print(f"INFO (mqtt_utils): Setting LWT for {client_id}: Topic='{lwt_topic}', QoS={actual_lwt_qos}, Retain={actual_lwt_retain}")
+        log.info("Setting LWT for %s: Topic='%s', QoS=%s, Retain=%s", client_id, lwt_topic, actual_lwt_qos, actual_lwt_retain)
         client.will_set(lwt_topic, lwt_payload_offline, qos=actual_lwt_qos, retain=actual_lwt_retain)
 
     def _default_on_connect(client_obj, user_data_obj, flags_dict, rc_int, props_obj=None): # Nama argumen lebih deskriptif
@@ -78,19 +624,25 @@ def create_mqtt_client(client_id,
         client_id_str = client_id_str.decode() if isinstance(client_id_str, bytes) else str(client_id_str)
 
         if rc_int == 0 or rc_int == mqtt.CONNACK_ACCEPTED: # mqtt.CONNACK_ACCEPTED adalah 0
-            print(f"INFO (mqtt_utils:{client_id_str}): Connected successfully (RC: Success / {rc_int})")
-            if props_obj: print(f"  Broker CONNECT Properties: {vars(props_obj)}")
+            log.info("%s: Connected successfully (RC: Success / %s)", client_id_str, rc_int)
+            if remember_tls_session(client_obj):
+                log.debug("  TLS session resumed (abbreviated handshake).")
+            if props_obj and log.isEnabledFor(logging.DEBUG): # vars() mahal; hanya saat debug
+                log.debug("  Broker CONNECT Properties: %s", vars(props_obj))
+            manager = get_reconnect_manager(client_obj)
+            if manager: # Subscribe ulang + flush antrean offline sebelum callback client
+                manager.on_connect(flags_dict)
             if lwt_topic and lwt_payload_online:
                  publish_message(client_obj, lwt_topic, lwt_payload_online, qos=actual_lwt_qos, retain=actual_lwt_retain)
         else:
-            print(f"ERROR (mqtt_utils:{client_id_str}): Connection failed (RC: {rc_int})")
+            log.error("%s: Connection failed (RC: %s)", client_id_str, rc_int)
             # Tambahkan detail error berdasarkan RC
-            if rc_int == 1: print("  Connection refused - incorrect protocol version")
-            elif rc_int == 2: print("  Connection refused - invalid client identifier")
-            elif rc_int == 3: print("  Connection refused - server unavailable")
-            elif rc_int == 4: print("  Connection refused - bad username or password")
-            elif rc_int == 5: print("  Connection refused - not authorised")
-            else: print(f"  Connection refused - (Unknown RC: {rc_int})")
+            if rc_int == 1: log.error("  Connection refused - incorrect protocol version")
+            elif rc_int == 2: log.error("  Connection refused - invalid client identifier")
+            elif rc_int == 3: log.error("  Connection refused - server unavailable")
+            elif rc_int == 4: log.error("  Connection refused - bad username or password")
+            elif rc_int == 5: log.error("  Connection refused - not authorised")
+            else: log.error("  Connection refused - (Unknown RC: %s)", rc_int)
 
         if on_connect_custom:
             on_connect_custom(client_obj, user_data_obj, flags_dict, rc_int, props_obj)
@@ -98,104 +650,142 @@ def create_mqtt_client(client_id,
     client.on_connect = _default_on_connect
     if on_message_custom: client.on_message = on_message_custom
     if on_disconnect_custom: client.on_disconnect = on_disconnect_custom
-    if on_subscribe_custom: client.on_subscribe = on_subscribe_custom
+    attach_suback_tracker(client, on_subscribe_custom) # on_subscribe selalu lewat tracker agar SUBACK bisa ditunggu
+    if managed_reconnect if managed_reconnect is not None else RECONNECT_ENABLED_DEFAULT:
+        attach_reconnect_manager(client, client_id, on_disconnect_custom)
     if on_publish_custom: client.on_publish = on_publish_custom
     
     current_broker_port = default_port
     if use_tls:
-        print(f"INFO (mqtt_utils): Configuring TLS for {client_id}...")
+        log.info("Configuring TLS for %s...", client_id)
         ca_cert_abs_path = None
         if ca_cert_rel_path:
             ca_cert_abs_path_obj = PROJECT_ROOT_DIR / ca_cert_rel_path
             if ca_cert_abs_path_obj.exists():
                 ca_cert_abs_path = str(ca_cert_abs_path_obj)
-                print(f"  Using CA certificate: {ca_cert_abs_path}")
+                log.info("  Using CA certificate: %s", ca_cert_abs_path)
             else:
-                print(f"  WARNING: CA certificate '{ca_cert_abs_path_obj}' not found. TLS may fail or use system CAs.")
+                log.warning("  CA certificate '%s' not found. TLS may fail or use system CAs.", ca_cert_abs_path_obj)
         else:
-            print(f"  CA certificate path not specified. TLS will use system CAs or fail if server cert is self-signed.")
+            log.info("  CA certificate path not specified. TLS will use system CAs or fail if server cert is self-signed.")
 
         client_cert_abs_obj = PROJECT_ROOT_DIR / client_cert_rel_path if client_cert_rel_path else None
         client_key_abs_obj = PROJECT_ROOT_DIR / client_key_rel_path if client_key_rel_path else None
         mTLS_enabled = client_cert_abs_obj and client_key_abs_obj and client_cert_abs_obj.exists() and client_key_abs_obj.exists()
 
         try:
-            client.tls_set(
+            # Context bersama: CA tidak dibaca ulang per client dan sesi TLS bisa di-resume saat reconnect
+            client.tls_set_context(get_tls_context(
                 ca_certs=ca_cert_abs_path,
                 certfile=str(client_cert_abs_obj) if mTLS_enabled else None,
-                keyfile=str(client_key_abs_obj) if mTLS_enabled else None,
-                cert_reqs=ssl.CERT_REQUIRED,
-                tls_version=ssl.PROTOCOL_TLS_CLIENT,
-                ciphers=None
-            )
+                keyfile=str(client_key_abs_obj) if mTLS_enabled else None))
             client.tls_insecure_set(False)  # Disable insecure mode
             current_broker_port = tls_port
-            print(f"  TLS configured. Target port: {current_broker_port}.")
-            if mTLS_enabled: print("  mTLS (Client Certificate Authentication) is configured.")
+            log.info("  TLS configured. Target port: %s.", current_broker_port)
+            if mTLS_enabled: log.info("  mTLS (Client Certificate Authentication) is configured.")
         except Exception as e_tls:
-            print(f"  ERROR setting up TLS: {e_tls}. Connection will likely fail if target port is TLS only.")
+            log.error("  Error setting up TLS: %s. Connection will likely fail if target port is TLS only.", e_tls)
 
     if use_auth:
         if username and password and username not in ["YOUR_MQTT_USERNAME", ""]:
-            print(f"INFO (mqtt_utils): Setting MQTT username: {username} for {client_id}")
+            log.info("Setting MQTT username: %s for %s", username, client_id)
             client.username_pw_set(username, password)
         else:
-            print(f"  WARNING (mqtt_utils): 'use_auth' is true, but username/password are placeholders or not set for {client_id}. Autentikasi mungkin gagal.")
+            log.warning("'use_auth' is true, but username/password are placeholders or not set for %s. Autentikasi mungkin gagal.", client_id)
 
-    print(f"INFO (mqtt_utils): {client_id} attempting to connect to {broker_address}:{current_broker_port}...")
-    try:
-        connect_props = None
-        if hasattr(client, '_protocol') and client._protocol == mqtt.MQTTv5:
-            connect_props = Properties(PacketTypes.CONNECT)
-            if receive_maximum is not None:
-                 connect_props.ReceiveMaximum = receive_maximum
-        
-        client.connect(broker_address, current_broker_port, keepalive, properties=connect_props)
+    clean_start, session_expiry_interval = get_session_settings(session_role)
+    connect_props = None
+    if hasattr(client, '_protocol') and client._protocol == mqtt.MQTTv5:
+        connect_props = Properties(PacketTypes.CONNECT)
+        if receive_maximum is not None:
+             connect_props.ReceiveMaximum = receive_maximum # Juga membatasi replay pesan sesi yang in-flight sekaligus
+        if session_expiry_interval > 0:
+            connect_props.SessionExpiryInterval = session_expiry_interval
+            log.info("Persistent session for %s: SessionExpiryInterval=%ss, clean_start=%s", client_id, session_expiry_interval, clean_start)
+    client._connect_args = {'host': broker_address, 'port': current_broker_port,
+                            'keepalive': keepalive, 'properties': connect_props,
+                            'clean_start': mqtt.MQTT_CLEAN_START_FIRST_ONLY if clean_start is None else bool(clean_start)}
+
+    if not auto_connect:
         return client
+    return client if connect_client(client) else None # Eksplisit kembalikan None jika gagal
+
+def connect_client(client):
+    """Connect (blocking TCP/TLS) memakai parameter yang disimpan create_mqtt_client(). Return True bila berhasil."""
+    connect_args = client._connect_args
+    client_id_str = getattr(client, '_client_id', 'UnknownClient')
+    client_id_str = client_id_str.decode() if isinstance(client_id_str, bytes) else str(client_id_str)
+    broker_address, current_broker_port = connect_args['host'], connect_args['port']
+
+    log.info("%s attempting to connect to %s:%s...", client_id_str, broker_address, current_broker_port)
+    try:
+        client.connect(broker_address, current_broker_port, connect_args['keepalive'],
+                       clean_start=connect_args['clean_start'], properties=connect_args['properties'])
+        return True
     except ConnectionRefusedError as e_conn: # Lebih spesifik
-        print(f"ERROR (mqtt_utils): Connection refused for {client_id} to {broker_address}:{current_broker_port}. Broker might not be running or port is wrong. Error: {e_conn}")
+        log.error("Connection refused for %s to %s:%s. Broker might not be running or port is wrong. Error: %s", client_id_str, broker_address, current_broker_port, e_conn)
     except OSError as e_conn: # Untuk error jaringan lain seperti host tidak ditemukan
-        print(f"ERROR (mqtt_utils): Network error for {client_id} connecting to {broker_address}:{current_broker_port}. Error: {e_conn}")
+        log.error("Network error for %s connecting to %s:%s. Error: %s", client_id_str, broker_address, current_broker_port, e_conn)
     except Exception as e_conn:
-        print(f"ERROR (mqtt_utils): Could not connect {client_id} to broker ({broker_address}:{current_broker_port}): {e_conn}")
-    return None # Eksplisit kembalikan None jika gagal
+        log.error("Could not connect %s to broker (%s:%s): %s", client_id_str, broker_address, current_broker_port, e_conn)
+    return False
+
+def _validate_message_expiry(expiry_interval):
+    # Return expiry dalam detik (int >= 0, 0 berarti tidak kadaluarsa) atau None bila tidak dipakai/tidak valid
+    if expiry_interval is None:
+        return None
+    try:
+        expiry_int = int(expiry_interval)
+    except (TypeError, ValueError):
+        log.warning("Invalid value for message_expiry_interval: %s", expiry_interval)
+        return None
+    return expiry_int if expiry_int >= 0 else None
+
+DEFAULT_QOS = GLOBAL_SETTINGS.get("default_qos", 1)
+# Divalidasi sekali saat import, bukan di setiap publish
+DEFAULT_MESSAGE_EXPIRY_INTERVAL = _validate_message_expiry(
+    GLOBAL_SETTINGS.get("mqtt_advanced_settings", {}).get("default_message_expiry_interval"))
+
+def _is_v5_client(client):
+    return getattr(client, '_protocol', None) == mqtt.MQTTv5
+
+def _enqueue_if_offline(client, topic, payload, qos, retain, properties):
+    # QueuedPublishInfo bila pesan masuk antrean offline ReconnectManager, None bila harus dipublish langsung
+    manager = get_reconnect_manager(client)
+    if manager is None:
+        return None
+    queued = manager.try_enqueue(topic, payload, qos, retain, properties)
+    if queued is not None:
+        log.debug("Client offline: publish to '%s' queued (%s in queue).", topic, manager.queued_count())
+    return queued
 
 def publish_message(client, topic, payload, qos=None, retain=False,
                     message_expiry_interval=None,
                     response_topic=None, correlation_data=None,
                     user_properties=None, content_type=None):
     if not client:
-        print(f"ERROR (mqtt_utils): Client object is None. Cannot publish to '{topic}'.")
+        log.error("Client object is None. Cannot publish to '%s'.", topic)
         return None
-    if not hasattr(client, 'is_connected') or not client.is_connected():
-        print(f"ERROR (mqtt_utils): Client not connected. Cannot publish to '{topic}'.")
+    if not hasattr(client, 'is_connected') or (not client.is_connected() and not offline_buffering_enabled(client)):
+        log.error("Client not connected. Cannot publish to '%s'.", topic)
         return None
 
-    actual_qos = qos if qos is not None else GLOBAL_SETTINGS.get("default_qos", 1)
-    
+    actual_qos = qos if qos is not None else DEFAULT_QOS
+
     publish_props = None
     has_props = False
 
-    if hasattr(client, '_protocol') and client._protocol == mqtt.MQTTv5:
+    if _is_v5_client(client):
         publish_props = Properties(PacketTypes.PUBLISH)
-        actual_expiry_val_from_arg = message_expiry_interval
-        
-        final_expiry_interval = None
-        if actual_expiry_val_from_arg is not None: # Prioritas argumen fungsi
-            final_expiry_interval = actual_expiry_val_from_arg
-        else: # Fallback ke global settings
-            adv_settings = GLOBAL_SETTINGS.get("mqtt_advanced_settings", {})
-            final_expiry_interval = adv_settings.get("default_message_expiry_interval")
-        
-        if final_expiry_interval is not None:
-            try:
-                expiry_int = int(final_expiry_interval)
-                if expiry_int >= 0: # 0 berarti tidak kadaluarsa
-                    publish_props.MessageExpiryInterval = expiry_int
-                    has_props = True
-            except ValueError:
-                print(f"WARNING (mqtt_utils): Invalid value for message_expiry_interval: {final_expiry_interval}")
-        
+        # Prioritas argumen fungsi, fallback ke global settings (sudah divalidasi saat import)
+        if message_expiry_interval is not None:
+            expiry_int = _validate_message_expiry(message_expiry_interval)
+        else:
+            expiry_int = DEFAULT_MESSAGE_EXPIRY_INTERVAL
+        if expiry_int is not None:
+            publish_props.MessageExpiryInterval = expiry_int
+            has_props = True
+
         if response_topic:
             publish_props.ResponseTopic = str(response_topic)
             has_props = True
@@ -215,28 +805,972 @@ def publish_message(client, topic, payload, qos=None, retain=False,
     else:
         props_to_send = None
         if any([message_expiry_interval, response_topic, correlation_data, user_properties, content_type]):
-             print(f"WARNING (mqtt_utils): Client is not MQTTv5. Properties for publish to '{topic}' will be ignored.")
+             log.warning("Client is not MQTTv5. Properties for publish to '%s' will be ignored.", topic)
+    queued = _enqueue_if_offline(client, topic, payload, actual_qos, retain, props_to_send)
+    if queued is not None:
+        return queued
     try:
         return client.publish(topic, payload, qos=actual_qos, retain=retain, properties=props_to_send)
     except Exception as e_pub:
-        print(f"ERROR (mqtt_utils): Exception during publish to '{topic}': {e_pub}")
+        log.error("Exception during publish to '%s': %s", topic, e_pub)
         return None
 
-def subscribe_to_topics(client, topics_with_qos_list, sub_properties=None):
+class _PrepackedPublishProperties(Properties):
+    """Properties PUBLISH dengan bagian tetap yang sudah di-pack sekali oleh PublishProfile.
+
+    Objek ini hanya memegang field per pesan (ResponseTopic, CorrelationData) sebagai Properties biasa;
+    pack() menyambung bytes tetap milik profil dengan hasil Properties.pack() field tersebut.
+    Field tetap (MessageExpiryInterval, UserProperty, ContentType) tidak tersedia sebagai atribut.
+    """
+    def __init__(self, static_packed):
+        super().__init__(PacketTypes.PUBLISH)
+        self._static_packed = static_packed
+
+    def __setattr__(self, name, value):
+        if name == '_static_packed': # Bukan nama property MQTT; Properties.__setattr__ akan menolaknya
+            object.__setattr__(self, name, value)
+        else:
+            super().__setattr__(name, value)
+
+    def isEmpty(self):
+        return not self._static_packed and super().isEmpty()
+
+    def pack(self):
+        per_message = super().pack()
+        _, length_prefix_size = VariableByteIntegers.decode(per_message)
+        buffer = self._static_packed + per_message[length_prefix_size:]
+        return VariableByteIntegers.encode(len(buffer)) + buffer
+
+class PublishProfile:
+    """Template PUBLISH untuk satu topik/profil dengan properties MQTTv5 yang tetap.
+
+    QoS, MessageExpiryInterval (sudah divalidasi), UserProperty dan ContentType dibangun dan
+    di-serialize sekali saat profil dibuat. publish() hanya menambahkan field per pesan
+    (ResponseTopic, CorrelationData); tanpa field tersebut objek Properties yang sama dipakai ulang.
+    Profil tidak boleh diubah setelah dibuat; buat profil baru untuk kombinasi properties lain.
+    """
+    def __init__(self, topic=None, qos=None, retain=False, message_expiry_interval=None,
+                 user_properties=None, content_type=None):
+        self.topic = topic # None: topik diberikan per publish (mis. ResponseTopic dari request)
+        self.qos = qos if qos is not None else DEFAULT_QOS
+        self.retain = retain
+        if message_expiry_interval is not None:
+            self.message_expiry_interval = _validate_message_expiry(message_expiry_interval)
+        else:
+            self.message_expiry_interval = DEFAULT_MESSAGE_EXPIRY_INTERVAL
+
+        static_props = Properties(PacketTypes.PUBLISH)
+        if self.message_expiry_interval is not None:
+            static_props.MessageExpiryInterval = self.message_expiry_interval
+        if user_properties:
+            static_props.UserProperty = list(user_properties)
+        if content_type:
+            static_props.ContentType = str(content_type)
+        packed = static_props.pack()
+        _, length_prefix_size = VariableByteIntegers.decode(packed)
+        self._static_packed = packed[length_prefix_size:] # Tanpa prefix panjang
+        self._shared_props = None if static_props.isEmpty() else _PrepackedPublishProperties(self._static_packed)
+
+    def build_properties(self, response_topic=None, correlation_data=None):
+        """Properties untuk satu pesan; None bila profil dan pesan tidak punya properties sama sekali."""
+        if not response_topic and not correlation_data:
+            return self._shared_props
+        props = _PrepackedPublishProperties(self._static_packed)
+        if response_topic:
+            props.ResponseTopic = str(response_topic)
+        if correlation_data:
+            if isinstance(correlation_data, str):
+                correlation_data = correlation_data.encode('utf-8')
+            props.CorrelationData = correlation_data
+        return props
+
+    def publish(self, client, payload, topic=None, response_topic=None, correlation_data=None, qos=None):
+        """Publish `payload` dengan properties profil. Return MQTTMessageInfo atau None bila gagal."""
+        topic = topic or self.topic
+        if not client:
+            log.error("Client object is None. Cannot publish to '%s'.", topic)
+            return None
+        if not client.is_connected() and not offline_buffering_enabled(client):
+            log.error("Client not connected. Cannot publish to '%s'.", topic)
+            return None
+        props_to_send = self.build_properties(response_topic, correlation_data) if _is_v5_client(client) else None
+        actual_qos = self.qos if qos is None else qos
+        queued = _enqueue_if_offline(client, topic, payload, actual_qos, self.retain, props_to_send)
+        if queued is not None:
+            return queued
+        try:
+            return client.publish(topic, payload, qos=actual_qos, retain=self.retain, properties=props_to_send)
+        except Exception as e_pub:
+            log.error("Exception during publish to '%s': %s", topic, e_pub)
+            return None
+
+def subscribe_to_topics(client, topics_with_qos_list, sub_properties=None, restore_on_reconnect=True):
+    # restore_on_reconnect: topik dicatat ReconnectManager dan di-subscribe ulang otomatis setelah reconnect
     if not client or not hasattr(client, 'is_connected') or not client.is_connected():
-        print("ERROR (mqtt_utils): Client not connected. Cannot subscribe.")
+        log.error("Client not connected. Cannot subscribe.")
         return None
     if not topics_with_qos_list:
-        print("INFO (mqtt_utils): No topics to subscribe to.")
+        log.info("No topics to subscribe to.")
         return None
     
     props_to_send = sub_properties if hasattr(client, '_protocol') and client._protocol == mqtt.MQTTv5 else None
+    tracker = getattr(client, '_suback_tracker', None)
+    manager = get_reconnect_manager(client) if restore_on_reconnect else None
     try:
-        return client.subscribe(topics_with_qos_list, properties=props_to_send)
+        if tracker is None:
+            result = client.subscribe(topics_with_qos_list, properties=props_to_send)
+        else:
+            # Lock ditahan sampai mid terdaftar, sehingga SUBACK yang datang sangat cepat tidak terlewat
+            with tracker.lock:
+                result = client.subscribe(topics_with_qos_list, properties=props_to_send)
+                if result[0] == mqtt.MQTT_ERR_SUCCESS:
+                    tracker.expect(result[1])
+        if manager and result[0] == mqtt.MQTT_ERR_SUCCESS:
+            manager.remember_subscriptions(topics_with_qos_list)
+        return result
     except Exception as e_sub:
-        print(f"ERROR (mqtt_utils): Exception during subscribe: {e_sub}")
+        log.error("Exception during subscribe: %s", e_sub)
+        return None
+
+def wait_for_suback(client, mid, timeout=SUBACK_TIMEOUT_DEFAULT):
+    """Tunggu SUBACK untuk mid dari subscribe_to_topics(). Return (ok, granted_qos_list)."""
+    tracker = getattr(client, '_suback_tracker', None)
+    if tracker is None or mid is None:
+        log.error("SUBACK tracking not available for this client/mid.")
+        return False, None
+    if threading.current_thread() is getattr(client, '_thread', None):
+        # Menunggu di thread network Paho akan deadlock karena SUBACK diproses di thread yang sama
+        log.error("wait_for_suback() called from the network thread (e.g. inside a callback).")
+        return False, None
+
+    ok, granted = tracker.wait(mid, timeout)
+    if granted is None:
+        log.warning("No SUBACK for mid %s within %ss.", mid, timeout)
+    elif not ok:
+        log.warning("Subscription rejected by broker (mid: %s, granted: %s).", mid, [str(g) for g in granted])
+    return ok, granted
+
+# --- Dispatch pesan masuk berdasarkan topik / filter MQTT ---
+def validate_topic_filter(topic_filter):
+    """ValueError bila filter tidak valid: '+' dan '#' harus satu level penuh, '#' hanya di level terakhir."""
+    levels = topic_filter.split('/')
+    for index, level in enumerate(levels):
+        if ('+' in level or '#' in level) and len(level) > 1:
+            raise ValueError(f"Wildcard must occupy a whole level in topic filter '{topic_filter}'")
+        if level == '#' and index != len(levels) - 1:
+            raise ValueError(f"'#' must be the last level in topic filter '{topic_filter}'")
+    return levels
+
+class _TopicTrieNode:
+    __slots__ = ('children', 'routes')
+
+    def __init__(self):
+        self.children = {}
+        self.routes = []
+
+class TopicDispatcher:
+    """Tabel topik/filter MQTT (dengan '+' dan '#') -> handler, dicocokkan lewat trie per level topik.
+
+    Setiap route mendeklarasikan decoder-nya sendiri (mis. decode_message_records, decode_message_text,
+    atau None untuk payload mentah). Handler dipanggil sebagai handler(client, msg, data); decoder yang
+    sama hanya dijalankan sekali per pesan walaupun beberapa route cocok. Route didaftarkan sekali (mis.
+    saat connect); dispatch() sendiri tidak memakai lock.
+    """
+    def __init__(self, default_handler=None, default_decoder=None):
+        self._root = _TopicTrieNode()
+        self._seq = itertools.count()
+        self.default_handler = default_handler # Dipanggil bila tidak ada route yang cocok
+        self.default_decoder = default_decoder
+        self.filters = []
+
+    def add_route(self, topic_filter, handler, decoder=None):
+        node = self._root
+        for level in validate_topic_filter(topic_filter):
+            node = node.children.setdefault(level, _TopicTrieNode())
+        node.routes.append((next(self._seq), handler, decoder))
+        self.filters.append(topic_filter)
+
+    def match(self, topic):
+        """Route (handler, decoder) yang cocok dengan topik, dalam urutan pendaftaran."""
+        levels = topic.split('/')
+        # Filter yang diawali wildcard tidak boleh cocok dengan topik sistem '$...' (MQTT 4.7.2)
+        allow_wildcards = not topic.startswith('$')
+        matched = []
+        nodes = [self._root]
+        for level in levels:
+            next_nodes = []
+            for node in nodes:
+                if allow_wildcards or node is not self._root:
+                    multi = node.children.get('#')
+                    if multi is not None:
+                        matched.extend(multi.routes)
+                    single = node.children.get('+')
+                    if single is not None:
+                        next_nodes.append(single)
+                exact = node.children.get(level)
+                if exact is not None:
+                    next_nodes.append(exact)
+            if not next_nodes:
+                break
+            nodes = next_nodes
+        else:
+            for node in nodes:
+                matched.extend(node.routes)
+                multi = node.children.get('#') # "a/#" juga cocok dengan "a"
+                if multi is not None:
+                    matched.extend(multi.routes)
+        matched.sort(key=lambda route: route[0])
+        return [(handler, decoder) for _, handler, decoder in matched]
+
+    def dispatch(self, client, msg):
+        """Panggil semua handler yang cocok. Return jumlah handler yang dipanggil (0 = default_handler)."""
+        routes = self.match(msg.topic)
+        if not routes:
+            if self.default_handler:
+                data = self.default_decoder(msg) if self.default_decoder else msg.payload
+                self.default_handler(client, msg, data)
+            return 0
+        decoded = {}
+        for handler, decoder in routes:
+            if decoder is None:
+                data = msg.payload
+            elif decoder in decoded:
+                data = decoded[decoder]
+            else:
+                data = decoded[decoder] = decoder(msg)
+            handler(client, msg, data)
+        return len(routes)
+
+# --- Codec payload, dipilih lewat property MQTTv5 ContentType ---
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_TELEMETRY = "application/vnd.grupm.telemetry.v1" # Biner berbasis skema (struct), lihat TelemetryCodec
+CONTENT_TYPE_MSGPACK = "application/msgpack"
+
+class PayloadCodecError(ValueError):
+    """Payload tidak bisa di-encode/di-decode oleh codec yang dipilih."""
+
+class JsonCodec:
+    content_type = CONTENT_TYPE_JSON
+
+    def encode(self, data):
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, payload):
+        try:
+            return json.loads(payload)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise PayloadCodecError(f"Invalid JSON payload: {e}") from e
+
+class TelemetryCodec:
+    """Encoding biner dengan skema tetap untuk satu pembacaan sensor.
+
+    Layout (little endian): metric id (uint8), count (uint32), value (float64), timestamp (float64),
+    lalu unit dan client_id sebagai string UTF-8 dengan prefix panjang uint8.
+    decode() mengembalikan dict dengan kunci yang sama seperti payload JSON sensor
+    ({"count", <metric>, "unit", "client_id", "timestamp"}), sehingga handler tidak perlu berubah.
+    """
+    content_type = CONTENT_TYPE_TELEMETRY
+    METRICS = ("temperature", "humidity") # Urutan = metric id - 1; tambahkan di akhir saja
+    _HEADER = struct.Struct("<BIdd")
+
+    def __init__(self):
+        self._metric_ids = {name: index + 1 for index, name in enumerate(self.METRICS)}
+
+    def encode(self, data):
+        for metric, metric_id in self._metric_ids.items():
+            if metric in data:
+                break
+        else:
+            raise PayloadCodecError(f"Telemetry payload has none of the metrics {self.METRICS}")
+        try:
+            header = self._HEADER.pack(metric_id, data.get("count", 0), data[metric], data.get("timestamp", 0.0))
+        except struct.error as e:
+            raise PayloadCodecError(f"Telemetry field out of range: {e}") from e
+        return header + self._pack_str(data.get("unit", "")) + self._pack_str(data.get("client_id", ""))
+
+    def decode(self, payload):
+        try:
+            metric_id, count, value, timestamp = self._HEADER.unpack_from(payload)
+            unit, offset = self._unpack_str(payload, self._HEADER.size)
+            client_id, _ = self._unpack_str(payload, offset)
+            metric = self.METRICS[metric_id - 1]
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            raise PayloadCodecError(f"Invalid telemetry payload: {e}") from e
+        return {"count": count, metric: value, "unit": unit, "client_id": client_id, "timestamp": timestamp}
+
+    @staticmethod
+    def _pack_str(value):
+        encoded = str(value).encode('utf-8')
+        if len(encoded) > 255:
+            raise PayloadCodecError(f"Telemetry string field longer than 255 bytes: {value[:32]}...")
+        return bytes((len(encoded),)) + encoded
+
+    @staticmethod
+    def _unpack_str(payload, offset):
+        length = payload[offset]
+        end = offset + 1 + length
+        if end > len(payload):
+            raise struct.error("string field truncated")
+        return bytes(payload[offset + 1:end]).decode('utf-8'), end
+
+class MsgpackCodec:
+    """MessagePack (opsional, butuh paket `msgpack`)."""
+    content_type = CONTENT_TYPE_MSGPACK
+
+    def encode(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, payload):
+        try:
+            return msgpack.unpackb(payload, raw=False)
+        except Exception as e:
+            raise PayloadCodecError(f"Invalid msgpack payload: {e}") from e
+
+PAYLOAD_CODECS = {} # {content_type: codec}
+
+def register_payload_codec(codec):
+    PAYLOAD_CODECS[codec.content_type] = codec
+    return codec
+
+register_payload_codec(JsonCodec())
+register_payload_codec(TelemetryCodec())
+if msgpack is not None:
+    register_payload_codec(MsgpackCodec())
+
+def get_payload_codec(content_type):
+    """Codec untuk ContentType; ContentType kosong/tidak dikenal diperlakukan sebagai JSON (perilaku lama)."""
+    return PAYLOAD_CODECS.get(content_type) or PAYLOAD_CODECS[CONTENT_TYPE_JSON]
+
+def encode_payload(data, content_type=CONTENT_TYPE_JSON):
+    codec = PAYLOAD_CODECS.get(content_type)
+    if codec is None:
+        raise PayloadCodecError(f"No payload codec registered for content type '{content_type}'")
+    return codec.encode(data)
+
+def decode_payload(payload, content_type=None):
+    """Decode payload sesuai ContentType. Return data atau None bila payload tidak cocok dengan codec."""
+    try:
+        return get_payload_codec(content_type).decode(payload)
+    except PayloadCodecError:
+        return None
+
+def decode_message_text(msg):
+    """Payload sebagai teks UTF-8, atau None bila bukan UTF-8 yang valid."""
+    try:
+        return msg.payload.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+def decode_message_payload(msg):
+    """decode_payload() untuk MQTTMessage: codec dipilih dari property ContentType pesan."""
+    content_type = getattr(msg.properties, 'ContentType', None) if msg.properties else None
+    return decode_payload(msg.payload, content_type)
+
+# --- Batch telemetri: banyak pembacaan dalam satu PUBLISH ---
+CONTENT_TYPE_BATCH = "application/vnd.grupm.batch.v1"
+BATCH_MAX_ITEMS = 0xFFFF
+_BATCH_HEADER = struct.Struct("<BB") # versi frame, panjang ContentType item
+_BATCH_COUNT = struct.Struct("<H")
+_BATCH_ITEM_LEN = struct.Struct("<I")
+_BATCH_VERSION = 1
+
+def encode_batch(item_payloads, item_content_type):
+    """Frame beberapa payload yang sudah di-encode (dengan codec `item_content_type`) menjadi satu payload.
+
+    Layout: versi (uint8), panjang ContentType item (uint8) + ContentType item, jumlah item (uint16),
+    lalu setiap item sebagai panjang (uint32) + bytes.
+    """
+    content_type_bytes = item_content_type.encode('utf-8')
+    if len(content_type_bytes) > 255 or len(item_payloads) > BATCH_MAX_ITEMS:
+        raise PayloadCodecError("Batch content type or item count too large")
+    parts = [_BATCH_HEADER.pack(_BATCH_VERSION, len(content_type_bytes)), content_type_bytes,
+             _BATCH_COUNT.pack(len(item_payloads))]
+    for item in item_payloads:
+        parts.append(_BATCH_ITEM_LEN.pack(len(item)))
+        parts.append(item)
+    return b"".join(parts)
+
+def decode_batch(payload):
+    """Kebalikan encode_batch(): return (item_content_type, [item payload bytes])."""
+    try:
+        version, content_type_len = _BATCH_HEADER.unpack_from(payload)
+        if version != _BATCH_VERSION:
+            raise PayloadCodecError(f"Unsupported batch frame version {version}")
+        offset = _BATCH_HEADER.size
+        item_content_type = bytes(payload[offset:offset + content_type_len]).decode('utf-8')
+        offset += content_type_len
+        (count,) = _BATCH_COUNT.unpack_from(payload, offset)
+        offset += _BATCH_COUNT.size
+        items = []
+        for _ in range(count):
+            (item_len,) = _BATCH_ITEM_LEN.unpack_from(payload, offset)
+            offset += _BATCH_ITEM_LEN.size
+            if offset + item_len > len(payload):
+                raise PayloadCodecError("Batch item truncated")
+            items.append(payload[offset:offset + item_len])
+            offset += item_len
+    except (struct.error, UnicodeDecodeError) as e:
+        raise PayloadCodecError(f"Invalid batch frame: {e}") from e
+    return item_content_type, items
+
+def decode_message_records(msg):
+    """Semua record dalam satu pesan: batch di-unpack otomatis, pesan biasa menjadi list satu elemen.
+
+    Record yang tidak bisa di-decode dilewati; list kosong berarti payload tidak dikenali codec mana pun.
+    """
+    content_type = getattr(msg.properties, 'ContentType', None) if msg.properties else None
+    if content_type != CONTENT_TYPE_BATCH:
+        record = decode_payload(msg.payload, content_type) if msg.payload else None
+        return [] if record is None else [record]
+    try:
+        item_content_type, items = decode_batch(msg.payload)
+    except PayloadCodecError as e:
+        log.warning("Dropping batch on '%s': %s", msg.topic, e)
+        return []
+    records = (decode_payload(item, item_content_type) for item in items)
+    return [record for record in records if record is not None]
+
+class TelemetryBatcher:
+    """Kumpulkan pembacaan untuk satu topik dan publish sebagai satu frame batch.
+
+    Batch di-flush saat berisi `max_items` pembacaan atau saat pembacaan tertua sudah menunggu
+    `max_delay_s` detik (dicek oleh add() dan oleh thread flusher dari start_flusher()).
+    `publish_batch(payload)` dipanggil dengan frame yang sudah jadi, misalnya PublishProfile.publish
+    dengan ContentType CONTENT_TYPE_BATCH atau RpcClient.request.
+    """
+    def __init__(self, publish_batch, max_items, max_delay_s, item_content_type=CONTENT_TYPE_JSON, name="batch"):
+        self.publish_batch = publish_batch
+        self.max_items = max(1, min(int(max_items), BATCH_MAX_ITEMS))
+        self.max_delay_s = max_delay_s
+        self.item_content_type = item_content_type
+        self.name = name
+        self._lock = threading.Lock()
+        self._items = []
+        self._oldest = None # time.monotonic() saat item pertama batch ini masuk
+        self._flusher = None
+        self._flusher_stop = threading.Event()
+        self.stats = {'readings': 0, 'batches': 0, 'publish_errors': 0}
+
+    def add(self, record):
+        """Encode satu pembacaan dan tambahkan ke batch; flush bila batch penuh atau sudah terlalu lama."""
+        payload = encode_payload(record, self.item_content_type)
+        now = time.monotonic()
+        with self._lock:
+            if not self._items:
+                self._oldest = now
+            self._items.append(payload)
+            self.stats['readings'] += 1
+            due = len(self._items) >= self.max_items or now - self._oldest >= self.max_delay_s
+        if due:
+            return self.flush()
         return None
 
+    def flush(self):
+        """Publish batch yang sedang terkumpul (bila ada). Return hasil publish_batch atau None."""
+        with self._lock:
+            items, self._items, self._oldest = self._items, [], None
+        if not items:
+            return None
+        result = self.publish_batch(encode_batch(items, self.item_content_type))
+        failed = result is None or getattr(result, 'rc', mqtt.MQTT_ERR_SUCCESS) != mqtt.MQTT_ERR_SUCCESS
+        with self._lock:
+            self.stats['batches'] += 1
+            if failed:
+                self.stats['publish_errors'] += 1
+        return result
+
+    def flush_if_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            due = self._oldest is not None and now - self._oldest >= self.max_delay_s
+        return self.flush() if due else None
+
+    def start_flusher(self, interval=None):
+        """Thread daemon yang mem-flush batch yang sudah menunggu max_delay_s walaupun tidak ada add() baru."""
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        interval = interval if interval is not None else max(self.max_delay_s / 4, 0.005)
+        self._flusher_stop.clear()
+
+        def _flush_loop():
+            while not self._flusher_stop.wait(interval):
+                self.flush_if_due()
+
+        self._flusher = threading.Thread(target=_flush_loop, name=f"batch-flusher-{self.name}", daemon=True)
+        self._flusher.start()
+
+    def stop_flusher(self, flush=True):
+        self._flusher_stop.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=2)
+        self._flusher = None
+        if flush:
+            self.flush()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['buffered'] = len(self._items)
+        return stats
+
+def get_telemetry_content_type():
+    # Codec untuk data sensor dari settings.json; fallback ke JSON bila codec tidak tersedia
+    payload_cfg = GLOBAL_SETTINGS.get("payload_settings", {})
+    content_type = payload_cfg.get("telemetry_content_type", CONTENT_TYPE_JSON)
+    if content_type not in PAYLOAD_CODECS:
+        log.warning("No codec for telemetry_content_type '%s', falling back to '%s'.", content_type, CONTENT_TYPE_JSON)
+        return CONTENT_TYPE_JSON
+    return content_type
+
+def get_telemetry_batch_settings():
+    """(max_readings, max_delay_s) untuk batch telemetri; max_readings <= 1 berarti batching mati."""
+    payload_cfg = GLOBAL_SETTINGS.get("payload_settings", {})
+    max_readings = int(payload_cfg.get("batch_max_readings", 1) or 1)
+    max_delay_s = float(payload_cfg.get("batch_max_delay_ms", 1000)) / 1000.0
+    return max_readings, max_delay_s
+
+def get_sensor_schedule_settings():
+    """(temperature_interval_s, humidity_interval_s); default keduanya sensor_publish_interval (5 detik)."""
+    default_interval = float(GLOBAL_SETTINGS.get("sensor_publish_interval", 5))
+    schedule_cfg = GLOBAL_SETTINGS.get("sensor_schedule_settings", {})
+    intervals = []
+    for key in ("temperature_interval_s", "humidity_interval_s"):
+        interval = schedule_cfg.get(key)
+        interval = float(interval) if interval is not None else default_interval
+        if interval <= 0:
+            log.warning("sensor_schedule_settings.%s must be positive, using %ss.", key, default_interval)
+            interval = default_interval
+        intervals.append(interval)
+    return tuple(intervals)
+
+class _ScheduledJob:
+    __slots__ = ('name', 'interval', 'callback', 'start_delay', 'fired', 'missed', 'errors',
+                 'lag_last', 'lag_max', 'lag_sum')
+
+    def __init__(self, name, interval, callback, start_delay):
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.start_delay = start_delay
+        self.fired = 0
+        self.missed = 0 # Slot yang dilewati karena sudah terlambat lebih dari satu interval
+        self.errors = 0
+        self.lag_last = 0.0 # Detik antara deadline dan saat callback benar-benar dimulai
+        self.lag_max = 0.0
+        self.lag_sum = 0.0
+
+class DeadlineScheduler:
+    """Penjadwal job periodik pada deadline absolut jam monotonic (start + k * interval).
+
+    Durasi callback (publish, print) dan jeda reconnect tidak menggeser jadwal, jadi periode rata-rata
+    tetap tepat pada run panjang. Bisa multi-rate (mis. suhu 10 Hz dan kelembaban 1 Hz). Slot yang
+    terlambat lebih dari satu interval dihitung `missed` dan dilewati, tidak dikejar beruntun.
+    Semua callback berjalan di thread pemanggil run(); stop() boleh dipanggil dari thread lain.
+    """
+    def __init__(self, name="scheduler", clock=time.monotonic):
+        self.name = name
+        self._clock = clock
+        self._jobs = {}
+        self._heap = [] # (deadline, seq, job)
+        self._seq = itertools.count()
+        self._stop_event = threading.Event()
+
+    def add_job(self, name, interval_s, callback, start_delay_s=0.0):
+        """Daftarkan callback() setiap interval_s detik; slot pertama start_delay_s setelah run() dimulai."""
+        if interval_s <= 0:
+            raise ValueError(f"interval_s for job '{name}' must be positive, got {interval_s}")
+        if name in self._jobs:
+            raise ValueError(f"Job '{name}' is already scheduled on '{self.name}'")
+        self._jobs[name] = _ScheduledJob(name, float(interval_s), callback, float(start_delay_s))
+
+    def run(self):
+        """Jalankan job sampai stop() dipanggil (blocking)."""
+        start = self._clock()
+        self._heap = [(start + job.start_delay, next(self._seq), job) for job in self._jobs.values()]
+        heapq.heapify(self._heap)
+        while self._heap and not self._stop_event.is_set():
+            deadline, _, job = self._heap[0]
+            delay = deadline - self._clock()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            heapq.heappop(self._heap)
+            lag = self._clock() - deadline
+            if lag >= job.interval:
+                skipped = int(lag // job.interval)
+                job.missed += skipped
+                deadline += skipped * job.interval
+                lag -= skipped * job.interval
+            job.lag_last = lag
+            job.lag_sum += lag
+            if lag > job.lag_max:
+                job.lag_max = lag
+            job.fired += 1
+            try:
+                job.callback()
+            except Exception as e_job:
+                job.errors += 1
+                log.error("Scheduled job '%s' on '%s' raised: %s", job.name, self.name, e_job)
+            heapq.heappush(self._heap, (deadline + job.interval, next(self._seq), job))
+
+    def stop(self):
+        self._stop_event.set()
+
+    def get_stats(self):
+        """{nama job: {interval_s, fired, missed, errors, lag_last_ms, lag_max_ms, lag_mean_ms}}"""
+        return {
+            job.name: {
+                'interval_s': job.interval,
+                'fired': job.fired,
+                'missed': job.missed,
+                'errors': job.errors,
+                'lag_last_ms': round(job.lag_last * 1000, 3),
+                'lag_max_ms': round(job.lag_max * 1000, 3),
+                'lag_mean_ms': round(job.lag_sum / job.fired * 1000, 3) if job.fired else None,
+            }
+            for job in self._jobs.values()
+        }
+
+_req_res_cfg = GLOBAL_SETTINGS.get("request_response_settings", {})
+RPC_TIMEOUT_DEFAULT = _req_res_cfg.get("request_timeout_s", 30) # detik sebelum request tanpa response dianggap expired
+RPC_SWEEP_INTERVAL_DEFAULT = _req_res_cfg.get("sweep_interval_s", 1.0) # detik antar sapuan sweeper
+RPC_UNSUBSCRIBE_BATCH_MAX = _req_res_cfg.get("unsubscribe_batch_max", 50) # topik per paket UNSUBSCRIBE
+RPC_GROUP_TIMEOUT_DEFAULT = _req_res_cfg.get("group_request_timeout_s", 3) # detik mengumpulkan response broadcast
+
+class RpcError(Exception):
+    """Request gagal dikirim (subscribe response atau publish gagal, client putus)."""
+
+class RpcTimeoutError(RpcError, TimeoutError):
+    """Tidak ada response sebelum deadline request."""
+
+def classify_group_response(msg):
+    """(responder_id, ok) untuk satu response broadcast.
+
+    responder_id diambil dari "client_id" di payload (fallback: topik response); ok False bila payload
+    berisi "error_code" atau processed_status selain "success", atau tidak bisa di-decode.
+    """
+    data = decode_message_payload(msg)
+    if not isinstance(data, dict):
+        return msg.topic, False
+    responder_id = data.get("client_id") or msg.topic
+    ok = not data.get("error_code") and data.get("processed_status", "success") == "success"
+    return responder_id, ok
+
+class GroupRpcResult:
+    """Hasil satu request broadcast (RpcClient.broadcast): semua response yang masuk sebelum deadline.
+
+    - responses: {responder_id: (ok, latency_s, msg)}; response kedua dari responder yang sama dihitung
+      di `duplicates` dan diabaikan.
+    - timed_out: anggota `expected` yang belum menjawab (None bila anggota grup tidak diketahui).
+    - unexpected: responder yang menjawab tetapi tidak ada di `expected`.
+    Latency (waktu publish -> response diterima) tersimpan per response; summary() menghitung distribusinya.
+    Diisi oleh RpcClient di bawah lock-nya; baca setelah Future selesai.
+    """
+    def __init__(self, correlation_id, expected=None, classify_response=None):
+        self.correlation_id = correlation_id
+        self.expected = frozenset(expected) if expected is not None else None
+        self.classify_response = classify_response or classify_group_response
+        self.sent_at = time.monotonic()
+        self.responses = {}
+        self.duplicates = 0
+        self.completed_early = False # True bila semua anggota expected menjawab sebelum deadline
+
+    def add_response(self, responder_id, ok, msg, now=None):
+        """Catat satu response. Return True bila semua anggota expected sudah menjawab."""
+        if responder_id in self.responses:
+            self.duplicates += 1
+            return False
+        latency_s = (time.monotonic() if now is None else now) - self.sent_at
+        self.responses[responder_id] = (ok, latency_s, msg)
+        if self.expected and self.expected.issubset(self.responses):
+            self.completed_early = True
+            return True
+        return False
+
+    @property
+    def succeeded(self):
+        return [responder_id for responder_id, (ok, _, _) in self.responses.items() if ok]
+
+    @property
+    def failed(self):
+        return [responder_id for responder_id, (ok, _, _) in self.responses.items() if not ok]
+
+    @property
+    def timed_out(self):
+        if self.expected is None:
+            return None
+        return sorted(self.expected.difference(self.responses))
+
+    @property
+    def unexpected(self):
+        if self.expected is None:
+            return []
+        return [responder_id for responder_id in self.responses if responder_id not in self.expected]
+
+    def summary(self):
+        """Ringkasan jumlah dan distribusi latency (ms) untuk ditampilkan/dilog."""
+        timed_out = self.timed_out
+        # Response broadcast hanya puluhan: persentil nearest-rank langsung dari latency yang diurutkan
+        latencies = sorted(latency_s for _, latency_s, _ in self.responses.values())
+        percentiles = {p: latencies[max(1, math.ceil(p / 100.0 * len(latencies))) - 1] if latencies else None
+                       for p in (50.0, 90.0, 99.0)}
+        return {
+            'expected': len(self.expected) if self.expected is not None else None,
+            'responded': len(self.responses),
+            'succeeded': len(self.succeeded),
+            'failed': len(self.failed),
+            'timed_out': len(timed_out) if timed_out is not None else None,
+            'unexpected': len(self.unexpected),
+            'duplicates': self.duplicates,
+            'completed_early': self.completed_early,
+            'latency_ms': {
+                'min': round(latencies[0] * 1000, 3) if latencies else None,
+                **{f"p{p:g}": round(v * 1000, 3) if v is not None else None for p, v in percentiles.items()},
+                'max': round(latencies[-1] * 1000, 3) if latencies else None,
+            },
+        }
+
+class RpcClient:
+    """Helper request/response di atas satu client Paho.
+
+    - Mode "wildcard": satu subscription response (<base>/<client_id>/#) yang dibuat ulang setiap connect.
+      Mode "per_request": subscribe per request (menunggu SUBACK) dan unsubscribe saat selesai/expire.
+    - Tabel correlation ID + heap deadline; request yang lewat deadline gagal dengan RpcTimeoutError.
+      start_sweeper() menjalankan thread yang meng-expire request secara berkala, sehingga memori dan
+      jumlah subscription tetap datar walaupun tidak ada response sama sekali.
+    - Topik response per_request di-unsubscribe secara batch (satu paket UNSUBSCRIBE untuk banyak topik).
+    - request() mengembalikan concurrent.futures.Future berisi pesan response (MQTTMessage).
+      Callback future berjalan di thread yang menyelesaikannya (thread network Paho untuk response).
+    - broadcast() mengirim satu request ke banyak responder (mis. grup lampu) dan mengumpulkan semua
+      response dengan CorrelationData yang sama sampai deadline, lewat topik response yang sama
+      (bukan satu subscription per responder). Future berisi GroupRpcResult.
+    Panggil subscribe_responses() dari on_connect dan handle_message() dari on_message.
+    """
+    def __init__(self, client, client_id, response_base, mode=None, qos=1, default_timeout=RPC_TIMEOUT_DEFAULT):
+        self.client = client
+        self.client_id = client_id
+        self.response_base = response_base.rstrip('/')
+        self.mode = mode or get_response_subscription_mode()
+        self.qos = qos
+        self.default_timeout = default_timeout
+        self._lock = threading.Lock()
+        self._pending = {} # {correlation_id: {'future', 'deadline', 'response_topic'}}
+        self._deadlines = [] # heap (deadline, seq, correlation_id); entri basi dibuang saat di-pop
+        self._seq = itertools.count()
+        self._unsubscribe_queue = [] # Topik response per_request yang menunggu di-unsubscribe
+        self._sweeper = None
+        self._sweeper_stop = threading.Event()
+        self.stats = {'sent': 0, 'completed': 0, 'expired': 0, 'failed': 0, 'late_responses': 0,
+                      'subscriptions': 0, 'unsubscriptions': 0, 'unsubscribe_packets': 0, 'sweeps': 0,
+                      'broadcasts': 0, 'group_responses': 0}
+
+    def response_filter(self):
+        return response_subscription_filter(self.response_base, self.client_id)
+
+    def subscribe_responses(self):
+        # Aman dipanggil dari on_connect (tidak menunggu SUBACK). Tidak melakukan apa pun di mode per_request
+        # atau bila ReconnectManager sudah memulihkan subscription setelah reconnect.
+        if self.mode != RESPONSE_MODE_WILDCARD or subscriptions_restored(self.client):
+            return None
+        result = subscribe_to_topics(self.client, [(self.response_filter(), self.qos)])
+        if result and result[0] == mqtt.MQTT_ERR_SUCCESS:
+            self._count('subscriptions')
+        return result
+
+    def request(self, topic, payload, timeout=None, qos=None, profile=None, **publish_kwargs):
+        """Publish request dengan ResponseTopic + CorrelationData. Return Future (hasil: pesan response).
+
+        publish_kwargs diteruskan ke publish_message() (user_properties, content_type, dst).
+        Dengan `profile` (PublishProfile) properties tetap diambil dari profil dan publish_kwargs diabaikan.
+        Di mode per_request fungsi ini menunggu SUBACK, jadi jangan dipanggil dari callback Paho.
+        """
+        return self._send(topic, payload, timeout if timeout is not None else self.default_timeout,
+                          qos, profile, publish_kwargs)
+
+    def broadcast(self, topic, payload, timeout=None, expected=None, classify_response=None,
+                  qos=None, profile=None, **publish_kwargs):
+        """Publish satu request untuk banyak responder; kumpulkan semua response sampai deadline.
+
+        `expected` (iterable responder_id, opsional) adalah anggota grup yang diharapkan menjawab:
+        Future selesai lebih awal bila semuanya sudah menjawab, dan sisanya dilaporkan sebagai timed_out.
+        `classify_response(msg)` -> (responder_id, ok); default classify_group_response().
+        Return Future berisi GroupRpcResult (tidak pernah RpcTimeoutError; deadline = akhir pengumpulan).
+        Hasil sementara tersedia di future.group selama pengumpulan berjalan.
+        """
+        timeout = timeout if timeout is not None else RPC_GROUP_TIMEOUT_DEFAULT
+        return self._send(topic, payload, timeout, qos, profile, publish_kwargs,
+                          expected=expected, classify_response=classify_response, group=True)
+
+    def _send(self, topic, payload, timeout, qos, profile, publish_kwargs,
+              expected=None, classify_response=None, group=False):
+        correlation_id = str(uuid.uuid4())
+        response_topic = build_response_topic(self.response_base, self.client_id, correlation_id, self.mode)
+        deadline = time.monotonic() + timeout
+        future = Future()
+        future.correlation_id = correlation_id
+        future.group = GroupRpcResult(correlation_id, expected, classify_response) if group else None
+
+        # Daftarkan sebelum publish: response bisa datang sebelum publish() kembali
+        with self._lock:
+            self._pending[correlation_id] = {'future': future, 'deadline': deadline, 'group': future.group,
+                                             'response_topic': response_topic if self.mode != RESPONSE_MODE_WILDCARD else None}
+            heapq.heappush(self._deadlines, (deadline, next(self._seq), correlation_id))
+
+        if self.mode != RESPONSE_MODE_WILDCARD:
+            sub_result = subscribe_to_topics(self.client, [(response_topic, self.qos)], restore_on_reconnect=False)
+            if not (sub_result and sub_result[0] == mqtt.MQTT_ERR_SUCCESS and wait_for_suback(self.client, sub_result[1])[0]):
+                self._finish(correlation_id, error=RpcError(f"Could not subscribe to response topic '{response_topic}'"))
+                return future
+            self._count('subscriptions')
+
+        if profile is not None:
+            result = profile.publish(self.client, payload, topic=topic, response_topic=response_topic,
+                                     correlation_data=correlation_id.encode('utf-8'), qos=qos)
+        else:
+            result = publish_message(self.client, topic, payload, qos=qos, response_topic=response_topic,
+                                     correlation_data=correlation_id.encode('utf-8'), **publish_kwargs)
+        if not (result and result.rc == mqtt.MQTT_ERR_SUCCESS):
+            self._finish(correlation_id, error=RpcError(f"Publish to '{topic}' failed (RC: {result.rc if result else 'N/A'})"))
+            return future
+        self._count('sent')
+        if group:
+            self._count('broadcasts')
+        self.expire()
+        return future
+
+    def handle_message(self, msg):
+        """Cocokkan pesan masuk dengan request yang menunggu. Return True bila pesan adalah response milik RpcClient."""
+        correlation_data = getattr(msg.properties, 'CorrelationData', None) if msg.properties else None
+        if not correlation_data or not msg.topic.startswith(self.response_base + '/'):
+            return False
+        correlation_id = correlation_data.decode('utf-8', errors='replace')
+        with self._lock:
+            entry = self._pending.get(correlation_id)
+        group = entry['group'] if entry is not None else None
+        if group is not None:
+            # Broadcast: tetap menunggu response lain sampai deadline (atau semua anggota expected menjawab)
+            responder_id, ok = group.classify_response(msg) # Decode di luar lock
+            with self._lock:
+                pending = self._pending.get(correlation_id) is entry
+                all_answered = pending and group.add_response(responder_id, ok, msg)
+                if pending:
+                    self.stats['group_responses'] += 1
+            if not pending:
+                self._count('late_responses')
+            elif all_answered:
+                self._finish(correlation_id, response=group)
+        elif not self._finish(correlation_id, response=msg):
+            self._count('late_responses') # Response untuk request yang sudah expire/selesai
+        self.expire()
+        return True
+
+    def expire(self, now=None):
+        """Gagalkan request yang sudah lewat deadline (broadcast: selesaikan dengan hasilnya). Return jumlahnya."""
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                deadline, _, correlation_id = heapq.heappop(self._deadlines)
+                entry = self._pending.get(correlation_id)
+                if entry is not None and entry['deadline'] == deadline:
+                    expired.append((correlation_id, entry['group']))
+            if not self._pending:
+                self._deadlines.clear() # Buang entri basi dari request yang sudah selesai
+        for correlation_id, group in expired:
+            if group is not None: # Deadline broadcast = akhir pengumpulan, bukan kegagalan
+                self._finish(correlation_id, response=group)
+            else:
+                self._finish(correlation_id, error=RpcTimeoutError(f"No response for request {correlation_id} before its deadline"))
+        return len(expired)
+
+    def start_sweeper(self, interval=RPC_SWEEP_INTERVAL_DEFAULT):
+        """Jalankan thread daemon yang memanggil expire() dan flush_unsubscribes() setiap `interval` detik."""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._sweeper_stop.clear()
+
+        def _sweep_loop():
+            while not self._sweeper_stop.wait(interval):
+                self.expire()
+                self.flush_unsubscribes()
+                self._count('sweeps')
+
+        self._sweeper = threading.Thread(target=_sweep_loop, name=f"rpc-sweeper-{self.client_id}", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._sweeper_stop.set()
+        if self._sweeper is not None and self._sweeper is not threading.current_thread():
+            self._sweeper.join(timeout=2)
+        self._sweeper = None
+
+    def flush_unsubscribes(self):
+        """Kirim UNSUBSCRIBE untuk topik response yang sudah selesai, maksimal RPC_UNSUBSCRIBE_BATCH_MAX topik per paket."""
+        if not self.client.is_connected():
+            return 0 # Tetap di antrean; dikirim setelah connect kembali
+        with self._lock:
+            topics, self._unsubscribe_queue = self._unsubscribe_queue, []
+        for start in range(0, len(topics), RPC_UNSUBSCRIBE_BATCH_MAX):
+            batch = topics[start:start + RPC_UNSUBSCRIBE_BATCH_MAX]
+            rc, _ = self.client.unsubscribe(batch)
+            if rc != mqtt.MQTT_ERR_SUCCESS:
+                with self._lock:
+                    self._unsubscribe_queue.extend(topics[start:])
+                break
+            with self._lock:
+                self.stats['unsubscriptions'] += len(batch)
+                self.stats['unsubscribe_packets'] += 1
+        return len(topics)
+
+    def cancel_all(self, reason="RPC client shutting down"):
+        """Gagalkan semua request yang masih menunggu (mis. saat shutdown) dan hentikan sweeper."""
+        self.stop_sweeper()
+        with self._lock:
+            correlation_ids = list(self._pending)
+        for correlation_id in correlation_ids:
+            self._finish(correlation_id, error=RpcError(reason))
+        self.flush_unsubscribes()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _finish(self, correlation_id, response=None, error=None):
+        with self._lock:
+            entry = self._pending.pop(correlation_id, None)
+            if entry is None:
+                return False
+            if error is None:
+                self.stats['completed'] += 1
+            elif isinstance(error, RpcTimeoutError):
+                self.stats['expired'] += 1
+            else:
+                self.stats['failed'] += 1
+            if entry['response_topic']:
+                self._unsubscribe_queue.append(entry['response_topic'])
+                flush_now = len(self._unsubscribe_queue) >= RPC_UNSUBSCRIBE_BATCH_MAX
+            else:
+                flush_now = False
+        if flush_now or (entry['response_topic'] and self._sweeper is None):
+            self.flush_unsubscribes() # Tanpa sweeper tidak ada yang flush nanti
+        try:
+            if error is None:
+                entry['future'].set_result(response)
+            else:
+                entry['future'].set_exception(error)
+        except InvalidStateError:
+            pass # Future sudah dibatalkan oleh pemanggil
+        return True
+
 def disconnect_client(client,
                       lwt_topic=None,
                       lwt_payload_offline_graceful=None,
@@ -244,12 +1778,17 @@ def disconnect_client(client,
                       lwt_retain=None,
                       reason_code=0, # MQTTv5: 0 = Normal disconnection
                       reason_string="Client shutting down normally",
-                      session_expiry_interval=0):
+                      session_expiry_interval=None):
+    # session_expiry_interval None: SessionExpiryInterval dari CONNECT tetap berlaku (sesi persisten bertahan);
+    # 0 = akhiri sesi sekarang. Nilai > 0 hanya boleh bila CONNECT juga > 0 (MQTTv5 protocol error bila tidak).
     if client:
         client_id_str = getattr(client, '_client_id', 'UnknownClient')
         client_id_str = client_id_str.decode() if isinstance(client_id_str, bytes) else str(client_id_str)
         
-        print(f"INFO (mqtt_utils): Disconnecting client '{client_id_str}'...")
+        log.info("Disconnecting client '%s'...", client_id_str)
+        manager = get_reconnect_manager(client)
+        if manager: # Disconnect disengaja: tidak mengantre lagi; sisa antrean disk tetap untuk proses berikutnya
+            manager.close()
 
         if lwt_payload_offline_graceful and hasattr(client, 'is_connected') and client.is_connected():
             actual_lwt_topic = lwt_topic
@@ -263,14 +1802,14 @@ def disconnect_client(client,
             actual_lwt_retain = lwt_retain if lwt_retain is not None else GLOBAL_SETTINGS.get("lwt_retain", True)
 
             if actual_lwt_topic:
-                print(f"INFO (mqtt_utils): Publishing 'offline_graceful' LWT to '{actual_lwt_topic}' for '{client_id_str}'")
+                log.info("Publishing 'offline_graceful' LWT to '%s' for '%s'", actual_lwt_topic, client_id_str)
                 publish_message(
                     client, topic=actual_lwt_topic, payload=lwt_payload_offline_graceful,
                     qos=actual_lwt_qos, retain=actual_lwt_retain
                 )
                 time.sleep(0.5) # Beri waktu pesan terkirim
             else:
-                print(f"WARNING (mqtt_utils): Cannot publish 'offline_graceful' for '{client_id_str}', LWT topic not determined.")
+                log.warning("Cannot publish 'offline_graceful' for '%s', LWT topic not determined.", client_id_str)
         
         if hasattr(client, 'loop_stop') and callable(client.loop_stop): client.loop_stop()# Hentikan loop Paho v1.x
         # Untuk Paho v2.x, loop_stop() mungkin tidak ada atau berbeda, disconnect menangani loop.
@@ -281,18 +1820,21 @@ def disconnect_client(client,
             
             if is_v5_client:
                 disconnect_props = Properties(PacketTypes.DISCONNECT)
-                disconnect_props.SessionExpiryInterval = session_expiry_interval
+                if session_expiry_interval is not None:
+                    disconnect_props.SessionExpiryInterval = session_expiry_interval
                 if reason_string:
                     disconnect_props.ReasonString = reason_string
             
             try:
-                print(f"INFO (mqtt_utils): Initiating disconnect for '{client_id_str}' (RC={reason_code}, Props={vars(disconnect_props) if disconnect_props else 'None'})")
+                log.info("Initiating disconnect for '%s' (RC=%s, Reason=%s)", client_id_str, reason_code, getattr(disconnect_props, 'ReasonString', None))
                 if is_v5_client:
+                    if isinstance(reason_code, int): # Paho 2.x butuh objek ReasonCode, bukan int
+                        reason_code = ReasonCode(PacketTypes.DISCONNECT, identifier=reason_code)
                     client.disconnect(reasoncode=reason_code, properties=disconnect_props)
                 else: # MQTTv3.1.1
                     client.disconnect()
-                print(f"INFO (mqtt_utils): Client '{client_id_str}' disconnect command sent.")
+                log.info("Client '%s' disconnect command sent.", client_id_str)
             except Exception as e_disc:
-                print(f"ERROR (mqtt_utils): Exception during client.disconnect() for '{client_id_str}': {e_disc}")
+                log.error("Exception during client.disconnect() for '%s': %s", client_id_str, e_disc)
         else:
-            print(f"INFO (mqtt_utils): Client '{client_id_str}' was already disconnected or not fully connected.")
\ No newline at end of file
+            log.info("Client '%s' was already disconnected or not fully connected.", client_id_str)
@@ -1,7 +1,7 @@
 import paho.mqtt.client as mqtt
 import json
 import time
-import uuid
+import threading
 from pathlib import Path
 import sys
 
@@ -9,9 +9,16 @@ COMMON_DIR = Path(__file__).resolve().parent.parent / 'common'
 sys.path.append(str(COMMON_DIR))
 
 from mqtt_utils import (
-    GLOBAL_SETTINGS, create_mqtt_client, publish_message,
-    subscribe_to_topics, disconnect_client
+    GLOBAL_SETTINGS, create_mqtt_client,
+    subscribe_to_topics, subscriptions_restored, disconnect_client,
+    get_response_subscription_mode, RpcClient, RpcError, RpcTimeoutError,
+    PublishProfile, decode_message_records, decode_message_text, decode_message_payload,
+    TopicDispatcher, CONTENT_TYPE_JSON, build_group_topic, build_client_id, RPC_GROUP_TIMEOUT_DEFAULT
 )
+from device_table import DeviceTable, DEVICE_KIND_SENSOR, DEVICE_KIND_LAMP, STATUS_ONLINE
+from log_utils import get_logger
+
+log = get_logger("panel") # Level diatur lewat logging_settings.levels.panel
 
 # Konfigurasi (sama seperti versi terakhir)
 broker_address_cfg = GLOBAL_SETTINGS.get("broker_address")
@@ -24,13 +31,23 @@ LAMP_LWT_TOPIC = topics_config.get("lamp_lwt")
 PANEL_LWT_TOPIC = topics_config.get("panel_lwt")
 HUMIDITY_TOPIC_DATA = topics_config.get("humidity_data")
 LAMP_COMMAND_RESPONSE_BASE = topics_config.get("lamp_command_response_base")
+LAMP_GROUP_COMMAND_BASE = topics_config.get("lamp_group_command_base")
 TEMPERATURE_RESPONSE_BASE = topics_config.get("temperature_response_base")
+RESPONSE_SUBSCRIPTION_MODE = get_response_subscription_mode()
 
 panel_specific_cfg = GLOBAL_SETTINGS.get("panel_specific_settings", {})
 PANEL_SUBSCRIBED_TOPICS_STR_LIST = panel_specific_cfg.get("subscribed_topics_list", [])
-
-CLIENT_ID_PREFIX = GLOBAL_SETTINGS.get('client_id_prefix', 'panel_m5_')
-CLIENT_ID = f"{CLIENT_ID_PREFIX}{str(uuid.uuid4())[:8]}"
+DASHBOARD_MAX_REFRESH_HZ = panel_specific_cfg.get("dashboard_max_refresh_hz", 2) # Batas redraw per detik
+DASHBOARD_IDLE_REFRESH_S = panel_specific_cfg.get("dashboard_idle_refresh_s") # Redraw berkala walau tidak ada perubahan (None = tidak)
+DASHBOARD_DEVICE_ROWS = panel_specific_cfg.get("dashboard_device_rows", 10) # Device terbaru yang ditampilkan di dashboard
+DEVICE_WINDOW_S = panel_specific_cfg.get("device_window_s", 60) # Jendela agregat bergulir min/max/mean
+DEVICE_WINDOW_BUCKETS = panel_specific_cfg.get("device_window_buckets", 6)
+GROUP_COMMAND_TIMEOUT_S = RPC_GROUP_TIMEOUT_DEFAULT # request_response_settings.group_request_timeout_s, sama dengan RpcClient.broadcast()
+# Filter wildcard tambahan untuk armada device, per jenis topik (kunci sama dengan "topics"),
+# mis. {"temperature": ["iot/project/fleet/+/temperature"]}. Tanpa client_id di payload, topik dipakai sebagai ID device.
+FLEET_TOPIC_FILTERS = panel_specific_cfg.get("fleet_topic_filters", {})
+
+CLIENT_ID = build_client_id("panel", 'panel_m5_') # Stabil bila GRUPM_PANEL_CLIENT_ID / session_settings.roles.panel.client_id diisi
 DEFAULT_QOS_PANEL = GLOBAL_SETTINGS.get("default_qos", 1)
 LWT_QOS_PANEL = GLOBAL_SETTINGS.get("lwt_qos", 1)
 LWT_RETAIN_PANEL = GLOBAL_SETTINGS.get("lwt_retain", True)
@@ -38,12 +55,17 @@ LWT_RETAIN_PANEL = GLOBAL_SETTINGS.get("lwt_retain", True)
 mqtt_advanced_cfg = GLOBAL_SETTINGS.get("mqtt_advanced_settings", {})
 DEFAULT_MESSAGE_EXPIRY_PANEL_CMD = mqtt_advanced_cfg.get("default_message_expiry_interval")
 
-# Variabel untuk menyimpan status terakhir (agar tampilan lebih rapi)
+# Properties tetap dibangun sekali, bukan di setiap perintah/ACK
+LAMP_COMMAND_PROFILE = PublishProfile(LAMP_COMMAND_TOPIC, qos=DEFAULT_QOS_PANEL,
+                                      message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_PANEL_CMD,
+                                      user_properties=[("command_source", CLIENT_ID)], content_type="text/plain")
+TEMPERATURE_ACK_PROFILE = PublishProfile(qos=DEFAULT_QOS_PANEL, message_expiry_interval=60) # Topik = ResponseTopic request
+
+# Status per device (per client_id) dan agregat bergulir; pembacaan terakhir dari device mana pun tetap ditampilkan
+device_table = DeviceTable(window_s=DEVICE_WINDOW_S, buckets=DEVICE_WINDOW_BUCKETS)
 last_temperature = "N/A"
 last_humidity = "N/A"
 last_lamp_state = "N/A"
-sensor_connection_status = "UNKNOWN"
-lamp_connection_status = "UNKNOWN"
 
 print(f"--- Panel Client MQTTv5 ({CLIENT_ID}) ---")
 print(f"Target Broker: {broker_address_cfg} (Port ditentukan oleh TLS setting)")
@@ -54,173 +76,407 @@ PANEL_LWT_PAYLOAD_ONLINE_str = json.dumps({"client_id": CLIENT_ID, "status": "on
 PANEL_LWT_PAYLOAD_OFFLINE_UNEXPECTED_str = json.dumps({"client_id": CLIENT_ID, "status": "offline_unexpected", "timestamp": time.time()}) if PANEL_LWT_TOPIC else None
 PANEL_LWT_PAYLOAD_OFFLINE_GRACEFUL_template = {"client_id": CLIENT_ID, "status": "offline_graceful"} if PANEL_LWT_TOPIC else {}
 
-active_panel_requests = {}
+lamp_rpc = None # RpcClient untuk perintah lampu (dibuat di run_panel)
+panel_dispatcher = None # TopicDispatcher pesan masuk (dibangun di on_connect_panel)
 is_panel_connected_flag = False
 
+class DashboardRenderer:
+    """Thread yang menggambar ulang dashboard, terpisah dari network thread Paho.
+
+    Callback MQTT hanya memanggil mark_dirty(); thread ini menggambar paling sering sekali per
+    min_interval_s, sehingga banyak update dalam satu jendela digabung menjadi satu redraw dan
+    throughput pesan tidak lagi bergantung pada kecepatan terminal.
+    """
+    def __init__(self, render, max_refresh_hz=DASHBOARD_MAX_REFRESH_HZ, idle_refresh_s=DASHBOARD_IDLE_REFRESH_S):
+        self.render = render
+        self.min_interval_s = 1.0 / max_refresh_hz if max_refresh_hz else 0.0
+        self.idle_refresh_s = idle_refresh_s
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'updates': 0, 'renders': 0}
+
+    def mark_dirty(self):
+        self.stats['updates'] += 1
+        self._dirty.set()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._render_loop, name="panel-dashboard", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._dirty.set() # Bangunkan thread yang sedang menunggu perubahan
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+
+    def _render_loop(self):
+        while True:
+            self._dirty.wait(self.idle_refresh_s)
+            if self._stop.is_set():
+                return
+            self._dirty.clear()
+            try:
+                self.render()
+            except Exception as e_render:
+                log.error("Panel (%s): Dashboard render failed: %s", CLIENT_ID, e_render)
+            self.stats['renders'] += 1
+            if self._stop.wait(self.min_interval_s): # Batas laju redraw
+                return
+
+    def get_stats(self):
+        return dict(self.stats)
+
+def format_window(aggregate, unit):
+    if aggregate is None:
+        return "no data"
+    count, low, high, mean = aggregate
+    return f"min {low:.1f}{unit} / mean {mean:.1f}{unit} / max {high:.1f}{unit} ({count} readings)"
+
+def format_device_row(row):
+    values = []
+    if row['temperature'] is not None:
+        values.append(f"{row['temperature']:.1f}°C")
+    if row['humidity'] is not None:
+        values.append(f"{row['humidity']:.1f}%RH")
+    if row['state']:
+        values.append(row['state'])
+    client_id = row['client_id'] if len(row['client_id']) <= 32 else "..." + row['client_id'][-29:] # Akhiran ID biasanya yang unik
+    return (f"  {client_id:<32} {row['kind']:<6} {row['status'] or '-':<18} "
+            f"{' '.join(values) or '-':<22} {row['age_s']:.0f}s ago")
+
 def display_dashboard():
     """Fungsi untuk menampilkan status terkini secara rapi."""
+    summary = device_table.summary()
+    sensors = summary.get(DEVICE_KIND_SENSOR, {'total': 0, 'online': 0, 'on': 0})
+    lamps = summary.get(DEVICE_KIND_LAMP, {'total': 0, 'online': 0, 'on': 0})
+    window_label = f"{DEVICE_WINDOW_S:g}s"
     print("\n--- MQTT DASHBOARD ---")
     print(f"  Panel Status:   {'CONNECTED' if is_panel_connected_flag else 'DISCONNECTED'}")
-    print(f"  Sensor Status:  {sensor_connection_status}")
-    print(f"  Lamp Status:    {lamp_connection_status}")
+    print(f"  Sensors:        {sensors['total']} known, {sensors['online']} online (LWT)")
+    print(f"  Lamps:          {lamps['total']} known, {lamps['online']} online (LWT), {lamps['on']} ON")
     print("  --------------------")
     print(f"  Temperature:    {last_temperature}")
+    print(f"    last {window_label}:    {format_window(device_table.fleet_aggregate('temperature'), '°C')}")
     print(f"  Humidity:       {last_humidity}")
+    print(f"    last {window_label}:    {format_window(device_table.fleet_aggregate('humidity'), '%RH')}")
     print(f"  Lamp State:     {last_lamp_state}")
+    if DASHBOARD_DEVICE_ROWS and len(device_table):
+        print(f"  -------------------- {min(DASHBOARD_DEVICE_ROWS, len(device_table))} of {len(device_table)} devices (most recent)")
+        for row in device_table.recent_devices(DASHBOARD_DEVICE_ROWS):
+            print(format_device_row(row))
     print("------------------------")
     if LAMP_COMMAND_TOPIC:
-        print("Enter lamp command (ON/OFF/TOGGLE/INVALID/EXIT): ", end='', flush=True)
+        print("Enter lamp command (ON/OFF/TOGGLE/INVALID, GROUP <cmd> [group], EXIT): ", end='', flush=True)
+
+dashboard_renderer = DashboardRenderer(display_dashboard)
+
+def request_dashboard_refresh():
+    """Tandai dashboard perlu digambar ulang; tidak pernah blocking pada I/O terminal."""
+    dashboard_renderer.mark_dirty()
 
 def on_connect_panel(client, userdata, flags, rc, properties=None):
-    global is_panel_connected_flag
+    global is_panel_connected_flag, panel_dispatcher
     if rc == 0:
         is_panel_connected_flag = True
-        print(f"\nPanel ({CLIENT_ID}): Successfully connected to broker. Subscribing to topics...")
+        if panel_dispatcher is None: # Sebelum subscribe, agar pesan retained pertama sudah punya handler
+            panel_dispatcher = build_panel_dispatcher()
+        log.info("Panel (%s): Successfully connected to broker. Subscribing to topics...", CLIENT_ID)
         
         topics_to_subscribe_tuples = []
         all_relevant_topics_str = set(PANEL_SUBSCRIBED_TOPICS_STR_LIST)
-        if TEMPERATURE_TOPIC: all_relevant_topics_str.add(TEMPERATURE_TOPIC)
-        if HUMIDITY_TOPIC_DATA: all_relevant_topics_str.add(HUMIDITY_TOPIC_DATA)
-        if LAMP_STATUS_TOPIC: all_relevant_topics_str.add(LAMP_STATUS_TOPIC)
-        if SENSOR_LWT_TOPIC: all_relevant_topics_str.add(SENSOR_LWT_TOPIC)
-        if LAMP_LWT_TOPIC: all_relevant_topics_str.add(LAMP_LWT_TOPIC)
+        all_relevant_topics_str.update(topic_filter for _, topic_filter in panel_topic_filters()) # Termasuk filter armada
 
         for topic_name_str in all_relevant_topics_str:
             if topic_name_str:
                 current_qos = LWT_QOS_PANEL if "lwt" in topic_name_str.lower() else DEFAULT_QOS_PANEL
                 topics_to_subscribe_tuples.append((topic_name_str, current_qos))
         
-        if topics_to_subscribe_tuples:
+        if topics_to_subscribe_tuples and not subscriptions_restored(client): # Setelah reconnect: dipulihkan ReconnectManager
             subscribe_to_topics(client, topics_to_subscribe_tuples)
-        display_dashboard() # Tampilkan dashboard setelah konek
+        # Mode wildcard: satu subscription untuk semua response perintah lampu, dibuat ulang setiap (re)connect
+        if lamp_rpc:
+            lamp_rpc.subscribe_responses()
+        request_dashboard_refresh() # Tampilkan dashboard setelah konek
     else:
-        print(f"Panel ({CLIENT_ID}): Connection failed! RC: {rc}")
+        log.error("Panel (%s): Connection failed! RC: %s", CLIENT_ID, rc)
         is_panel_connected_flag = False
-        display_dashboard()
+        request_dashboard_refresh()
 
 
-def on_message_panel(client, userdata, msg):
-    global last_temperature, last_humidity, last_lamp_state, sensor_connection_status, lamp_connection_status, active_panel_requests
-    
-    topic = msg.topic
-    decoded_payload = ""
+def on_lamp_response(future, command):
+    # Callback Future dari RpcClient untuk satu perintah lampu
+    global last_lamp_state
+    correlation_id = future.correlation_id
+    try:
+        msg = future.result()
+    except RpcTimeoutError:
+        log.warning("No response for command '%s' (CorrID: %s) before deadline.", command, correlation_id)
+        request_dashboard_refresh()
+        return
+    except RpcError as e_rpc:
+        log.error("  Failed to send command '%s': %s", command, e_rpc)
+        request_dashboard_refresh()
+        return
+
     try:
         decoded_payload = msg.payload.decode('utf-8')
     except UnicodeDecodeError:
-        print(f"\n[ERROR] Panel ({CLIENT_ID}): Could not decode payload on '{topic}'.")
+        log.error("Panel (%s): Could not decode response payload on '%s'.", CLIENT_ID, msg.topic)
         return
-
-    print(f"\n[MESSAGE] Panel ({CLIENT_ID}) received on '{topic}' (Retain: {msg.retain}):")
-    # print(f"  Raw Payload: {decoded_payload}") # Kurangi verbosity, tampilkan jika perlu debug
-
     parsed_data = None
     try:
         if decoded_payload: parsed_data = json.loads(decoded_payload)
     except json.JSONDecodeError:
-        # Bisa jadi LWT string sederhana atau payload lain
-        pass 
-
-    # 1. Cek apakah ini adalah respons untuk request yang dikirim panel
-    correlation_id_resp = getattr(msg.properties, 'CorrelationData', b'').decode('utf-8', errors='replace') if msg.properties else None
-    if correlation_id_resp and correlation_id_resp in active_panel_requests:
-        request_details = active_panel_requests.pop(correlation_id_resp)
-        print(f"  [RESPONSE] For command '{request_details.get('command', 'N/A')}' (CorrID: {correlation_id_resp}):")
-        if parsed_data:
-            print(f"    Data: {parsed_data}")
-            if parsed_data.get("error_code"):
-                print(f"    Status: ERROR - {parsed_data.get('message', 'No error message.')}")
-            elif "new_lamp_state" in parsed_data: # Respons sukses dari lampu
-                last_lamp_state = str(parsed_data.get('new_lamp_state')).upper()
-                print(f"    Status: SUCCESS - Lamp is now {last_lamp_state}")
-            # Tambahkan penanganan untuk response dari sensor jika perlu
-        else:
-            print(f"    Data (Raw): {decoded_payload}") # Jika response tidak JSON
-        
-        if client.is_connected(): client.unsubscribe(request_details['response_topic'])
-        display_dashboard() # Update tampilan
-        return
+        pass
 
-    # 2. Jika bukan response, proses sebagai pesan reguler / LWT / Status
+    log.debug("[MESSAGE] Panel (%s) received on '%s' (Retain: %s):", CLIENT_ID, msg.topic, msg.retain)
+    log.info("  [RESPONSE] For command '%s' (CorrID: %s):", command, correlation_id)
     if parsed_data:
-        device_id_from_payload = parsed_data.get("client_id", "UnknownDevice")
-        status_from_payload = parsed_data.get("status", "").upper() # Untuk LWT JSON
-        state_from_payload = parsed_data.get("state", "").upper()   # Untuk status lampu reguler
-
-        if TEMPERATURE_TOPIC and topic == TEMPERATURE_TOPIC:
-            temp_val = parsed_data.get("temperature")
-            if temp_val is not None: 
-                last_temperature = f"{temp_val}°{parsed_data.get('unit','C')}"
-                print(f"  [DATA] Temperature Update: {last_temperature} from {device_id_from_payload}")
-            # Logika untuk merespons request suhu dari sensor
-            response_topic_req = getattr(msg.properties, 'ResponseTopic', None) if msg.properties else None
-            correlation_data_req_bytes = getattr(msg.properties, 'CorrelationData', None) if msg.properties else None
-            if response_topic_req:
-                print(f"  [INFO] Temperature data from {device_id_from_payload} is a REQUEST. Sending ACK...")
-                ack_payload = {"status": "temperature_acknowledged_by_panel", "panel_id": CLIENT_ID, "ack_timestamp": time.time()}
-                publish_message(client, response_topic_req, json.dumps(ack_payload), qos=DEFAULT_QOS_PANEL, correlation_data=correlation_data_req_bytes, message_expiry_interval=60)
-        
-        elif HUMIDITY_TOPIC_DATA and topic == HUMIDITY_TOPIC_DATA:
-            hum_val = parsed_data.get("humidity")
-            if hum_val is not None:
-                last_humidity = f"{hum_val}{parsed_data.get('unit','%RH')}"
-                print(f"  [DATA] Humidity Update: {last_humidity} from {device_id_from_payload}")
-
-        elif LAMP_STATUS_TOPIC and topic == LAMP_STATUS_TOPIC:
-            if state_from_payload:
-                last_lamp_state = state_from_payload
-                print(f"  [STATUS] Lamp Regular Status Update: Lamp is {last_lamp_state} (from {device_id_from_payload})")
-
-        elif SENSOR_LWT_TOPIC and topic == SENSOR_LWT_TOPIC:
-            sensor_connection_status = status_from_payload if status_from_payload else "STATE_UNKNOWN"
-            print(f"  [LWT] Sensor ({device_id_from_payload}) Connection Status: {sensor_connection_status}")
-
-        elif LAMP_LWT_TOPIC and topic == LAMP_LWT_TOPIC:
-            lamp_connection_status = status_from_payload if status_from_payload else "STATE_UNKNOWN"
-            print(f"  [LWT] Lamp ({device_id_from_payload}) Connection Status: {lamp_connection_status}")
-        
-        # (Tambahkan penanganan untuk PANEL_LWT_TOPIC jika perlu)
+        log.info("    Data: %s", parsed_data)
+        if parsed_data.get("error_code"):
+            log.info("    Status: ERROR - %s", parsed_data.get('message', 'No error message.'))
+        elif "new_lamp_state" in parsed_data: # Respons sukses dari lampu
+            last_lamp_state = str(parsed_data.get('new_lamp_state')).upper()
+            device_table.set_state(parsed_data.get("client_id", msg.topic), last_lamp_state)
+            log.info("    Status: SUCCESS - Lamp is now %s", last_lamp_state)
+    else:
+        log.info("    Data (Raw): %s", decoded_payload) # Jika response tidak JSON
+    request_dashboard_refresh() # Update tampilan
+
+def on_group_response(future, command, target_label):
+    # Callback Future dari RpcClient.broadcast: semua response yang masuk sebelum deadline
+    global last_lamp_state
+    try:
+        result = future.result()
+    except RpcError as e_rpc:
+        print(f"\n  [ERROR] Failed to send group command '{command}' to {target_label}: {e_rpc}")
+        request_dashboard_refresh()
+        return
+    for responder_id, (ok, _, msg) in list(result.responses.items()):
+        parsed_data = decode_message_payload(msg) if ok else None
+        if isinstance(parsed_data, dict) and "new_lamp_state" in parsed_data:
+            last_lamp_state = f"{str(parsed_data['new_lamp_state']).upper()} (from {responder_id})"
+            device_table.set_state(responder_id, str(parsed_data['new_lamp_state']).upper())
+
+    summary = result.summary()
+    expected_text = f"{summary['expected']} expected" if summary['expected'] is not None else "members unknown"
+    timed_out_text = summary['timed_out'] if summary['timed_out'] is not None else "?"
+    latency = summary['latency_ms']
+    print(f"\n[GROUP] Command '{command}' to {target_label} (CorrID: {result.correlation_id[:8]}..., {expected_text}):")
+    print(f"  {summary['succeeded']} succeeded, {summary['failed']} failed, {timed_out_text} timed out"
+          f" ({summary['unexpected']} unexpected, {summary['duplicates']} duplicate responses)")
+    if summary['responded']:
+        print(f"  Latency ms: min {latency['min']} / p50 {latency['p50']} / p90 {latency['p90']}"
+              f" / p99 {latency['p99']} / max {latency['max']}")
+    for responder_id in result.failed:
+        print(f"  [FAILED] {responder_id}")
+    for responder_id in (result.timed_out or []):
+        print(f"  [TIMEOUT] {responder_id}")
+    request_dashboard_refresh()
+
+def send_group_command(client, command, group=None):
+    """Broadcast perintah ke semua lampu (topik perintah biasa) atau ke satu grup (<lamp_group_command_base><grup>).
+
+    Lampu yang diharapkan menjawab = lampu ONLINE di device_table (dan anggota grup, dari payload LWT).
+    """
+    if group:
+        if not LAMP_GROUP_COMMAND_BASE:
+            print("  [ERROR] No 'lamp_group_command_base' topic configured; group commands need it.")
+            return
+        topic, target_label = build_group_topic(LAMP_GROUP_COMMAND_BASE, group), f"group '{group}'"
+    else:
+        topic, target_label = LAMP_COMMAND_TOPIC, "all lamps"
+    expected = device_table.client_ids_where(kind=DEVICE_KIND_LAMP, status=STATUS_ONLINE, group=group)
+    print(f"\n[COMMAND] Panel ({CLIENT_ID}) Broadcasting '{command}' to {target_label} on '{topic}'"
+          f" ({len(expected)} online lamps known, collecting responses for {GROUP_COMMAND_TIMEOUT_S}s)...")
+    if not lamp_rpc:
+        print("  [ERROR] Group commands need 'lamp_command_response_base' to collect responses.")
+        return
+    future_group = lamp_rpc.broadcast(topic, command, timeout=GROUP_COMMAND_TIMEOUT_S,
+                                      expected=expected or None, profile=LAMP_COMMAND_PROFILE)
+    future_group.add_done_callback(lambda f: on_group_response(f, command, target_label))
+
+def print_message_header(msg):
+    log.debug("[MESSAGE] Panel (%s) received on '%s' (Retain: %s):", CLIENT_ID, msg.topic, msg.retain)
+
+def decode_status_message(msg):
+    """Decoder LWT/status: list record JSON/codec, atau teks UTF-8 (LWT string sederhana), atau None."""
+    content_type = getattr(msg.properties, 'ContentType', None) if msg.properties else None
+    if content_type not in (None, CONTENT_TYPE_JSON): # Codec non-JSON (mis. batch/msgpack): tidak mungkin teks biasa
+        return decode_message_records(msg)
+    text = decode_message_text(msg)
+    if not text:
+        return text
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        return text
+    return [parsed] if isinstance(parsed, dict) else text
+
+def telemetry_records(msg, records):
+    """Record dict dari decoder decode_message_records; cetak header pesan (dan info batch)."""
+    records = [record for record in records if isinstance(record, dict)]
+    print_message_header(msg)
+    if not records:
+        log.warning("  Could not decode payload on '%s' as telemetry.", msg.topic)
+    elif len(records) > 1:
+        log.info("  [BATCH] %s readings in one message", len(records))
+    return records
+
+def handle_temperature_message(client, msg, records):
+    global last_temperature
+    records = telemetry_records(msg, records)
+    for parsed_data in records:
+        temp_val = parsed_data.get("temperature")
+        if temp_val is not None:
+            device_id = parsed_data.get("client_id") or msg.topic
+            try:
+                device_table.record_reading(device_id, "temperature", temp_val)
+            except (TypeError, ValueError):
+                log.warning("  Ignoring non-numeric temperature %r from %s", temp_val, device_id)
+                continue
+            last_temperature = f"{temp_val}°{parsed_data.get('unit','C')} (from {device_id})"
+            log.info("  [DATA] Temperature Update: %s°%s from %s", temp_val, parsed_data.get('unit','C'), device_id)
+
+    # Logika untuk merespons request suhu dari sensor: satu ACK per pesan (juga untuk batch)
+    response_topic_req = getattr(msg.properties, 'ResponseTopic', None) if msg.properties else None
+    correlation_data_req_bytes = getattr(msg.properties, 'CorrelationData', None) if msg.properties else None
+    if records and response_topic_req:
+        device_id_from_payload = records[-1].get("client_id", "UnknownDevice")
+        log.debug("  Temperature data from %s is a REQUEST. Sending ACK...", device_id_from_payload)
+        ack_payload = {"status": "temperature_acknowledged_by_panel", "panel_id": CLIENT_ID, "ack_timestamp": time.time(),
+                       "readings": len(records)}
+        TEMPERATURE_ACK_PROFILE.publish(client, json.dumps(ack_payload), topic=response_topic_req, correlation_data=correlation_data_req_bytes)
+
+def handle_humidity_message(client, msg, records):
+    global last_humidity
+    for parsed_data in telemetry_records(msg, records):
+        hum_val = parsed_data.get("humidity")
+        if hum_val is not None:
+            device_id = parsed_data.get("client_id") or msg.topic
+            try:
+                device_table.record_reading(device_id, "humidity", hum_val)
+            except (TypeError, ValueError):
+                log.warning("  Ignoring non-numeric humidity %r from %s", hum_val, device_id)
+                continue
+            last_humidity = f"{hum_val}{parsed_data.get('unit','%RH')} (from {device_id})"
+            log.info("  [DATA] Humidity Update: %s%s from %s", hum_val, parsed_data.get('unit','%RH'), device_id)
+
+def handle_lamp_status_message(client, msg, records):
+    global last_lamp_state
+    for parsed_data in telemetry_records(msg, records):
+        state_from_payload = parsed_data.get("state", "").upper()
+        if state_from_payload:
+            device_id = parsed_data.get("client_id") or msg.topic
+            device_table.set_state(device_id, state_from_payload)
+            last_lamp_state = f"{state_from_payload} (from {device_id})"
+            log.info("  [STATUS] Lamp Regular Status Update: Lamp is %s (from %s)", state_from_payload, device_id)
+
+def make_lwt_handler(device_label, device_kind):
+    """Handler LWT untuk satu jenis device; status koneksi disimpan per client_id di device_table."""
+    def _handle_lwt(client, msg, data):
+        print_message_header(msg)
+        if isinstance(data, list): # LWT JSON
+            for parsed_data in data:
+                status = parsed_data.get("status", "").upper() or "STATE_UNKNOWN"
+                device_id = parsed_data.get("client_id") or msg.topic
+                groups = parsed_data.get("groups") # Grup yang diumumkan lampu di LWT online (untuk perintah grup)
+                device_table.set_status(device_id, status, device_kind, groups=groups if isinstance(groups, list) else None)
+                log.info("  [LWT] %s (%s) Connection Status: %s", device_label, device_id, status)
+        elif data: # Fallback jika LWT dikirim sebagai string "online" / "offline" (tanpa client_id)
+            status = data.upper()
+            device_table.set_status(msg.topic, status, device_kind)
+            log.info("  [LWT-Simple] Status on '%s': %s", msg.topic, status)
         else:
-            print(f"  [INFO] Received JSON on unhandled subscribed topic '{topic}': {parsed_data}")
-    
-    elif topic in [SENSOR_LWT_TOPIC, LAMP_LWT_TOPIC, PANEL_LWT_TOPIC] and decoded_payload: # LWT string sederhana
-        # Ini fallback jika LWT dikirim sebagai string "online" / "offline"
-        status_str = decoded_payload.upper()
-        print(f"  [LWT-Simple] Status on '{topic}': {status_str}")
-        if SENSOR_LWT_TOPIC and topic == SENSOR_LWT_TOPIC: sensor_connection_status = status_str
-        elif LAMP_LWT_TOPIC and topic == LAMP_LWT_TOPIC: lamp_connection_status = status_str
-    
-    elif decoded_payload: # Pesan lain yang tidak JSON dan tidak LWT yang dikenal
-         print(f"  [INFO] Received unhandled non-JSON message on '{topic}'")
+            log.info("  Empty or undecodable LWT payload on '%s'", msg.topic)
+    return _handle_lwt
 
-    display_dashboard() # Update tampilan setelah memproses pesan
+def handle_lamp_response_message(client, msg, payload):
+    # Response perintah lampu dicocokkan lewat CorrelationData oleh RpcClient (diproses di on_lamp_response)
+    if lamp_rpc and lamp_rpc.handle_message(msg):
+        return
+    log.info("Panel (%s) ignored message on response topic '%s' without a pending request.", CLIENT_ID, msg.topic)
+
+def handle_unrouted_message(client, msg, data):
+    print_message_header(msg)
+    if isinstance(data, list):
+        log.info("  Received JSON on unhandled subscribed topic '%s': %s", msg.topic, data)
+    else:
+        log.info("  Received unhandled non-JSON message on '%s'", msg.topic)
+
+def panel_topic_filters():
+    """(kunci topik, filter) yang ditangani panel: topik dari "topics" plus FLEET_TOPIC_FILTERS (wildcard)."""
+    configured = {"temperature": TEMPERATURE_TOPIC, "humidity_data": HUMIDITY_TOPIC_DATA, "lamp_status": LAMP_STATUS_TOPIC,
+                  "sensor_lwt": SENSOR_LWT_TOPIC, "lamp_lwt": LAMP_LWT_TOPIC}
+    filters = []
+    for topic_key, topic in configured.items():
+        if topic:
+            filters.append((topic_key, topic))
+        for fleet_filter in FLEET_TOPIC_FILTERS.get(topic_key, []):
+            if fleet_filter != topic:
+                filters.append((topic_key, fleet_filter))
+    return filters
+
+routes_by_topic_key = {
+    "temperature": (handle_temperature_message, decode_message_records),
+    "humidity_data": (handle_humidity_message, decode_message_records),
+    "lamp_status": (handle_lamp_status_message, decode_message_records),
+    "sensor_lwt": (make_lwt_handler("Sensor", DEVICE_KIND_SENSOR), decode_status_message),
+    "lamp_lwt": (make_lwt_handler("Lamp", DEVICE_KIND_LAMP), decode_status_message),
+}
+
+def build_panel_dispatcher():
+    """Tabel dispatch topik -> (handler, decoder) panel; dibangun sekali saat connect pertama."""
+    dispatcher = TopicDispatcher(default_handler=handle_unrouted_message, default_decoder=decode_status_message)
+    if LAMP_COMMAND_RESPONSE_BASE: # Mencakup <base><corr_id> (per_request) dan <base><client_id>/<corr_id> (wildcard)
+        dispatcher.add_route(f"{LAMP_COMMAND_RESPONSE_BASE.rstrip('/')}/#", handle_lamp_response_message)
+    for topic_key, topic_filter in panel_topic_filters():
+        handler, decoder = routes_by_topic_key[topic_key]
+        dispatcher.add_route(topic_filter, handler, decoder)
+    # (Tambahkan route untuk PANEL_LWT_TOPIC jika perlu)
+    return dispatcher
+
+def on_message_panel(client, userdata, msg):
+    # Satu lintasan trie memilih handler; setiap handler men-decode payload dengan decoder miliknya
+    if panel_dispatcher is None:
+        return
+    panel_dispatcher.dispatch(client, msg)
+    request_dashboard_refresh() # Redraw dilakukan thread renderer
 
 def on_subscribe_panel(client, userdata, mid, granted_qos, properties=None):
-    print(f"\n[INFO] Panel ({CLIENT_ID}) Subscription Confirmed (mid: {mid}). Granted QoS: {granted_qos}")
-    display_dashboard()
+    log.info("Panel (%s) Subscription Confirmed (mid: %s). Granted QoS: %s", CLIENT_ID, mid, granted_qos)
+    request_dashboard_refresh()
 
 def on_publish_panel(client, userdata, mid, properties=None):
-    print(f"\n[INFO] Panel ({CLIENT_ID}) Message/Command Published (mid: {mid}). Waiting for broker confirmation...")
+    log.debug("Panel (%s) Message/Command Published (mid: %s). Waiting for broker confirmation...", CLIENT_ID, mid)
     # Tidak update dashboard di sini, tunggu response atau status update
 
 def on_disconnect_panel(client, userdata, rc, properties=None):
-    global is_panel_connected_flag, sensor_connection_status, lamp_connection_status
-    is_panel_connected_flag = False
-    sensor_connection_status = "DISCONNECTED (Panel Offline)" # Asumsi jika panel offline
-    lamp_connection_status = "DISCONNECTED (Panel Offline)"
-    print(f"\n[CRITICAL] Panel ({CLIENT_ID}) Disconnected from MQTT Broker (rc: {rc}).")
-    display_dashboard()
+    global is_panel_connected_flag
+    is_panel_connected_flag = False # Status device di tabel tetap nilai terakhir yang diketahui
+    log.error("Panel (%s) Disconnected from MQTT Broker (rc: %s).", CLIENT_ID, rc)
+    request_dashboard_refresh()
 
 def run_panel():
-    global is_panel_connected_flag; is_panel_connected_flag = False
+    global is_panel_connected_flag, lamp_rpc; is_panel_connected_flag = False
     # (Definisi payload LWT panel sama seperti sebelumnya)
     PANEL_LWT_PAYLOAD_ONLINE_str = json.dumps({"client_id": CLIENT_ID, "status": "online", "timestamp": time.time()}) if PANEL_LWT_TOPIC else None
     PANEL_LWT_PAYLOAD_OFFLINE_UNEXPECTED_str = json.dumps({"client_id": CLIENT_ID, "status": "offline_unexpected", "timestamp": time.time()}) if PANEL_LWT_TOPIC else None
     PANEL_LWT_PAYLOAD_OFFLINE_GRACEFUL_template = {"client_id": CLIENT_ID, "status": "offline_graceful"} if PANEL_LWT_TOPIC else {}
 
 
-    client = create_mqtt_client(CLIENT_ID, on_connect_panel, on_message_panel, on_disconnect_panel, on_subscribe_custom=on_subscribe_panel, on_publish_custom=on_publish_panel, lwt_topic=PANEL_LWT_TOPIC, lwt_payload_online=PANEL_LWT_PAYLOAD_ONLINE_str, lwt_payload_offline=PANEL_LWT_PAYLOAD_OFFLINE_UNEXPECTED_str, lwt_qos=LWT_QOS_PANEL, lwt_retain=LWT_RETAIN_PANEL)
+    client = create_mqtt_client(CLIENT_ID, on_connect_panel, on_message_panel, on_disconnect_panel, on_subscribe_custom=on_subscribe_panel, on_publish_custom=on_publish_panel, lwt_topic=PANEL_LWT_TOPIC, lwt_payload_online=PANEL_LWT_PAYLOAD_ONLINE_str, lwt_payload_offline=PANEL_LWT_PAYLOAD_OFFLINE_UNEXPECTED_str, lwt_qos=LWT_QOS_PANEL, lwt_retain=LWT_RETAIN_PANEL, session_role="panel")
     if not client: return
+    if LAMP_COMMAND_RESPONSE_BASE: # Dibuat sebelum loop_start agar on_connect bisa subscribe topik response
+        lamp_rpc = RpcClient(client, CLIENT_ID, LAMP_COMMAND_RESPONSE_BASE, mode=RESPONSE_SUBSCRIPTION_MODE)
+        lamp_rpc.start_sweeper() # Perintah tanpa response di-expire walaupun lampu offline
 
+    dashboard_renderer.start() # Sebelum loop_start: callback pertama sudah bisa meminta redraw
     client.loop_start()
     print(f"Panel ({CLIENT_ID}) attempting to connect. Waiting for connection status...")
     
@@ -230,44 +486,52 @@ def run_panel():
     if not is_panel_connected_flag:
         print(f"ERROR ({CLIENT_ID}): Panel connection timeout. Exiting.")
         disconnect_client(client, PANEL_LWT_TOPIC, None, LWT_QOS_PANEL, LWT_RETAIN_PANEL, reason_string=f"Panel {CLIENT_ID} connection timeout")
+        dashboard_renderer.stop()
         return
-    # display_dashboard() sudah dipanggil di on_connect jika berhasil
+    # Redraw pertama sudah diminta di on_connect jika berhasil
 
     try:
         if LAMP_COMMAND_TOPIC:
             while True: # Loop input perintah
-                # Prompt sudah ditampilkan oleh display_dashboard()
-                cmd_input = input().strip().upper() # Hanya baca input
+                # Prompt ditampilkan oleh display_dashboard() di thread renderer
+                raw_input = input().strip() # Hanya baca input
+                cmd_input = raw_input.upper()
                 if cmd_input == "EXIT": break
+                cmd_parts = raw_input.split()
+                if cmd_parts and cmd_parts[0].upper() == "GROUP": # GROUP <cmd> [grup]; nama grup peka huruf besar/kecil
+                    if len(cmd_parts) in (2, 3):
+                        send_group_command(client, cmd_parts[1].upper(), cmd_parts[2] if len(cmd_parts) == 3 else None)
+                    else:
+                        print("  [ERROR] Usage: GROUP <ON|OFF|TOGGLE> [group]")
+                    request_dashboard_refresh()
+                    continue
                 if cmd_input in ["ON", "OFF", "TOGGLE", "INVALIDCMD"]: # Tambah INVALIDCMD untuk tes error
                     print(f"\n[COMMAND] Panel ({CLIENT_ID}) Sending '{cmd_input}' to lamp...")
-                    correlation_id_lamp, response_topic_for_lamp_cmd = None, None
-                    if LAMP_COMMAND_RESPONSE_BASE:
-                        correlation_id_lamp = str(uuid.uuid4())
-                        response_topic_for_lamp_cmd = f"{LAMP_COMMAND_RESPONSE_BASE}{correlation_id_lamp}"
-                        active_panel_requests[correlation_id_lamp] = {'response_topic': response_topic_for_lamp_cmd, 'command': cmd_input}
-                        if client.is_connected(): subscribe_to_topics(client, [(response_topic_for_lamp_cmd, 1)])
-                    
-                    result = publish_message(client, LAMP_COMMAND_TOPIC, cmd_input, qos=DEFAULT_QOS_PANEL, message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_PANEL_CMD, response_topic=response_topic_for_lamp_cmd, correlation_data=correlation_id_lamp.encode('utf-8') if correlation_id_lamp else None, user_properties=[("command_source", CLIENT_ID)], content_type="text/plain")
-                    
-                    if not (result and result.rc == mqtt.MQTT_ERR_SUCCESS):
-                        print(f"  [ERROR] Failed to send command '{cmd_input}'.")
-                        if correlation_id_lamp and correlation_id_lamp in active_panel_requests: del active_panel_requests[correlation_id_lamp]
-                        if response_topic_for_lamp_cmd and client.is_connected(): client.unsubscribe(response_topic_for_lamp_cmd)
-                    elif correlation_id_lamp:
-                         print(f"  Command '{cmd_input}' sent as REQUEST. Expecting response (CorrID: {correlation_id_lamp[:8]}...).")
-                    display_dashboard() # Update tampilan setelah kirim perintah
+                    if lamp_rpc:
+                        future_cmd = lamp_rpc.request(LAMP_COMMAND_TOPIC, cmd_input, profile=LAMP_COMMAND_PROFILE)
+                        future_cmd.add_done_callback(lambda f, command=cmd_input: on_lamp_response(f, command))
+                        if not future_cmd.done():
+                            print(f"  Command '{cmd_input}' sent as REQUEST. Expecting response (CorrID: {future_cmd.correlation_id[:8]}...).")
+                    else:
+                        result = LAMP_COMMAND_PROFILE.publish(client, cmd_input)
+                        if not (result and result.rc == mqtt.MQTT_ERR_SUCCESS):
+                            print(f"  [ERROR] Failed to send command '{cmd_input}'.")
+                    request_dashboard_refresh() # Update tampilan setelah kirim perintah
                 elif cmd_input: # Jika input tidak kosong tapi bukan exit atau perintah valid
-                    print(f"  [ERROR] Invalid command: '{cmd_input}'. Options: ON, OFF, TOGGLE, INVALIDCMD, EXIT.")
-                    display_dashboard()
+                    print(f"  [ERROR] Invalid command: '{cmd_input}'. Options: ON, OFF, TOGGLE, INVALIDCMD, GROUP <cmd> [group], EXIT.")
+                    request_dashboard_refresh()
         else:
             print("Panel ({CLIENT_ID}) No lamp command topic. Running in listen-only mode.")
-            while True: time.sleep(60); display_dashboard() # Refresh dashboard berkala
+            while True: time.sleep(60); request_dashboard_refresh() # Refresh dashboard berkala
     except KeyboardInterrupt: print(f"\nPanel ({CLIENT_ID}) Exiting...")
     except Exception as e: print(f"Panel main loop error: {e}")
     finally:
+        dashboard_renderer.stop()
         print("-" * 30)
-        # ... (Cleanup active_panel_requests sama seperti sebelumnya) ...
+        print(f"Panel ({CLIENT_ID}) Dashboard stats: {dashboard_renderer.get_stats()}")
+        if lamp_rpc: # Gagalkan perintah yang masih menunggu response (dan unsubscribe topik per request)
+            lamp_rpc.cancel_all(f"Panel {CLIENT_ID} shutting down")
+            print(f"Panel ({CLIENT_ID}) Request/response stats: {lamp_rpc.get_stats()}")
         payload_graceful_offline_final_str = None
         if PANEL_LWT_TOPIC and PANEL_LWT_PAYLOAD_OFFLINE_GRACEFUL_template:
             # ... (buat payload graceful offline sama seperti sebelumnya) ...
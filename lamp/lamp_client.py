@@ -2,7 +2,8 @@
 import paho.mqtt.client as mqtt # Untuk konstanta jika diperlukan, meski mungkin tidak langsung
 import json
 import time
-import uuid
+import threading
+import logging
 from pathlib import Path
 import sys
 
@@ -13,32 +14,45 @@ sys.path.append(str(COMMON_DIR))
 from mqtt_utils import (
     GLOBAL_SETTINGS,
     create_mqtt_client,
-    publish_message,
     subscribe_to_topics,
-    disconnect_client
+    subscriptions_restored,
+    build_client_id,
+    disconnect_client,
+    PublishProfile,
+    build_group_topic
 )
+from log_utils import get_logger
 # Import Properties dan PacketTypes jika suatu saat perlu membuat properties secara manual di sini
 # from mqtt_utils import Properties, PacketTypes
 
 
+log = get_logger("lamp") # Level diatur lewat logging_settings.levels.lamp
+
 # --- Mengambil Konfigurasi dari GLOBAL_SETTINGS ---
 topics_config = GLOBAL_SETTINGS.get("topics", {})
 LAMP_COMMAND_TOPIC = topics_config.get("lamp_command")
 LAMP_STATUS_TOPIC = topics_config.get("lamp_status") # Untuk status ON/OFF reguler
 LAMP_LWT_TOPIC = topics_config.get("lamp_lwt")       # Untuk status online/offline/lwt
+LAMP_GROUP_COMMAND_BASE = topics_config.get("lamp_group_command_base") # Perintah broadcast per grup: <base><grup>
+
+lamp_specific_cfg = GLOBAL_SETTINGS.get("lamp_specific_settings", {})
+LAMP_GROUPS = lamp_specific_cfg.get("groups", []) # Grup yang diikuti lampu ini (diumumkan di payload LWT online)
+LAMP_GROUP_COMMAND_TOPICS = [build_group_topic(LAMP_GROUP_COMMAND_BASE, group) for group in LAMP_GROUPS] if LAMP_GROUP_COMMAND_BASE else []
+# Perintah yang datang dalam jendela ini digabung menjadi satu transisi state (0 = langsung diproses)
+COMMAND_COALESCE_WINDOW_S = lamp_specific_cfg.get("command_coalesce_window_ms", 50) / 1000.0
 
 DEFAULT_QOS_LAMP = GLOBAL_SETTINGS.get("default_qos", 1) # Default QoS untuk publish & subscribe
 LWT_QOS_LAMP = GLOBAL_SETTINGS.get("lwt_qos", 1)
 LWT_RETAIN_LAMP = GLOBAL_SETTINGS.get("lwt_retain", True)
 
 mqtt_advanced_cfg = GLOBAL_SETTINGS.get("mqtt_advanced_settings", {})
-# Message Expiry untuk status reguler akan diambil dari GLOBAL_SETTINGS oleh publish_message
-# jika tidak di-override secara spesifik saat memanggil publish_message.
+# Message Expiry untuk status reguler; dipasang sekali di LAMP_STATUS_PROFILE.
 DEFAULT_MESSAGE_EXPIRY_LAMP_STATUS = mqtt_advanced_cfg.get("default_message_expiry_interval")
 
 
-CLIENT_ID_PREFIX = GLOBAL_SETTINGS.get('client_id_prefix', 'lamp_m5_') # Contoh prefix baru
-CLIENT_ID = f"{CLIENT_ID_PREFIX}{str(uuid.uuid4())[:8]}"
+# client_id stabil (env GRUPM_LAMP_CLIENT_ID atau session_settings.roles.lamp.client_id) agar sesi persisten (dan
+# perintah QoS 1 yang dikirim saat lampu offline) bisa dilanjutkan setelah restart; default prefix + uuid acak
+CLIENT_ID = build_client_id("lamp", 'lamp_m5_')
 
 # Validasi konfigurasi dasar topik
 if not all([LAMP_COMMAND_TOPIC, LAMP_STATUS_TOPIC]):
@@ -53,15 +67,18 @@ lamp_state_on = False # Lampu awalnya mati
 print(f"--- Lamp Client MQTTv5 ({CLIENT_ID}) ---")
 # (Anda bisa menambahkan print info broker dari GLOBAL_SETTINGS.get("broker_address") jika mau)
 print(f"Command Topic (Subscribe): {LAMP_COMMAND_TOPIC}, QoS: {DEFAULT_QOS_LAMP}")
+if LAMP_GROUP_COMMAND_TOPICS:
+    print(f"Group Command Topics (Subscribe): {', '.join(LAMP_GROUP_COMMAND_TOPICS)}")
 print(f"Regular Status Topic (Publish): {LAMP_STATUS_TOPIC}, QoS: {DEFAULT_QOS_LAMP}, Retain: True") # Status reguler selalu retain
 if LAMP_LWT_TOPIC:
     print(f"LWT & Online/Offline Status Topic: {LAMP_LWT_TOPIC}, QoS: {LWT_QOS_LAMP}, Retain: {LWT_RETAIN_LAMP}")
 if DEFAULT_MESSAGE_EXPIRY_LAMP_STATUS is not None:
     print(f"Default Message Expiry for status publishes (from settings): {DEFAULT_MESSAGE_EXPIRY_LAMP_STATUS}s")
+print(f"Command coalescing window: {COMMAND_COALESCE_WINDOW_S * 1000:g} ms")
 print("-" * 30)
 
 # Buat payload LWT di sini agar timestamp-nya update saat skrip dijalankan
-LAMP_LWT_PAYLOAD_ONLINE_str = json.dumps({"client_id": CLIENT_ID, "status": "online", "timestamp": time.time()}) if LAMP_LWT_TOPIC else None
+LAMP_LWT_PAYLOAD_ONLINE_str = json.dumps({"client_id": CLIENT_ID, "status": "online", "groups": LAMP_GROUPS, "timestamp": time.time()}) if LAMP_LWT_TOPIC else None
 LAMP_LWT_PAYLOAD_OFFLINE_UNEXPECTED_str = json.dumps({"client_id": CLIENT_ID, "status": "offline_unexpected", "timestamp": time.time()}) if LAMP_LWT_TOPIC else None
 # Template untuk offline graceful, timestamp akan diisi saat disconnect
 LAMP_LWT_PAYLOAD_OFFLINE_GRACEFUL_template = {"client_id": CLIENT_ID, "status": "offline_graceful"} if LAMP_LWT_TOPIC else {}
@@ -69,159 +86,230 @@ LAMP_LWT_PAYLOAD_OFFLINE_GRACEFUL_template = {"client_id": CLIENT_ID, "status":
 
 is_lamp_connected_flag = False # Flag untuk menandakan koneksi sudah siap
 
+# Properties tetap dibangun sekali; per pesan hanya payload (dan ResponseTopic/CorrelationData) yang berubah
+LAMP_STATUS_PROFILE = PublishProfile(
+    LAMP_STATUS_TOPIC,
+    qos=DEFAULT_QOS_LAMP,
+    retain=True, # Status lampu reguler selalu di-retain
+    message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_LAMP_STATUS,
+    user_properties=[("device_type", "smart_led_v2.1"), ("room", "living_room")],
+    content_type="application/json"
+)
+# Response perintah: topik diambil dari ResponseTopic request, valid selama 1 menit
+LAMP_COMMAND_ACK_PROFILE = PublishProfile(qos=DEFAULT_QOS_LAMP, message_expiry_interval=60,
+                                          user_properties=[("response_type", "command_ack")],
+                                          content_type="application/json")
+LAMP_COMMAND_NACK_PROFILE = PublishProfile(qos=DEFAULT_QOS_LAMP, message_expiry_interval=60,
+                                           user_properties=[("response_type", "command_nack"), ("error_detail", "invalid_action")],
+                                           content_type="application/json")
+
 def publish_regular_lamp_status_v5(client):
     """Mempublikasikan status ON/OFF reguler lampu dengan fitur MQTTv5."""
     global lamp_state_on
     status_payload_dict = {"client_id": CLIENT_ID, "state": "ON" if lamp_state_on else "OFF", "timestamp": time.time()}
     payload_json = json.dumps(status_payload_dict)
-    
-    # Properti untuk status reguler
-    user_props_status = [("device_type", "smart_led_v2.1"), ("room", "living_room")] # Contoh UserProperty
-    content_type_status = "application/json"
-    # Message Expiry akan diambil dari default config oleh publish_message
-
-    result = publish_message(
-        client,
-        topic=LAMP_STATUS_TOPIC,
-        payload=payload_json,
-        qos=DEFAULT_QOS_LAMP,
-        retain=True, # Status lampu reguler selalu di-retain
-        user_properties=user_props_status,
-        content_type=content_type_status,
-        message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_LAMP_STATUS # Bisa juga di-override di sini jika perlu
-    )
+    result = LAMP_STATUS_PROFILE.publish(client, payload_json) # UserProperty, ContentType, expiry, retain dari profil
     
     if result and result.rc == mqtt.MQTT_ERR_SUCCESS: # Gunakan mqtt.MQTT_ERR_SUCCESS
-        print(f"Lamp ({CLIENT_ID}) Regular Status Published (mid: {result.mid}, RETAINED): {payload_json} to '{LAMP_STATUS_TOPIC}'")
+        log.info("Lamp (%s) Regular Status Published (mid: %s, RETAINED): %s to '%s'", CLIENT_ID, result.mid, payload_json, LAMP_STATUS_TOPIC)
     else:
         err_code = result.rc if result else "N/A (Publish Failed before sending)"
-        print(f"Lamp ({CLIENT_ID}) Failed to enqueue regular status for publishing (Error: {err_code})")
+        log.error("Lamp (%s) Failed to enqueue regular status for publishing (Error: %s)", CLIENT_ID, err_code)
 
 # --- Callback MQTT Spesifik untuk Lampu ---
 def on_connect_lamp(client, userdata, flags, rc, properties=None):
     global is_lamp_connected_flag
     if rc == 0: # Koneksi berhasil
         is_lamp_connected_flag = True
-        print(f"Lamp ({CLIENT_ID}): Custom on_connect. Connection logic activated. Ready for commands.")
-        # Subscribe ke topik perintah lampu
-        if LAMP_COMMAND_TOPIC:
+        log.info("Lamp (%s): Custom on_connect. Connection logic activated. Ready for commands.", CLIENT_ID)
+        # Subscribe ke topik perintah lampu (setelah reconnect sudah dipulihkan oleh ReconnectManager)
+        if LAMP_COMMAND_TOPIC and not subscriptions_restored(client):
             # Bisa tambahkan properties saat subscribe jika perlu (misal Subscription Identifier)
-            subscribe_to_topics(client, [(LAMP_COMMAND_TOPIC, DEFAULT_QOS_LAMP)])
+            # Topik grup ikut di SUBSCRIBE yang sama; response broadcast memakai ResponseTopic/CorrelationData yang sama
+            subscribe_to_topics(client, [(topic, DEFAULT_QOS_LAMP) for topic in [LAMP_COMMAND_TOPIC] + LAMP_GROUP_COMMAND_TOPICS])
         
         # Publikasikan status awal reguler (misalnya "OFF") dengan retain=True
         publish_regular_lamp_status_v5(client)
     # _default_on_connect di mqtt_utils akan menghandle print detail koneksi dan publish LWT online
 
-def on_message_lamp(client, userdata, msg):
+def apply_lamp_command(command, state_on):
+    """State baru setelah `command` (ON/OFF/TOGGLE) diterapkan ke state_on, atau None bila perintah tidak dikenal."""
+    if command == "ON":
+        return True
+    if command == "OFF":
+        return False
+    if command == "TOGGLE":
+        return not state_on
+    return None
+
+def commit_lamp_state(client, new_state_on):
+    # Dipanggil sekali per jendela coalescing, hanya bila state final berbeda dari state sebelumnya
     global lamp_state_on
-    command_payload_str = ""
+    lamp_state_on = new_state_on
+    log.info("Lamp (%s) State changed to: %s", CLIENT_ID, 'ON' if lamp_state_on else 'OFF')
+    publish_regular_lamp_status_v5(client)
+
+def send_command_response(client, response_topic, correlation_data, command, new_state_on=None, state_changed=False):
+    """Kirim ACK (new_state_on tidak None) atau NACK ke ResponseTopic request."""
+    if new_state_on is not None:
+        resp_payload_dict = {
+            "client_id": CLIENT_ID,
+            "command_received": command,
+            "processed_status": "success",
+            "new_lamp_state": "ON" if new_state_on else "OFF",
+            "state_was_changed": state_changed,
+            "timestamp": time.time()
+        }
+        resp_profile = LAMP_COMMAND_ACK_PROFILE
+    else: # Jika perintah tidak dikenal
+        resp_payload_dict = {
+            "client_id": CLIENT_ID,
+            "command_received": command, # Kirim perintah asli
+            "processed_status": "error",
+            "error_code": "UNKNOWN_COMMAND",
+            "message": f"Command '{command}' is not recognized by lamp {CLIENT_ID}.",
+            "timestamp": time.time()
+        }
+        resp_profile = LAMP_COMMAND_NACK_PROFILE
+    resp_profile.publish(client, json.dumps(resp_payload_dict), topic=response_topic,
+                         correlation_data=correlation_data) # Kirim kembali correlation data
+
+class CommandCoalescer:
+    """Menggabungkan perintah yang datang dalam satu jendela waktu menjadi satu transisi state lampu.
+
+    Perintah pertama yang mengubah state membuka jendela `window_s`; perintah berikutnya diterapkan
+    berurutan ke state sementara (TOGGLE tetap benar). Saat jendela ditutup state final di-commit dan
+    status reguler dipublish sekali, hanya bila berbeda dari state di awal jendela; lalu response semua
+    perintah dalam jendela dikirim (masing-masing berisi state setelah perintah itu).
+    Perintah yang tidak mengubah state saat tidak ada jendela terbuka, dan perintah tidak dikenal,
+    langsung dijawab tanpa publish status (fast path).
+    """
+    def __init__(self, window_s, read_state, commit_state, send_response):
+        self.window_s = window_s
+        # State ter-commit disimpan di sini dan diperbarui di bawah _lock saat jendela ditutup, sehingga perintah
+        # yang datang sebelum commit_state selesai (di thread lain) tidak membaca state lama; read_state hanya state awal
+        self._committed_state = read_state()
+        self._commit_state = commit_state
+        self._send_response = send_response
+        self._lock = threading.Lock()
+        self._timer = None
+        self._window_open = False
+        self._window_start_state = None
+        self._pending_state = None
+        self._pending_responses = [] # (response_topic, correlation_data, command, state_on, state_changed)
+        self.stats = {'commands': 0, 'invalid': 0, 'fast_path': 0, 'windows': 0,
+                      'status_published': 0, 'status_skipped': 0}
+
+    def submit(self, client, command, response_topic=None, correlation_data=None):
+        command = command.upper()
+        flush_now = False
+        with self._lock:
+            self.stats['commands'] += 1
+            current_state = self._pending_state if self._window_open else self._committed_state
+            new_state = apply_lamp_command(command, current_state)
+            if new_state is None:
+                self.stats['invalid'] += 1
+                respond_now = (command, None, False)
+            elif not self._window_open and new_state == current_state:
+                self.stats['fast_path'] += 1 # Idempoten: tidak ada transisi, tidak ada publish status
+                respond_now = (command, new_state, False)
+            else:
+                respond_now = None
+                if not self._window_open:
+                    self._window_open = True
+                    self._window_start_state = current_state
+                    if self.window_s > 0:
+                        self._timer = threading.Timer(self.window_s, self.flush, args=(client,))
+                        self._timer.daemon = True
+                        self._timer.start()
+                    else:
+                        flush_now = True
+                self._pending_state = new_state
+                if response_topic:
+                    self._pending_responses.append((response_topic, correlation_data, command, new_state, new_state != current_state))
+        if respond_now is not None:
+            if respond_now[1] is None:
+                log.warning("Lamp (%s) Unknown command received: '%s'", CLIENT_ID, command)
+            if response_topic:
+                self._send_response(client, response_topic, correlation_data, *respond_now)
+        if flush_now:
+            self.flush(client)
+
+    def flush(self, client):
+        """Tutup jendela yang terbuka: commit state final (publish status sekali) lalu kirim response.
+
+        State final dicatat sebelum _lock dilepas; hanya commit_state (publish status) dan response di luar lock.
+        """
+        with self._lock:
+            if not self._window_open:
+                return
+            if self._timer is not None and self._timer is not threading.current_thread():
+                self._timer.cancel()
+            self._timer = None
+            self._window_open = False
+            final_state, start_state = self._pending_state, self._window_start_state
+            self._committed_state = final_state
+            responses, self._pending_responses = self._pending_responses, []
+            self.stats['windows'] += 1
+            self.stats['status_published' if final_state != start_state else 'status_skipped'] += 1
+        if final_state != start_state:
+            self._commit_state(client, final_state)
+        else:
+            log.info("Lamp (%s) Commands cancelled out within window. State still %s.", CLIENT_ID, 'ON' if final_state else 'OFF')
+        for response in responses:
+            self._send_response(client, *response)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+command_coalescer = CommandCoalescer(COMMAND_COALESCE_WINDOW_S, lambda: lamp_state_on, commit_lamp_state, send_command_response)
+
+def format_command_properties(msg):
+    lines = ["  Message Properties:"]
+    for prop_name, prop_value in vars(msg.properties).items():
+        if prop_value is not None and prop_name != "names":
+            if prop_name == "CorrelationData" and isinstance(prop_value, bytes):
+                lines.append(f"    {prop_name}: {prop_value.decode('utf-8', errors='replace')}")
+            elif prop_name == "UserProperty" and isinstance(prop_value, list):
+                lines.append(f"    {prop_name}:")
+                lines.extend(f"      - {k_prop}: {v_prop}" for k_prop, v_prop in prop_value)
+            else:
+                lines.append(f"    {prop_name}: {prop_value}")
+    return "\n".join(lines)
+
+def on_message_lamp(client, userdata, msg):
     try:
         command_payload_str = msg.payload.decode('utf-8')
-        print(f"\nLamp ({CLIENT_ID}) Received command on '{msg.topic}' (QoS {msg.qos}): '{command_payload_str}'")
-
-        # Tampilkan properties jika ada (untuk debugging MQTTv5)
-        if msg.properties:
-            print("  Message Properties:")
-            props_dict = vars(msg.properties)
-            for prop_name, prop_value in props_dict.items():
-                if prop_value is not None and prop_name != "names":
-                    if prop_name == "CorrelationData" and isinstance(prop_value, bytes):
-                        print(f"    {prop_name}: {prop_value.decode('utf-8', errors='replace')}")
-                    elif prop_name == "UserProperty" and isinstance(prop_value, list):
-                        print(f"    {prop_name}:")
-                        for k_prop, v_prop in prop_value: print(f"      - {k_prop}: {v_prop}")
-                    else:
-                        print(f"    {prop_name}: {prop_value}")
-        
+        log.info("Lamp (%s) Received command on '%s' (QoS %s): '%s'", CLIENT_ID, msg.topic, msg.qos, command_payload_str)
+        if msg.properties and log.isEnabledFor(logging.DEBUG): # Dump properties MQTTv5 hanya dibangun saat debug
+            log.debug("%s", format_command_properties(msg))
+
         # Ambil ResponseTopic dan CorrelationData dari properties pesan masuk
         response_topic_req = getattr(msg.properties, 'ResponseTopic', None) if msg.properties else None
         correlation_data_req_bytes = getattr(msg.properties, 'CorrelationData', None) if msg.properties else None
-        
-        new_state_on = lamp_state_on
-        cmd_upper = command_payload_str.upper()
-        processed_ok = False
-        state_changed = False
-        error_message_str = None
-
-        if cmd_upper == "ON":
-            new_state_on = True
-            processed_ok = True
-        elif cmd_upper == "OFF":
-            new_state_on = False
-            processed_ok = True
-        elif cmd_upper == "TOGGLE": # Tambahkan command TOGGLE
-            new_state_on = not lamp_state_on
-            processed_ok = True
-        else:
-            error_message_str = f"Command '{command_payload_str}' is not recognized by lamp {CLIENT_ID}."
-            print(f"Lamp ({CLIENT_ID}) Unknown command received: '{command_payload_str}'")
-            # processed_ok tetap False
-
-        if processed_ok:
-            state_changed = (new_state_on != lamp_state_on)
-            if state_changed:
-                lamp_state_on = new_state_on
-                print(f"Lamp ({CLIENT_ID}) State changed to: {'ON' if lamp_state_on else 'OFF'}")
-                publish_regular_lamp_status_v5(client) # Publikasikan status reguler baru
-            else:
-                print(f"Lamp ({CLIENT_ID}) State already {'ON' if lamp_state_on else 'OFF'}. No change in state.")
-        
-        # Kirim response jika ada ResponseTopic yang diminta oleh pengirim perintah
-        if response_topic_req:
-            resp_user_props = []
-            if processed_ok:
-                resp_payload_dict = {
-                    "client_id": CLIENT_ID, 
-                    "command_received": cmd_upper,
-                    "processed_status": "success",
-                    "new_lamp_state": "ON" if lamp_state_on else "OFF",
-                    "state_was_changed": state_changed,
-                    "timestamp": time.time()
-                }
-                resp_user_props = [("response_type", "command_ack")]
-            else: # Jika perintah tidak dikenal atau error lain
-                resp_payload_dict = {
-                    "client_id": CLIENT_ID,
-                    "command_received": command_payload_str, # Kirim perintah asli
-                    "processed_status": "error",
-                    "error_code": "UNKNOWN_COMMAND",
-                    "message": error_message_str or "Failed to process command.",
-                    "timestamp": time.time()
-                }
-                resp_user_props = [("response_type", "command_nack"), ("error_detail", "invalid_action")]
-            
-            print(f"  Sending response to topic: {response_topic_req}")
-            publish_message(
-                client,
-                topic=response_topic_req,
-                payload=json.dumps(resp_payload_dict),
-                qos=DEFAULT_QOS_LAMP, # QoS untuk response, bisa 0 atau 1
-                correlation_data=correlation_data_req_bytes, # Kirim kembali correlation data
-                user_properties=resp_user_props,
-                content_type="application/json",
-                message_expiry_interval=60 # Response ini valid selama 1 menit
-            )
+        command_coalescer.submit(client, command_payload_str, response_topic_req, correlation_data_req_bytes)
 
     except UnicodeDecodeError:
-        print(f"Lamp ({CLIENT_ID}) Could not decode command payload as UTF-8 from topic '{msg.topic}'. Payload: {msg.payload}")
+        log.error("Lamp (%s) Could not decode command payload as UTF-8 from topic '%s'. Payload: %s", CLIENT_ID, msg.topic, msg.payload)
     except Exception as e:
-        print(f"Lamp ({CLIENT_ID}) Error processing command from topic '{msg.topic}': {e} (Payload: {msg.payload})")
+        log.error("Lamp (%s) Error processing command from topic '%s': %s (Payload: %s)", CLIENT_ID, msg.topic, e, msg.payload)
 
 
 def on_publish_lamp(client, userdata, mid, properties=None):
-    print(f"Lamp ({CLIENT_ID}) Message Published (mid: {mid}) - Confirmed by broker (for QoS > 0).")
+    log.debug("Lamp (%s) Message Published (mid: %s) - Confirmed by broker (for QoS > 0).", CLIENT_ID, mid)
 
 def on_subscribe_lamp(client, userdata, mid, granted_qos, properties=None):
-    print(f"Lamp ({CLIENT_ID}) Subscription Confirmed for '{LAMP_COMMAND_TOPIC}' (mid: {mid}). Granted QoS: {granted_qos}")
+    log.info("Lamp (%s) Subscription Confirmed for '%s' (mid: %s). Granted QoS: %s", CLIENT_ID, LAMP_COMMAND_TOPIC, mid, granted_qos)
     if properties and hasattr(properties, 'ReasonString'): # Contoh cek properti di Suback
-        print(f"  Subscribe Ack Properties Reason: {properties.ReasonString}")
+        log.info("  Subscribe Ack Properties Reason: %s", properties.ReasonString)
 
 def on_disconnect_lamp(client, userdata, rc, properties=None):
     global is_lamp_connected_flag
     is_lamp_connected_flag = False
-    print(f"Lamp ({CLIENT_ID}) Disconnected from MQTT Broker (rc: {rc}).")
+    log.info("Lamp (%s) Disconnected from MQTT Broker (rc: %s).", CLIENT_ID, rc)
     if properties and hasattr(properties, 'ReasonString'):
-        print(f"  Broker Disconnect Reason: {properties.ReasonString}")
+        log.info("  Broker Disconnect Reason: %s", properties.ReasonString)
 
 
 def run_lamp():
@@ -239,7 +327,8 @@ def run_lamp():
         lwt_payload_online=LAMP_LWT_PAYLOAD_ONLINE_str,
         lwt_payload_offline=LAMP_LWT_PAYLOAD_OFFLINE_UNEXPECTED_str,
         lwt_qos=LWT_QOS_LAMP,
-        lwt_retain=LWT_RETAIN_LAMP
+        lwt_retain=LWT_RETAIN_LAMP,
+        session_role="lamp"
     )
     if not client:
         print(f"Lamp ({CLIENT_ID}): Failed to create MQTT client from utils. Exiting.")
@@ -264,7 +353,7 @@ def run_lamp():
     try:
         while True:
             if not is_lamp_connected_flag: # Jika koneksi putus di tengah jalan
-                print(f"WARNING ({CLIENT_ID}): Lamp connection lost. Waiting for Paho to attempt reconnect or loop to exit.")
+                log.warning("Lamp connection lost. Waiting for Paho to attempt reconnect or loop to exit.")
                 time.sleep(5) # Beri waktu Paho reconnect
                 continue # Coba lagi di iterasi berikutnya
             time.sleep(1) # Jaga agar thread utama tetap hidup, Paho loop di background
@@ -274,6 +363,8 @@ def run_lamp():
         print(f"An error occurred in the lamp main loop: {e}")
     finally:
         print("-" * 30)
+        command_coalescer.flush(client) # Jangan tinggalkan perintah dalam jendela yang belum dijawab
+        print(f"Lamp ({CLIENT_ID}) Command stats: {command_coalescer.get_stats()}")
         # Siapkan payload untuk LWT offline graceful
         payload_graceful_offline_final_str = None
         if LAMP_LWT_TOPIC and LAMP_LWT_PAYLOAD_OFFLINE_GRACEFUL_template: # Pastikan template ada
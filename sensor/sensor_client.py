@@ -3,7 +3,7 @@ import paho.mqtt.client as mqtt # Untuk konstanta MQTT_ERR_SUCCESS dll.
 import time
 import json
 import random
-import uuid
+import itertools
 from pathlib import Path
 import sys
 
@@ -14,33 +14,52 @@ sys.path.append(str(COMMON_DIR))
 from mqtt_utils import (
     GLOBAL_SETTINGS,
     create_mqtt_client,
-    publish_message,
-    # subscribe_to_topics, # Tidak selalu dibutuhkan sensor, kecuali untuk response
-    disconnect_client
+    disconnect_client,
+    PublishProfile,
+    encode_payload,
+    get_telemetry_content_type,
+    get_telemetry_batch_settings,
+    TelemetryBatcher,
+    CONTENT_TYPE_BATCH,
+    get_sensor_schedule_settings,
+    DeadlineScheduler,
+    get_response_subscription_mode,
+    RpcClient,
+    RpcError,
+    RpcTimeoutError,
+    offline_buffering_enabled,
+    get_reconnect_manager,
+    build_client_id
 )
+from log_utils import get_logger
 # Import Properties dan PacketTypes jika suatu saat perlu membuat properties secara manual di sini
 # from mqtt_utils import Properties, PacketTypes
 
 
+log = get_logger("sensor") # Level diatur lewat logging_settings.levels.sensor
+
 # --- Mengambil Konfigurasi dari GLOBAL_SETTINGS ---
 topics_config = GLOBAL_SETTINGS.get("topics", {})
 TEMPERATURE_TOPIC_DATA = topics_config.get("temperature")
 HUMIDITY_TOPIC_DATA = topics_config.get("humidity_data") # Jika ada di config
 SENSOR_LWT_TOPIC = topics_config.get("sensor_lwt")
 TEMPERATURE_RESPONSE_BASE = topics_config.get("temperature_response_base") # Untuk Req/Res
+RESPONSE_SUBSCRIPTION_MODE = get_response_subscription_mode() # "per_request" atau "wildcard"
+TELEMETRY_CONTENT_TYPE = get_telemetry_content_type() # Codec payload data sensor (payload_settings.telemetry_content_type)
+BATCH_MAX_READINGS, BATCH_MAX_DELAY_S = get_telemetry_batch_settings() # BATCH_MAX_READINGS <= 1: satu PUBLISH per pembacaan
+BATCHING_ENABLED = BATCH_MAX_READINGS > 1
+TEMPERATURE_INTERVAL_S, HUMIDITY_INTERVAL_S = get_sensor_schedule_settings() # Jadwal per jenis data (multi-rate)
 
 DEFAULT_QOS_SENSOR = GLOBAL_SETTINGS.get("default_qos", 1)
 LWT_QOS_SENSOR = GLOBAL_SETTINGS.get("lwt_qos", 1)
 LWT_RETAIN_SENSOR = GLOBAL_SETTINGS.get("lwt_retain", True)
 
 mqtt_advanced_cfg = GLOBAL_SETTINGS.get("mqtt_advanced_settings", {})
-# Message Expiry untuk data sensor akan diambil dari GLOBAL_SETTINGS oleh publish_message di mqtt_utils
-# jika tidak di-override secara spesifik saat memanggil publish_message.
+# Message Expiry untuk data sensor; dipasang sekali di PublishProfile suhu/kelembaban di bawah.
 DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA = mqtt_advanced_cfg.get("default_message_expiry_interval")
 
 
-CLIENT_ID_PREFIX = GLOBAL_SETTINGS.get('client_id_prefix', 'sensor_m5_') # Contoh prefix baru
-CLIENT_ID = f"{CLIENT_ID_PREFIX}{str(uuid.uuid4())[:8]}"
+CLIENT_ID = build_client_id("sensor", 'sensor_m5_') # Stabil bila GRUPM_SENSOR_CLIENT_ID / session_settings.roles.sensor.client_id diisi
 
 # Validasi konfigurasi dasar topik
 if not TEMPERATURE_TOPIC_DATA:
@@ -51,12 +70,15 @@ if not SENSOR_LWT_TOPIC:
 
 print(f"--- Sensor Client MQTTv5 ({CLIENT_ID}) ---")
 # (Anda bisa menambahkan print info broker dari GLOBAL_SETTINGS.get("broker_address") jika mau)
-print(f"Temperature Publish Topic: {TEMPERATURE_TOPIC_DATA}, QoS: {DEFAULT_QOS_SENSOR}")
-if HUMIDITY_TOPIC_DATA: print(f"Humidity Publish Topic: {HUMIDITY_TOPIC_DATA}, QoS: {DEFAULT_QOS_SENSOR}")
+print(f"Temperature Publish Topic: {TEMPERATURE_TOPIC_DATA}, QoS: {DEFAULT_QOS_SENSOR}, every {TEMPERATURE_INTERVAL_S}s")
+if HUMIDITY_TOPIC_DATA: print(f"Humidity Publish Topic: {HUMIDITY_TOPIC_DATA}, QoS: {DEFAULT_QOS_SENSOR}, every {HUMIDITY_INTERVAL_S}s")
 if SENSOR_LWT_TOPIC:
     print(f"LWT Topic: {SENSOR_LWT_TOPIC}, QoS: {LWT_QOS_SENSOR}, Retain: {LWT_RETAIN_SENSOR}")
 if TEMPERATURE_RESPONSE_BASE:
-    print(f"Temperature data may be sent as REQUEST, expecting response on base: {TEMPERATURE_RESPONSE_BASE}")
+    print(f"Temperature data may be sent as REQUEST, expecting response on base: {TEMPERATURE_RESPONSE_BASE} (mode: {RESPONSE_SUBSCRIPTION_MODE})")
+print(f"Telemetry payload codec (ContentType): {TELEMETRY_CONTENT_TYPE}")
+if BATCHING_ENABLED:
+    print(f"Batching: up to {BATCH_MAX_READINGS} readings or {BATCH_MAX_DELAY_S * 1000:.0f} ms per PUBLISH (ContentType: {CONTENT_TYPE_BATCH})")
 if DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA is not None:
     print(f"Default Message Expiry for data publishes (from settings): {DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA}s")
 print("-" * 30)
@@ -68,69 +90,182 @@ SENSOR_LWT_PAYLOAD_OFFLINE_UNEXPECTED_str = json.dumps({"client_id": CLIENT_ID,
 SENSOR_LWT_PAYLOAD_OFFLINE_GRACEFUL_template = {"client_id": CLIENT_ID, "status": "offline_graceful"} if SENSOR_LWT_TOPIC else {}
 
 
-active_sensor_requests = {} # {correlation_id: {details}}
+# Properties tetap (UserProperty, ContentType, MessageExpiry) dibangun sekali, bukan di setiap publish
+TEMPERATURE_PUBLISH_PROFILE = PublishProfile(
+    TEMPERATURE_TOPIC_DATA,
+    qos=DEFAULT_QOS_SENSOR,
+    message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA,
+    user_properties=[("sensor_model", "VirtualThermo 2000"), ("location_grid", "A4")],
+    content_type=TELEMETRY_CONTENT_TYPE
+)
+HUMIDITY_PUBLISH_PROFILE = PublishProfile(
+    HUMIDITY_TOPIC_DATA,
+    qos=DEFAULT_QOS_SENSOR,
+    message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA,
+    user_properties=[("sensor_model", "VirtualHygro 100")],
+    content_type=TELEMETRY_CONTENT_TYPE
+) if HUMIDITY_TOPIC_DATA else None
+# Mode batching: properties sama, tetapi payload berupa frame batch berisi beberapa pembacaan
+TEMPERATURE_BATCH_PROFILE = PublishProfile(
+    TEMPERATURE_TOPIC_DATA,
+    qos=DEFAULT_QOS_SENSOR,
+    message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA,
+    user_properties=[("sensor_model", "VirtualThermo 2000"), ("location_grid", "A4")],
+    content_type=CONTENT_TYPE_BATCH
+) if BATCHING_ENABLED else None
+HUMIDITY_BATCH_PROFILE = PublishProfile(
+    HUMIDITY_TOPIC_DATA,
+    qos=DEFAULT_QOS_SENSOR,
+    message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA,
+    user_properties=[("sensor_model", "VirtualHygro 100")],
+    content_type=CONTENT_TYPE_BATCH
+) if BATCHING_ENABLED and HUMIDITY_TOPIC_DATA else None
+
+temperature_rpc = None # RpcClient untuk data suhu yang dikirim sebagai request (dibuat di run_sensor)
 is_connected_flag = False # Flag untuk menandakan koneksi sudah siap
+connection_lost_reported = False # Peringatan koneksi putus cukup dicetak sekali per pemutusan
 
 def on_connect_sensor(client, userdata, flags, rc, properties=None):
-    global is_connected_flag
+    global is_connected_flag, connection_lost_reported
     if rc == 0: # Koneksi berhasil
         is_connected_flag = True
-        print(f"Sensor ({CLIENT_ID}): Custom on_connect. Connection logic activated. Ready to publish.")
+        connection_lost_reported = False
+        log.info("Sensor (%s): Custom on_connect. Connection logic activated. Ready to publish.", CLIENT_ID)
+        # Mode wildcard: satu subscription untuk semua response, dibuat ulang setiap (re)connect
+        if temperature_rpc:
+            temperature_rpc.subscribe_responses()
     # _default_on_connect di mqtt_utils akan menghandle print detail koneksi dan publish LWT online
 
 def on_message_sensor(client, userdata, msg):
-    # Dipanggil jika sensor subscribe ke topic response dan menerima balasan
-    global active_sensor_requests
+    # Dipanggil jika sensor menerima pesan; response dicocokkan oleh RpcClient lewat CorrelationData
+    if temperature_rpc and temperature_rpc.handle_message(msg):
+        return
+    log.warning("Sensor (%s) Message on topic '%s' was not a recognized response for this sensor.", CLIENT_ID, msg.topic)
+
+def on_temperature_response(future):
+    # Callback Future dari RpcClient: response diterima, timeout, atau request gagal dikirim
+    correlation_id = future.correlation_id
     try:
-        topic = msg.topic
-        decoded_payload = ""
-        try:
-            decoded_payload = msg.payload.decode('utf-8')
-        except UnicodeDecodeError:
-            print(f"Sensor ({CLIENT_ID}) Warning: Could not decode response payload as UTF-8 on topic '{topic}'.")
-            return
-
-        print(f"\nSensor ({CLIENT_ID}) Received RESPONSE on '{topic}': {decoded_payload}")
-
-        # Ambil CorrelationData dari properties pesan masuk
-        correlation_id_resp = None
-        if msg.properties and hasattr(msg.properties, 'CorrelationData'):
-            correlation_id_resp = msg.properties.CorrelationData.decode('utf-8', errors='replace')
-        
-        if correlation_id_resp and correlation_id_resp in active_sensor_requests:
-            request_details = active_sensor_requests.pop(correlation_id_resp) # Hapus setelah diproses
-            print(f"  [RESPONSE MATCHED] For Temperature Data Request with Correlation ID: {correlation_id_resp}")
-            try:
-                response_data = json.loads(decoded_payload)
-                print(f"  Parsed Response Data from Panel/Subscriber: {response_data}")
-                # Lakukan sesuatu dengan response_data jika perlu
-            except json.JSONDecodeError:
-                print(f"  Response Data is not JSON (Raw): {decoded_payload}")
-            
-            # Unsubscribe dari topic response yang dinamis ini
-            if client.is_connected(): # Pastikan masih konek sebelum unsubscribe
-                client.unsubscribe(request_details['response_topic'])
-                print(f"  Unsubscribed from dynamic response topic: {request_details['response_topic']}")
-        else:
-            print(f"  Message on topic '{topic}' was not a recognized response for this sensor or correlation ID mismatch.")
+        msg = future.result()
+    except RpcTimeoutError:
+        log.warning("Sensor (%s) No response for temperature request (Correlation ID: %s) before deadline.", CLIENT_ID, correlation_id)
+        return
+    except RpcError as e_rpc:
+        log.error("Sensor (%s) Temperature request (Correlation ID: %s) failed: %s", CLIENT_ID, correlation_id, e_rpc)
+        return
 
-    except Exception as e:
-        print(f"Sensor ({CLIENT_ID}) Error processing message from topic '{topic}': {e}")
+    try:
+        decoded_payload = msg.payload.decode('utf-8')
+    except UnicodeDecodeError:
+        log.warning("Sensor (%s) Could not decode response payload as UTF-8 on topic '%s'.", CLIENT_ID, msg.topic)
+        return
+
+    log.info("Sensor (%s) Received RESPONSE on '%s': %s", CLIENT_ID, msg.topic, decoded_payload)
+    log.info("  [RESPONSE MATCHED] For Temperature Data Request with Correlation ID: %s", correlation_id)
+    try:
+        response_data = json.loads(decoded_payload)
+        log.info("  Parsed Response Data from Panel/Subscriber: %s", response_data)
+        # Lakukan sesuatu dengan response_data jika perlu
+    except json.JSONDecodeError:
+        log.info("  Response Data is not JSON (Raw): %s", decoded_payload)
 
 
 def on_publish_sensor(client, userdata, mid, properties=None):
     # Callback ini dipanggil setelah konfirmasi dari broker (untuk QoS > 0)
-    print(f"Sensor ({CLIENT_ID}) Message Published (mid: {mid}) - Confirmed by broker (for QoS > 0).")
+    log.debug("Sensor (%s) Message Published (mid: %s) - Confirmed by broker (for QoS > 0).", CLIENT_ID, mid)
 
 def on_disconnect_sensor(client, userdata, rc, properties=None):
     global is_connected_flag
     is_connected_flag = False # Reset flag saat disconnect
-    print(f"Sensor ({CLIENT_ID}) Disconnected from MQTT Broker (rc: {rc}).")
-    # Jika rc != 0, mungkin ada masalah dan bisa coba reconnect di sini (logika lebih lanjut)
+    log.info("Sensor (%s) Disconnected from MQTT Broker (rc: %s).", CLIENT_ID, rc)
+    # Reconnect (backoff + jitter) dan subscribe ulang ditangani ReconnectManager di mqtt_utils
+
+def create_batchers(client):
+    """TelemetryBatcher suhu dan kelembaban (None bila topik tidak ada); suhu tetap lewat RpcClient jika aktif."""
+    def publish_temperature_batch(batch_payload):
+        if temperature_rpc: # Satu request (dan satu ACK) per batch
+            future_batch = temperature_rpc.request(TEMPERATURE_TOPIC_DATA, batch_payload, profile=TEMPERATURE_BATCH_PROFILE)
+            future_batch.add_done_callback(on_temperature_response)
+            return future_batch
+        return TEMPERATURE_BATCH_PROFILE.publish(client, batch_payload)
+
+    temperature_batcher = TelemetryBatcher(publish_temperature_batch, BATCH_MAX_READINGS, BATCH_MAX_DELAY_S,
+                                           item_content_type=TELEMETRY_CONTENT_TYPE, name=f"{CLIENT_ID}-temperature")
+    humidity_batcher = None
+    if HUMIDITY_BATCH_PROFILE:
+        humidity_batcher = TelemetryBatcher(lambda batch_payload: HUMIDITY_BATCH_PROFILE.publish(client, batch_payload),
+                                            BATCH_MAX_READINGS, BATCH_MAX_DELAY_S,
+                                            item_content_type=TELEMETRY_CONTENT_TYPE, name=f"{CLIENT_ID}-humidity")
+    return temperature_batcher, humidity_batcher
+
+def publish_temperature_reading(client, temperature_batcher, msg_count):
+    current_timestamp = time.time()
+    temperature_value = round(random.uniform(15.0, 38.0), 1) # Rentang suhu sedikit diubah
+    
+    # Payload data suhu
+    temp_payload_dict = {"count": msg_count, "temperature": temperature_value, "unit": "C", "client_id": CLIENT_ID, "timestamp": current_timestamp}
+    if temperature_batcher: # Mode batching: pembacaan dikumpulkan, PUBLISH dilakukan oleh batcher
+        temperature_batcher.add(temp_payload_dict)
+        return
+    temp_payload = encode_payload(temp_payload_dict, TELEMETRY_CONTENT_TYPE)
+    # Properti pesan suhu (UserProperty, ContentType, Message Expiry) ada di TEMPERATURE_PUBLISH_PROFILE
+
+    log.info("Sensor (%s) Publishing Temperature (Msg #%s) to '%s'", CLIENT_ID, msg_count, TEMPERATURE_TOPIC_DATA)
+    if temperature_rpc: # Jika sensor ingin mengirim data suhu sebagai request
+        future_temp = temperature_rpc.request(
+            TEMPERATURE_TOPIC_DATA,
+            temp_payload,
+            profile=TEMPERATURE_PUBLISH_PROFILE
+        )
+        future_temp.add_done_callback(on_temperature_response) # Gagal kirim/timeout juga dilaporkan di sini
+        if not future_temp.done():
+            log.info("  Temperature enqueued as REQUEST. Expecting response with Correlation ID: %s", future_temp.correlation_id)
+    else:
+        result_temp = TEMPERATURE_PUBLISH_PROFILE.publish(client, temp_payload)
+        if result_temp and result_temp.rc == mqtt.MQTT_ERR_SUCCESS:
+            log.debug("  Temperature (mid: %s) enqueued for publishing.", result_temp.mid)
+        else:
+            err_code_temp = result_temp.rc if result_temp else "N/A (Publish Failed)"
+            log.error("  Failed to enqueue temperature message (Error: %s)", err_code_temp)
+
+def publish_humidity_reading(client, humidity_batcher, msg_count):
+    humidity_value = round(random.uniform(30.0, 75.0), 1) # Rentang humidity
+    hum_payload_dict = {"count": msg_count, "humidity": humidity_value, "unit": "%RH", "client_id": CLIENT_ID, "timestamp": time.time()}
+    if humidity_batcher:
+        humidity_batcher.add(hum_payload_dict)
+        return
+    hum_payload = encode_payload(hum_payload_dict, TELEMETRY_CONTENT_TYPE)
+    
+    log.info("Sensor (%s) Publishing Humidity (Msg #%s) to '%s'", CLIENT_ID, msg_count, HUMIDITY_TOPIC_DATA)
+    result_hum = HUMIDITY_PUBLISH_PROFILE.publish(client, hum_payload)
+    if result_hum and result_hum.rc == mqtt.MQTT_ERR_SUCCESS:
+         log.debug("  Humidity (mid: %s) enqueued for publishing.", result_hum.mid)
+    else:
+         err_code_hum = result_hum.rc if result_hum else "N/A (Publish Failed)"
+         log.error("  Failed to enqueue humidity message (Error: %s)", err_code_hum)
+
+def make_sensor_job(publish_reading, client, batcher):
+    """Callback DeadlineScheduler untuk satu jenis pembacaan dengan penghitung pesannya sendiri."""
+    msg_counter = itertools.count(1)
+    def _job():
+        global connection_lost_reported
+        if not is_connected_flag:
+            buffering = offline_buffering_enabled(client)
+            if not connection_lost_reported:
+                if buffering:
+                    log.warning("Connection lost. Buffering readings in the offline queue until reconnect.")
+                else:
+                    log.warning("Connection lost. Pausing publish attempts. Paho-MQTT should be attempting to reconnect.")
+                connection_lost_reported = True
+            if not buffering: # Tanpa antrean offline slot dilewati; jadwal tetap, tidak ada jeda tambahan
+                return
+        publish_reading(client, batcher, next(msg_counter))
+    return _job
 
 def run_sensor():
-    global is_connected_flag
+    global is_connected_flag, temperature_rpc
     is_connected_flag = False # Pastikan flag false di awal
+    temperature_batcher = humidity_batcher = None
 
     client = create_mqtt_client(
         client_id=CLIENT_ID,
@@ -142,11 +277,15 @@ def run_sensor():
         lwt_payload_online=SENSOR_LWT_PAYLOAD_ONLINE_str,
         lwt_payload_offline=SENSOR_LWT_PAYLOAD_OFFLINE_UNEXPECTED_str,
         lwt_qos=LWT_QOS_SENSOR,
-        lwt_retain=LWT_RETAIN_SENSOR
+        lwt_retain=LWT_RETAIN_SENSOR,
+        session_role="sensor"
     )
     if not client:
         print(f"Sensor ({CLIENT_ID}): Failed to create MQTT client from utils. Exiting.")
         return
+    if TEMPERATURE_RESPONSE_BASE: # Data suhu dikirim sebagai request; dibuat sebelum loop_start agar on_connect melihatnya
+        temperature_rpc = RpcClient(client, CLIENT_ID, TEMPERATURE_RESPONSE_BASE, mode=RESPONSE_SUBSCRIPTION_MODE)
+        temperature_rpc.start_sweeper() # Request tanpa response di-expire walaupun broker/responder diam
 
     client.loop_start() # Penting untuk memproses callback dan network traffic
     print(f"Sensor ({CLIENT_ID}) started. Waiting for connection to be ready...")
@@ -165,103 +304,37 @@ def run_sensor():
 
     print(f"Sensor ({CLIENT_ID}) Connection ready. Publishing data...")
     print("-" * 30)
-    msg_count = 0
-    publish_interval = GLOBAL_SETTINGS.get("sensor_publish_interval", 5) # Ambil dari config jika ada, atau default 5 detik
+    if BATCHING_ENABLED:
+        temperature_batcher, humidity_batcher = create_batchers(client)
+        for batcher in (temperature_batcher, humidity_batcher):
+            if batcher:
+                batcher.start_flusher() # Batch yang belum penuh tetap dikirim setelah BATCH_MAX_DELAY_S
+    scheduler = DeadlineScheduler(name=f"{CLIENT_ID}-publish")
+    scheduler.add_job("temperature", TEMPERATURE_INTERVAL_S,
+                      make_sensor_job(publish_temperature_reading, client, temperature_batcher))
+    if HUMIDITY_TOPIC_DATA:
+        scheduler.add_job("humidity", HUMIDITY_INTERVAL_S,
+                          make_sensor_job(publish_humidity_reading, client, humidity_batcher))
     try:
-        while True:
-            if not is_connected_flag: # Jika koneksi putus di tengah jalan
-                print(f"WARNING ({CLIENT_ID}): Connection lost. Pausing publish attempts. Paho-MQTT should be attempting to reconnect.")
-                time.sleep(publish_interval) # Tunggu dan biarkan loop Paho mencoba reconnect
-                continue # Coba lagi di iterasi berikutnya
-
-            msg_count += 1
-            current_timestamp = time.time()
-            temperature_value = round(random.uniform(15.0, 38.0), 1) # Rentang suhu sedikit diubah
-            
-            # Payload data suhu
-            temp_payload_dict = {"count": msg_count, "temperature": temperature_value, "unit": "C", "client_id": CLIENT_ID, "timestamp": current_timestamp}
-            temp_payload_json = json.dumps(temp_payload_dict)
-            
-            # Properti untuk pesan suhu
-            correlation_id_temp_req = None
-            response_topic_temp_req = None
-            user_props_temp = [("sensor_model", "VirtualThermo 2000"), ("location_grid", "A4")]
-            content_type_temp = "application/json"
-            # Message Expiry akan diambil dari DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA oleh publish_message
-
-            if TEMPERATURE_RESPONSE_BASE: # Jika sensor ingin mengirim data suhu sebagai request
-                correlation_id_temp_req = str(uuid.uuid4())
-                response_topic_temp_req = f"{TEMPERATURE_RESPONSE_BASE}{correlation_id_temp_req}"
-                active_sensor_requests[correlation_id_temp_req] = {'response_topic': response_topic_temp_req, 'timestamp': current_timestamp}
-                if client.is_connected():
-                    (res_sub, mid_sub) = client.subscribe([(response_topic_temp_req, 1)]) # QoS untuk subscribe response
-                    if res_sub == mqtt.MQTT_ERR_SUCCESS:
-                         print(f"  Sensor ({CLIENT_ID}) Subscribed to '{response_topic_temp_req}' for temp response (MID: {mid_sub}).")
-                    else:
-                         print(f"  Sensor ({CLIENT_ID}) FAILED to subscribe to response topic '{response_topic_temp_req}' (Error: {res_sub}).")
-            
-            print(f"\nSensor ({CLIENT_ID}) Publishing Temperature (Msg #{msg_count}) to '{TEMPERATURE_TOPIC_DATA}'")
-            result_temp = publish_message(
-                client,
-                topic=TEMPERATURE_TOPIC_DATA,
-                payload=temp_payload_json,
-                qos=DEFAULT_QOS_SENSOR,
-                # retain=False, # Data sensor biasanya tidak di-retain kecuali ada kebutuhan khusus
-                message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA, # Bisa juga di-override per pesan
-                response_topic=response_topic_temp_req,
-                correlation_data=correlation_id_temp_req.encode('utf-8') if correlation_id_temp_req else None,
-                user_properties=user_props_temp,
-                content_type=content_type_temp
-            )
-            
-            if not (result_temp and result_temp.rc == mqtt.MQTT_ERR_SUCCESS):
-                err_code_temp = result_temp.rc if result_temp else "N/A (Publish Failed)"
-                print(f"  Failed to enqueue temperature message (Error: {err_code_temp})")
-                # Cleanup jika publish request gagal
-                if correlation_id_temp_req and correlation_id_temp_req in active_sensor_requests:
-                    del active_sensor_requests[correlation_id_temp_req]
-                    if response_topic_temp_req and client.is_connected(): client.unsubscribe(response_topic_temp_req)
-            elif result_temp and correlation_id_temp_req: # Jika publish sukses dan ini adalah request
-                print(f"  Temperature (mid: {result_temp.mid}) enqueued as REQUEST. Expecting response with Correlation ID: {correlation_id_temp_req}")
-            elif result_temp: # Publish sukses tapi bukan request
-                 print(f"  Temperature (mid: {result_temp.mid}) enqueued for publishing.")
-
-
-            # Publikasi Data Kelembaban (jika topik dikonfigurasi)
-            if HUMIDITY_TOPIC_DATA:
-                humidity_value = round(random.uniform(30.0, 75.0), 1) # Rentang humidity
-                hum_payload_dict = {"count": msg_count, "humidity": humidity_value, "unit": "%RH", "client_id": CLIENT_ID, "timestamp": current_timestamp}
-                hum_payload_json = json.dumps(hum_payload_dict)
-                
-                print(f"Sensor ({CLIENT_ID}) Publishing Humidity (Msg #{msg_count}) to '{HUMIDITY_TOPIC_DATA}'")
-                result_hum = publish_message(
-                    client,
-                    topic=HUMIDITY_TOPIC_DATA,
-                    payload=hum_payload_json,
-                    qos=DEFAULT_QOS_SENSOR,
-                    message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA,
-                    user_properties=[("sensor_model", "VirtualHygro 100")],
-                    content_type="application/json"
-                )
-                if result_hum and result_hum.rc == mqtt.MQTT_ERR_SUCCESS:
-                     print(f"  Humidity (mid: {result_hum.mid}) enqueued for publishing.")
-                else:
-                     err_code_hum = result_hum.rc if result_hum else "N/A (Publish Failed)"
-                     print(f"  Failed to enqueue humidity message (Error: {err_code_hum})")
-
-            time.sleep(publish_interval)
+        scheduler.run() # Blocking sampai Ctrl+C; setiap job berjalan pada deadline absolut masing-masing
     except KeyboardInterrupt:
         print(f"\nSensor ({CLIENT_ID}) Exiting due to Ctrl+C...")
     except Exception as e:
         print(f"An error occurred in the sensor main loop: {e}")
     finally:
         print("-" * 30)
-        # Cleanup subscriptions untuk response yang mungkin masih aktif
-        if client and hasattr(client, 'is_connected') and client.is_connected():
-            for corr_id, details in list(active_sensor_requests.items()): # Salin list untuk iterasi aman saat menghapus
-                if client.is_connected(): # Cek lagi sebelum unsubscribe
-                    print(f"  Cleaning up sensor's subscription for pending response: {details['response_topic']}")
-                    client.unsubscribe(details['response_topic'])
+        print(f"Sensor ({CLIENT_ID}) Schedule stats: {scheduler.get_stats()}")
+        for batcher in (temperature_batcher, humidity_batcher):
+            if batcher: # Kirim sisa pembacaan sebelum disconnect
+                batcher.stop_flusher(flush=True)
+                print(f"Sensor ({CLIENT_ID}) Batch stats ({batcher.name}): {batcher.get_stats()}")
+        # Gagalkan request yang masih menunggu (RpcClient sekaligus unsubscribe topik response per request)
+        if temperature_rpc:
+            temperature_rpc.cancel_all(f"Sensor {CLIENT_ID} shutting down")
+            print(f"Sensor ({CLIENT_ID}) Request/response stats: {temperature_rpc.get_stats()}")
+        reconnect_manager = get_reconnect_manager(client)
+        if reconnect_manager:
+            print(f"Sensor ({CLIENT_ID}) Reconnect stats: {reconnect_manager.get_stats()}")
         
         # Siapkan payload untuk LWT offline graceful
         payload_graceful_offline_final_str = None
@@ -0,0 +1,350 @@
+# sensor/sensor_fleet.py
+# Simulator armada sensor virtual untuk load-test broker dan panel. Setiap sensor punya CLIENT_ID
+# unik, LWT sendiri di topik sensor_lwt, serta laju publish dan jitter yang bisa diatur. Semua sensor
+# berjalan sebagai coroutine di SATU event loop (AsyncMqttClient), tanpa thread loop_start() per device.
+# Di akhir run dilaporkan laju tercapai vs laju yang diminta dan latency publish (sampai PUBACK) per device.
+import argparse
+import asyncio
+import csv
+import json
+import random
+import time
+import uuid
+from pathlib import Path
+import sys
+
+# Tambahkan direktori common ke sys.path agar bisa import mqtt_utils
+COMMON_DIR = Path(__file__).resolve().parent.parent / 'common'
+sys.path.append(str(COMMON_DIR))
+
+from mqtt_utils import (
+    GLOBAL_SETTINGS,
+    PublishProfile,
+    encode_payload,
+    get_telemetry_content_type,
+)
+from mqtt_async import AsyncMqttClient, MqttAsyncError
+from latency_histogram import LatencyHistogram
+from log_utils import get_logger
+
+log = get_logger("sensor_fleet")
+
+
+# --- Mengambil Konfigurasi dari GLOBAL_SETTINGS (sama dengan sensor_client.py) ---
+topics_config = GLOBAL_SETTINGS.get("topics", {})
+TEMPERATURE_TOPIC_DATA = topics_config.get("temperature")
+HUMIDITY_TOPIC_DATA = topics_config.get("humidity_data")
+SENSOR_LWT_TOPIC = topics_config.get("sensor_lwt")
+TELEMETRY_CONTENT_TYPE = get_telemetry_content_type()
+
+DEFAULT_QOS_SENSOR = GLOBAL_SETTINGS.get("default_qos", 1)
+LWT_QOS_SENSOR = GLOBAL_SETTINGS.get("lwt_qos", 1)
+LWT_RETAIN_SENSOR = GLOBAL_SETTINGS.get("lwt_retain", True)
+DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA = GLOBAL_SETTINGS.get("mqtt_advanced_settings", {}).get("default_message_expiry_interval")
+CLIENT_ID_PREFIX = GLOBAL_SETTINGS.get('client_id_prefix', 'sensor_m5_')
+
+fleet_cfg = GLOBAL_SETTINGS.get("sensor_fleet_settings", {})
+DEFAULT_FLEET_DEVICES = fleet_cfg.get("num_devices", 100)
+DEFAULT_FLEET_RATE_HZ = fleet_cfg.get("publish_rate_hz", 1.0) # Pembacaan per detik per device
+DEFAULT_FLEET_JITTER = fleet_cfg.get("jitter", 0.1) # Fraksi periode, jadwal digeser acak +/- jitter
+DEFAULT_FLEET_CONNECT_RATE = fleet_cfg.get("connect_rate_per_s", 50) # Koneksi baru per detik saat ramp-up
+DEFAULT_FLEET_DURATION_S = fleet_cfg.get("duration_s", 60)
+DEFAULT_FLEET_REPORT_INTERVAL_S = fleet_cfg.get("report_interval_s", 5)
+FLEET_REPORT_PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+FLEET_WORST_DEVICES_SHOWN = 10
+
+# Satu profil per topik untuk seluruh armada: properties di-serialize sekali, bukan per device
+TEMPERATURE_PUBLISH_PROFILE = PublishProfile(
+    TEMPERATURE_TOPIC_DATA,
+    qos=DEFAULT_QOS_SENSOR,
+    message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA,
+    user_properties=[("sensor_model", "VirtualThermo 2000"), ("location_grid", "fleet")],
+    content_type=TELEMETRY_CONTENT_TYPE
+)
+HUMIDITY_PUBLISH_PROFILE = PublishProfile(
+    HUMIDITY_TOPIC_DATA,
+    qos=DEFAULT_QOS_SENSOR,
+    message_expiry_interval=DEFAULT_MESSAGE_EXPIRY_SENSOR_DATA,
+    user_properties=[("sensor_model", "VirtualHygro 100")],
+    content_type=TELEMETRY_CONTENT_TYPE
+) if HUMIDITY_TOPIC_DATA else None
+
+
+class DeviceStats:
+    """Statistik satu sensor virtual. Sengaja ringan (tanpa histogram per device) agar ribuan device muat di memori."""
+    __slots__ = ('client_id', 'rate_hz', 'connected_at', 'published', 'failed', 'skipped',
+                 'latency_sum', 'latency_max', 'first_publish', 'last_publish')
+
+    def __init__(self, client_id, rate_hz):
+        self.client_id = client_id
+        self.rate_hz = rate_hz
+        self.connected_at = None
+        self.published = 0
+        self.failed = 0
+        self.skipped = 0 # Slot jadwal yang dilewati karena publish sebelumnya belum selesai
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.first_publish = None
+        self.last_publish = None
+
+    def record(self, started_at, latency):
+        self.published += 1
+        self.latency_sum += latency
+        if latency > self.latency_max:
+            self.latency_max = latency
+        if self.first_publish is None:
+            self.first_publish = started_at
+        self.last_publish = started_at
+
+    @property
+    def latency_mean(self):
+        return self.latency_sum / self.published if self.published else None
+
+    def achieved_rate(self, end_time):
+        # Laju dihitung sejak device siap publish, bukan sejak simulator start (ramp-up tidak menurunkan laju)
+        if self.connected_at is None or end_time <= self.connected_at:
+            return 0.0
+        return self.published / (end_time - self.connected_at)
+
+
+class SensorFleet:
+    """Menjalankan N sensor virtual di satu event loop dan mengumpulkan statistik armada."""
+    def __init__(self, num_devices, rate_hz, jitter, connect_rate, duration_s, report_interval_s, seed=None):
+        self.num_devices = num_devices
+        self.rate_hz = rate_hz
+        self.jitter = jitter
+        self.connect_rate = connect_rate
+        self.duration_s = duration_s
+        self.report_interval_s = report_interval_s
+        self.rng = random.Random(seed)
+        self.run_id = str(uuid.uuid4())[:6] # Dua armada paralel tidak boleh berbagi CLIENT_ID
+        self.profiles = [p for p in (TEMPERATURE_PUBLISH_PROFILE, HUMIDITY_PUBLISH_PROFILE) if p]
+        self.devices = []
+        self.latency = LatencyHistogram() # Distribusi latency publish seluruh armada
+        self.connect_failures = 0
+        self.start_time = None
+        self.stop_time = None
+        self._stop_event = None
+
+    def requested_rate(self):
+        """Pesan per detik yang diminta untuk seluruh armada (semua topik)."""
+        return self.num_devices * self.rate_hz * len(self.profiles)
+
+    def device_client_id(self, index):
+        return f"{CLIENT_ID_PREFIX}fleet_{self.run_id}_{index:05d}"
+
+    async def run(self):
+        self._stop_event = asyncio.Event()
+        self.start_time = time.monotonic()
+        self.stop_time = self.start_time + self.duration_s
+        reporter = asyncio.create_task(self._report_loop())
+        tasks = [asyncio.create_task(self._run_device(index)) for index in range(self.num_devices)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self._stop_event.set()
+            reporter.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.stop_time = min(self.stop_time, time.monotonic())
+
+    async def _wait_until(self, deadline):
+        """Tidur sampai `deadline` (monotonic). Return False bila armada dihentikan lebih dulu."""
+        delay = deadline - time.monotonic()
+        if delay <= 0:
+            return not self._stop_event.is_set()
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), delay)
+            return False
+        except asyncio.TimeoutError:
+            return True
+
+    async def _run_device(self, index):
+        client_id = self.device_client_id(index)
+        stats = DeviceStats(client_id, self.rate_hz)
+        self.devices.append(stats)
+
+        # Ramp-up: koneksi dibuka bertahap agar broker tidak menerima ribuan CONNECT sekaligus
+        if self.connect_rate and not await self._wait_until(self.start_time + index / self.connect_rate):
+            return
+        if time.monotonic() >= self.stop_time: # Ramp-up lebih lama dari durasi run
+            return
+
+        lwt_online = json.dumps({"client_id": client_id, "status": "online", "timestamp": time.time()}) if SENSOR_LWT_TOPIC else None
+        lwt_offline = json.dumps({"client_id": client_id, "status": "offline_unexpected", "timestamp": time.time()}) if SENSOR_LWT_TOPIC else None
+        try:
+            client = AsyncMqttClient(client_id, lwt_topic=SENSOR_LWT_TOPIC, lwt_payload_online=lwt_online,
+                                     lwt_payload_offline=lwt_offline, lwt_qos=LWT_QOS_SENSOR, lwt_retain=LWT_RETAIN_SENSOR)
+            await client.connect()
+        except MqttAsyncError as e_conn:
+            self.connect_failures += 1
+            log.error("Fleet: %s", e_conn)
+            return
+
+        stats.connected_at = time.monotonic()
+        try:
+            await self._publish_loop(client, stats)
+        finally:
+            graceful = None
+            if SENSOR_LWT_TOPIC:
+                graceful = json.dumps({"client_id": client_id, "status": "offline_graceful", "timestamp": time.time()})
+            await client.disconnect(lwt_topic=SENSOR_LWT_TOPIC, lwt_payload_offline_graceful=graceful,
+                                    lwt_qos=LWT_QOS_SENSOR, lwt_retain=LWT_RETAIN_SENSOR,
+                                    reason_string=f"Sensor {client_id} fleet run finished")
+
+    async def _publish_loop(self, client, stats):
+        period = 1.0 / self.rate_hz
+        # Fase acak per device agar publish armada tersebar merata, bukan serentak di awal setiap periode
+        next_slot = stats.connected_at + self.rng.uniform(0, period)
+        msg_count = 0
+        while True:
+            # Jadwal absolut (slot ke-k = awal + k * periode): jitter tidak menumpuk menjadi drift
+            deadline = next_slot + self.rng.uniform(-self.jitter, self.jitter) * period
+            if deadline >= self.stop_time or not await self._wait_until(deadline):
+                return
+            msg_count += 1
+            current_timestamp = time.time()
+            readings = (
+                {"count": msg_count, "temperature": round(self.rng.uniform(15.0, 38.0), 1), "unit": "C",
+                 "client_id": stats.client_id, "timestamp": current_timestamp},
+                {"count": msg_count, "humidity": round(self.rng.uniform(30.0, 75.0), 1), "unit": "%RH",
+                 "client_id": stats.client_id, "timestamp": current_timestamp},
+            )
+            for profile, reading in zip(self.profiles, readings):
+                started_at = time.monotonic()
+                try:
+                    await client.publish(None, encode_payload(reading, TELEMETRY_CONTENT_TYPE), profile=profile)
+                except MqttAsyncError as e_pub:
+                    stats.failed += 1
+                    if not client.is_connected():
+                        log.warning("Fleet: %s lost its connection: %s", stats.client_id, e_pub)
+                        return
+                    continue
+                latency = time.monotonic() - started_at
+                stats.record(started_at, latency)
+                self.latency.record(latency)
+
+            next_slot += period
+            now = time.monotonic()
+            if now > next_slot + period: # Tertinggal lebih dari satu slot: lewati, jangan kirim beruntun
+                missed = int((now - next_slot) / period)
+                stats.skipped += missed
+                next_slot += missed * period
+
+    async def _report_loop(self):
+        last_time, last_published = time.monotonic(), 0
+        while True:
+            await asyncio.sleep(self.report_interval_s)
+            now = time.monotonic()
+            published = sum(d.published for d in self.devices)
+            connected = sum(1 for d in self.devices if d.connected_at is not None)
+            window_rate = (published - last_published) / (now - last_time)
+            p99 = self.latency.percentile(99.0)
+            p99_text = f"{p99 * 1000:.2f} ms" if p99 is not None else "N/A"
+            print(f"Fleet [{now - self.start_time:6.1f}s] connected: {connected}/{self.num_devices}, "
+                  f"rate: {window_rate:.1f}/{self.requested_rate():.1f} msg/s, p99 latency: {p99_text}")
+            last_time, last_published = now, published
+
+    def print_results(self, worst_shown=FLEET_WORST_DEVICES_SHOWN):
+        end_time = self.stop_time
+        elapsed = end_time - self.start_time
+        connected = [d for d in self.devices if d.connected_at is not None]
+        published = sum(d.published for d in self.devices)
+        failed = sum(d.failed for d in self.devices)
+        skipped = sum(d.skipped for d in self.devices)
+        # Laju yang diminta memperhitungkan ramp-up: setiap device hanya diminta publish setelah terkoneksi
+        requested = sum(self.rate_hz * len(self.profiles) * max(0.0, end_time - d.connected_at) for d in connected)
+
+        print("\n--- Sensor Fleet Results ---")
+        print(f"Devices: {len(connected)}/{self.num_devices} connected (connect failures: {self.connect_failures})")
+        print(f"Requested: {self.rate_hz} Hz x {len(self.profiles)} topic(s) per device, jitter +/-{self.jitter * 100:.0f}% "
+              f"= {self.requested_rate():.1f} msg/s fleet-wide")
+        print(f"Duration: {elapsed:.2f}s, published: {published}, failed: {failed}, skipped slots: {skipped}")
+        if elapsed > 0:
+            print(f"Achieved rate: {published / elapsed:.1f} msg/s ({(published / requested * 100) if requested else 0:.1f}% of requested after ramp-up)")
+        if self.latency.total_count:
+            print(f"Publish latency (ms): mean {self.latency.mean * 1000:.2f}, min {self.latency.min * 1000:.2f}, "
+                  f"max {self.latency.max * 1000:.2f}")
+            for percentile, value in self.latency.percentiles(FLEET_REPORT_PERCENTILES).items():
+                print(f"  p{percentile:g}: {value * 1000:.2f} ms")
+
+        # Device dengan laju tercapai terendah relatif terhadap yang diminta, lalu latency rata-rata tertinggi
+        target = self.rate_hz * len(self.profiles)
+        worst = sorted(connected, key=lambda d: (d.achieved_rate(end_time) / target, -(d.latency_mean or 0.0)))[:worst_shown]
+        if worst:
+            print(f"Worst {len(worst)} devices (achieved/requested msg/s, mean/max latency ms):")
+            for d in worst:
+                mean_ms = d.latency_mean * 1000 if d.latency_mean is not None else float('nan')
+                print(f"  {d.client_id}: {d.achieved_rate(end_time):.2f}/{target:.2f}, "
+                      f"{mean_ms:.2f}/{d.latency_max * 1000:.2f}, failed {d.failed}, skipped {d.skipped}")
+
+    def write_device_report(self, path):
+        """Tulis statistik per device sebagai CSV (satu baris per CLIENT_ID)."""
+        target = self.rate_hz * len(self.profiles)
+        with open(path, 'w', newline='', encoding='utf-8') as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(["client_id", "requested_msg_s", "achieved_msg_s", "published", "failed",
+                             "skipped", "latency_mean_ms", "latency_max_ms"])
+            for d in self.devices:
+                writer.writerow([d.client_id, f"{target:.3f}", f"{d.achieved_rate(self.stop_time):.3f}", d.published,
+                                 d.failed, d.skipped,
+                                 f"{d.latency_mean * 1000:.3f}" if d.latency_mean is not None else "",
+                                 f"{d.latency_max * 1000:.3f}"])
+
+
+def run_fleet(args):
+    if not TEMPERATURE_TOPIC_DATA:
+        print("Error (fleet): temperature topic ('topics.temperature') not found in configuration. Exiting.")
+        return
+    if not SENSOR_LWT_TOPIC:
+        print("Warning (fleet): Sensor LWT topic ('sensor_lwt') not found in config. LWT functionality will be disabled.")
+
+    fleet = SensorFleet(args.devices, args.rate, args.jitter, args.connect_rate, args.duration,
+                        args.report_interval, seed=args.seed)
+    print(f"--- Sensor Fleet Simulator (run {fleet.run_id}) ---")
+    print(f"Devices: {args.devices}, rate: {args.rate} Hz, jitter: +/-{args.jitter * 100:.0f}%, "
+          f"connect ramp: {args.connect_rate or 'unlimited'}/s, duration: {args.duration}s")
+    print(f"Topics: {[p.topic for p in fleet.profiles]}, QoS: {DEFAULT_QOS_SENSOR}, ContentType: {TELEMETRY_CONTENT_TYPE}")
+    print("-" * 30)
+    try:
+        asyncio.run(fleet.run())
+    except KeyboardInterrupt:
+        print("\nFleet: Interrupted by Ctrl+C, reporting partial results...")
+    if fleet.start_time is None:
+        return
+    fleet.print_results()
+    if args.device_report:
+        fleet.write_device_report(args.device_report)
+        print(f"Per-device statistics written to {args.device_report}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Virtual sensor fleet simulator (load test for broker and panel)")
+    parser.add_argument("--devices", type=int, default=DEFAULT_FLEET_DEVICES,
+                        help=f"Number of virtual sensors, each with its own CLIENT_ID and LWT (default: {DEFAULT_FLEET_DEVICES})")
+    parser.add_argument("--rate", type=float, default=DEFAULT_FLEET_RATE_HZ,
+                        help=f"Readings per second per device (default: {DEFAULT_FLEET_RATE_HZ})")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_FLEET_JITTER,
+                        help=f"Random schedule offset as a fraction of the period, 0..0.5 (default: {DEFAULT_FLEET_JITTER})")
+    parser.add_argument("--connect_rate", "--connect-rate", type=float, default=DEFAULT_FLEET_CONNECT_RATE, dest="connect_rate",
+                        help=f"New connections per second during ramp-up, 0 = all at once (default: {DEFAULT_FLEET_CONNECT_RATE})")
+    parser.add_argument("--duration", type=float, default=DEFAULT_FLEET_DURATION_S,
+                        help=f"Run time in seconds, including ramp-up (default: {DEFAULT_FLEET_DURATION_S})")
+    parser.add_argument("--report_interval", "--report-interval", type=float, default=DEFAULT_FLEET_REPORT_INTERVAL_S,
+                        dest="report_interval", help=f"Seconds between progress lines (default: {DEFAULT_FLEET_REPORT_INTERVAL_S})")
+    parser.add_argument("--device_report", "--device-report", type=str, default=None, dest="device_report",
+                        help="Write per-device rate and latency statistics to this CSV file")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for schedule phase, jitter and readings")
+    args = parser.parse_args()
+
+    if args.devices <= 0 or args.rate <= 0 or args.duration <= 0 or args.report_interval <= 0:
+        print("Error: devices, rate, duration and report_interval must be positive")
+        sys.exit(1)
+    if not 0 <= args.jitter <= 0.5:
+        print("Error: jitter must be between 0 and 0.5")
+        sys.exit(1)
+    if args.connect_rate < 0:
+        print("Error: connect_rate cannot be negative")
+        sys.exit(1)
+    run_fleet(args)
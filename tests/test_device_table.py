@@ -0,0 +1,36 @@
+# tests/test_device_table.py
+# Agregat bergulir DeviceTable pada awal jam (now < window_s): bucket yang belum pernah ditulis tidak boleh ikut min/max.
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'common'))
+
+from device_table import DeviceTable
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def _record_series(values, start=1.0, step=1.0):
+    clock = FakeClock(start)
+    table = DeviceTable(window_s=60, buckets=6, clock=clock)
+    for value in values:
+        table.record_reading("sensor_1", "temperature", value)
+        clock.now += step
+    return table
+
+def test_empty_buckets_are_not_folded_into_min_max():
+    table = _record_series([10.0, 20.0, 5.0])
+    count, low, high, mean = table.device_aggregate("sensor_1", "temperature")
+    assert (count, low, high) == (3, 5.0, 20.0)
+    assert mean == pytest.approx(35.0 / 3)
+
+def test_all_negative_series_keeps_negative_max():
+    table = _record_series([-3.0, -1.0, -7.0], step=15.0) # Tersebar di beberapa bucket
+    count, low, high, _ = table.fleet_aggregate("temperature")
+    assert (count, low, high) == (3, -7.0, -1.0)
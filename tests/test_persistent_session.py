@@ -0,0 +1,120 @@
+# tests/test_persistent_session.py
+# Sesi persisten MQTTv5 terhadap broker sungguhan: subscription dan pesan QoS 1 yang dikirim saat client
+# offline harus tetap ada setelah reconnect dengan client_id sama, clean_start=False dan SessionExpiryInterval.
+# Broker: mosquitto lokal yang dijalankan test ini (bila binary `mosquitto` ada), atau MQTT_TEST_BROKER=host:port.
+# Test dilewati bila keduanya tidak tersedia.
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'common'))
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from mqtt_utils import disconnect_client
+
+SESSION_EXPIRY_S = 60
+WAIT_S = 5
+
+def _port_open(host, port):
+    try:
+        with socket.create_connection((host, port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture(scope="module")
+def broker(tmp_path_factory):
+    """(host, port) broker MQTT tanpa autentikasi."""
+    mosquitto = shutil.which("mosquitto")
+    if mosquitto:
+        port = _free_port()
+        conf = tmp_path_factory.mktemp("mosquitto") / "mosquitto.conf"
+        conf.write_text(f"listener {port} 127.0.0.1\nallow_anonymous true\npersistence false\n")
+        process = subprocess.Popen([mosquitto, "-c", str(conf)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + WAIT_S
+        while not _port_open("127.0.0.1", port):
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                pytest.skip("mosquitto did not start")
+            time.sleep(0.05)
+        yield "127.0.0.1", port
+        process.terminate()
+        process.wait(timeout=WAIT_S)
+        return
+
+    address = os.environ.get("MQTT_TEST_BROKER")
+    if not address:
+        pytest.skip("no mosquitto binary and MQTT_TEST_BROKER not set")
+    host, _, port = address.rpartition(":")
+    if not _port_open(host, int(port)):
+        pytest.skip(f"broker {address} not reachable")
+    yield host, int(port)
+
+def _connect(broker, client_id, clean_start, session_expiry):
+    """Client MQTTv5 yang sudah connect (loop_start); userdata menyimpan CONNACK dan pesan yang diterima."""
+    userdata = {'connected': threading.Event(), 'session_present': None, 'subscribed': threading.Event(),
+                'messages': [], 'received': threading.Event()}
+
+    def on_connect(client, data, flags, reason_code, properties):
+        data['session_present'] = flags.session_present
+        data['connected'].set()
+
+    def on_subscribe(client, data, mid, reason_codes, properties):
+        data['subscribed'].set()
+
+    def on_message(client, data, msg):
+        data['messages'].append((msg.topic, msg.payload, msg.qos))
+        data['received'].set()
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, protocol=mqtt.MQTTv5, userdata=userdata)
+    client.on_connect = on_connect
+    client.on_subscribe = on_subscribe
+    client.on_message = on_message
+    props = Properties(PacketTypes.CONNECT)
+    if session_expiry:
+        props.SessionExpiryInterval = session_expiry
+    client.connect(*broker, clean_start=clean_start, properties=props)
+    client.loop_start()
+    assert userdata['connected'].wait(WAIT_S), "no CONNACK"
+    return client, userdata
+
+def test_offline_qos1_message_is_replayed_into_persistent_session(broker):
+    client_id = f"grupm_test_session_{uuid.uuid4().hex[:8]}"
+    topic = f"grupm/test/session/{client_id}"
+
+    # Sesi baru yang disimpan broker selama SESSION_EXPIRY_S setelah koneksi putus
+    client, userdata = _connect(broker, client_id, clean_start=True, session_expiry=SESSION_EXPIRY_S)
+    assert userdata['session_present'] is False
+    result, mid = client.subscribe(topic, qos=1)
+    assert result == mqtt.MQTT_ERR_SUCCESS
+    assert userdata['subscribed'].wait(WAIT_S), "no SUBACK"
+    disconnect_client(client) # SessionExpiryInterval dari CONNECT tetap berlaku
+
+    publisher, _ = _connect(broker, f"{client_id}_pub", clean_start=True, session_expiry=0)
+    publisher.publish(topic, b"while offline", qos=1).wait_for_publish(WAIT_S)
+    publisher.disconnect()
+    publisher.loop_stop()
+
+    client, userdata = _connect(broker, client_id, clean_start=False, session_expiry=SESSION_EXPIRY_S)
+    try:
+        assert userdata['session_present'] is True
+        assert userdata['received'].wait(WAIT_S), "QoS 1 message sent while offline was not replayed"
+        assert userdata['messages'][0] == (topic, b"while offline", 1)
+    finally:
+        disconnect_client(client, session_expiry_interval=0) # Akhiri sesi di broker